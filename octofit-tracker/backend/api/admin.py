@@ -1,5 +1,25 @@
+from django.conf import settings
 from django.contrib import admin
+from django.db.models import Case, IntegerField, When
 from .models import User, Team, Activity, Leaderboard, Workout
+from .pagination import EstimatedCountPaginator
+from .search import index_for
+
+
+class IndexedSearchMixin:
+    """Answer changelist searches from the inverted index instead of icontains scans."""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        hits = index_for(self.model).search(search_term, settings.OCTOFIT_SEARCH['max_results'])
+        ids = [doc_id for doc_id, _ in hits]
+        if not ids:
+            return queryset.none(), False
+        # Unless a column is sorted on, the changelist keeps this order: best match first.
+        rank = Case(*(When(id=doc_id, then=position) for position, doc_id in enumerate(ids)),
+                    output_field=IntegerField())
+        return queryset.filter(id__in=ids).annotate(search_rank=rank).order_by('search_rank'), False
 
 
 @admin.register(User)
@@ -16,10 +36,12 @@ class TeamAdmin(admin.ModelAdmin):
 
 
 @admin.register(Activity)
-class ActivityAdmin(admin.ModelAdmin):
-    list_display = ('user_id', 'activity_type', 'duration', 'calories', 'date')
+class ActivityAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('user_name', 'activity_type', 'duration', 'calories', 'date')
     list_filter = ('activity_type', 'date')
     search_fields = ('notes',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Leaderboard)
@@ -29,7 +51,7 @@ class LeaderboardAdmin(admin.ModelAdmin):
 
 
 @admin.register(Workout)
-class WorkoutAdmin(admin.ModelAdmin):
+class WorkoutAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('title', 'difficulty', 'duration', 'activity_type', 'calories_estimate')
     list_filter = ('difficulty', 'activity_type')
     search_fields = ('title', 'description')
@@ -0,0 +1,78 @@
+"""Awaitable Mongo reads for the ASGI deployment.
+
+Under ASGI, Django runs every sync view on one shared thread, so slow
+reads queue up behind each other. The async views await their reads
+instead: each pymongo call runs on a pool of
+``OCTOFIT_ASYNC_READ_THREADS`` threads while the event loop keeps serving
+other requests. Motor 2.x does the same internally, but it does not run on
+Python 3.11, and motor 3 needs the pymongo 4 that djongo cannot use.
+
+The pool shares one thread-safe pymongo client built from the djongo
+connection's settings. Going through djongo would give every pool
+thread a connection, and a client, of its own.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from pymongo import ASCENDING
+
+from .mongo import MongoRepository, connect, to_python
+
+_executor = None
+_database = None
+_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.OCTOFIT_ASYNC_READ_THREADS, thread_name_prefix='octofit-async-read'
+            )
+    return _executor
+
+
+def get_shared_database(alias='default'):
+    """One pymongo Database for all async reads, configured like the djongo connection."""
+    global _database
+    with _lock:
+        if _database is None:
+            _database = connect(alias)
+    return _database
+
+
+async def read(func, *args, **kwargs):
+    """Await ``func(*args, **kwargs)`` run on the read pool."""
+    return await asyncio.get_running_loop().run_in_executor(executor(), partial(func, *args, **kwargs))
+
+
+class ModelReads(MongoRepository):
+    """Plain reads of one model's collection, returned like ORM rows."""
+
+    def __init__(self, model, db=None, ordering=None):
+        super().__init__(db)
+        self.model = model
+        self.ordering = ordering or [('id', ASCENDING)]
+
+    def get(self, pk):
+        document = self.collection.find_one({'id': pk})
+        return to_python(document) if document is not None else None
+
+    def find(self, skip=0, limit=None):
+        cursor = self.collection.find().sort(self.ordering)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [to_python(document) for document in cursor]
+
+    def count(self):
+        """The collection's size, and whether it is the metadata estimate."""
+        estimate = self.collection.estimated_document_count()
+        if estimate >= settings.OCTOFIT_ESTIMATED_COUNT_THRESHOLD:
+            return estimate, True
+        return self.collection.count_documents({}), False
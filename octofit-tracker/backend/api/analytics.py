@@ -0,0 +1,158 @@
+"""Distributions of activity metrics, computed over streamed column chunks.
+
+Activities matching a filter are read twice from Mongo in chunks of
+``chunk_size`` documents, each chunk turned into NumPy arrays of the
+metric columns and integer group codes. The first pass finds each group's
+count and range per metric; the second fills a fine fixed-width histogram
+per group and metric with ``np.add.at``. Quantiles are interpolated from
+the fine histogram's cumulative counts, so they are exact to within one
+fine bin (1/``FINE_BINS_PER_BIN`` of a reported bin), and memory depends
+only on the number of groups and bins, never on the number of activities.
+Groups times bins is capped at ``max_group_bins``: the first pass stops
+with :class:`TooManyGroups` as soon as a filter's groups would exceed it.
+"""
+from itertools import islice
+
+import numpy as np
+
+from .models import Activity
+from .mongo import get_database
+from .partitions import to_utc
+
+METRICS = ('duration', 'calories', 'distance')
+GROUP_FIELDS = {
+    'activity_type': ('activity_type',),
+    'team': ('team_id',),
+    'both': ('team_id', 'activity_type'),
+}
+QUANTILES = {'p50': 0.5, 'p90': 0.9}
+FINE_BINS_PER_BIN = 64
+
+
+class TooManyGroups(ValueError):
+    """The filter matches more groups than the histograms may hold."""
+
+
+def activity_filter(start=None, end=None, team_id=None, activity_type=None):
+    query = {}
+    if start or end:
+        query['date'] = {}
+        if start:
+            query['date']['$gte'] = to_utc(start)
+        if end:
+            query['date']['$lt'] = to_utc(end)
+    if team_id is not None:
+        query['team_id'] = team_id
+    if activity_type:
+        query['activity_type'] = activity_type
+    return query
+
+
+class Groups:
+    """Stable integer codes for group keys, assigned as keys are first seen."""
+
+    def __init__(self):
+        self.codes = {}
+
+    def encode(self, keys):
+        return np.fromiter((self.codes.setdefault(key, len(self.codes)) for key in keys), dtype=np.int64)
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def column_chunks(collection, query, group_by, chunk_size, groups):
+    """Yield ``(codes, {metric: float64 array})`` per chunk; missing values are NaN."""
+    fields = GROUP_FIELDS[group_by]
+    projection = dict.fromkeys(METRICS + fields, 1)
+    projection['_id'] = 0
+    cursor = collection.find(query, projection).batch_size(chunk_size)
+    while True:
+        docs = list(islice(cursor, chunk_size))
+        if not docs:
+            return
+        codes = groups.encode(tuple(doc.get(field) for field in fields) for doc in docs)
+        columns = {
+            metric: np.fromiter(
+                (np.nan if doc.get(metric) is None else doc[metric] for doc in docs),
+                dtype=np.float64, count=len(docs),
+            )
+            for metric in METRICS
+        }
+        yield codes, columns
+
+
+def _grow(array, size, fill):
+    if len(array) >= size:
+        return array
+    return np.concatenate([array, np.full(size - len(array), fill, dtype=array.dtype)])
+
+
+def distributions(query, group_by='both', bins=20, chunk_size=5000, max_group_bins=10000, db=None):
+    """Per-group count, range, p50/p90 and a ``bins``-bin histogram of each metric."""
+    max_groups = max_group_bins // bins
+    collection = (db if db is not None else get_database())[Activity._meta.db_table]
+    groups = Groups()
+    counts = {metric: np.zeros(0, dtype=np.int64) for metric in METRICS}
+    lows = {metric: np.zeros(0) for metric in METRICS}
+    highs = {metric: np.zeros(0) for metric in METRICS}
+    for codes, columns in column_chunks(collection, query, group_by, chunk_size, groups):
+        if len(groups) > max_groups:
+            raise TooManyGroups(f'More than {max_groups} groups for {bins} bins; narrow the filter or use fewer bins.')
+        for metric, values in columns.items():
+            counts[metric] = _grow(counts[metric], len(groups), 0)
+            lows[metric] = _grow(lows[metric], len(groups), np.inf)
+            highs[metric] = _grow(highs[metric], len(groups), -np.inf)
+            present = ~np.isnan(values)
+            np.add.at(counts[metric], codes[present], 1)
+            np.minimum.at(lows[metric], codes[present], values[present])
+            np.maximum.at(highs[metric], codes[present], values[present])
+
+    fine_bins = bins * FINE_BINS_PER_BIN
+    fine = {metric: np.zeros((len(groups), fine_bins), dtype=np.int64) for metric in METRICS}
+    with np.errstate(invalid='ignore'):
+        # Groups with no values for a metric keep an (inf, -inf) range and a NaN width.
+        widths = {metric: (highs[metric] - lows[metric]) / fine_bins for metric in METRICS}
+    # Second pass over the same filter: each group's range is now known.
+    # Groups first seen now were written after the first pass and are left out.
+    known = dict(groups.codes)
+    for codes, columns in column_chunks(collection, query, group_by, chunk_size, groups):
+        for metric, values in columns.items():
+            present = ~np.isnan(values) & (codes < len(known))
+            group_codes, values = codes[present], values[present]
+            width = widths[metric][group_codes]
+            offsets = np.divide(values - lows[metric][group_codes], width,
+                                out=np.zeros_like(values), where=width > 0)
+            bins_hit = np.clip(offsets.astype(np.int64), 0, fine_bins - 1)
+            np.add.at(fine[metric], (group_codes, bins_hit), 1)
+
+    results = []
+    for key, code in known.items():
+        row = dict(zip(GROUP_FIELDS[group_by], key))
+        row['count'] = int(max(counts[metric][code] for metric in METRICS))
+        row['metrics'] = {
+            metric: summarize(fine[metric][code], lows[metric][code], highs[metric][code], bins)
+            for metric in METRICS if counts[metric][code]
+        }
+        results.append(row)
+    results.sort(key=lambda row: -row['count'])
+    return results
+
+
+def summarize(fine_counts, low, high, bins):
+    """Quantiles and a coarse histogram from one group's fine histogram."""
+    total = int(fine_counts.sum())
+    cumulative = np.cumsum(fine_counts)
+    width = (high - low) / len(fine_counts)
+    summary = {'count': total, 'min': float(low), 'max': float(high)}
+    for name, q in QUANTILES.items():
+        target = q * total
+        index = int(np.searchsorted(cumulative, target))
+        before = cumulative[index - 1] if index else 0
+        fraction = (target - before) / fine_counts[index] if fine_counts[index] else 0
+        summary[name] = float(low + width * (index + fraction))
+    summary['histogram'] = {
+        'edges': np.linspace(low, high, bins + 1).tolist(),
+        'counts': fine_counts.reshape(bins, -1).sum(axis=1).tolist(),
+    }
+    return summary
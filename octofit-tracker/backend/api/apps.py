@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Periodic jobs are loaded by run_scheduler only (scheduler.load_jobs), keeping
+        # their leaderboard, retention and partition code off the serving path.
+        from . import querylog, signals  # noqa: F401
+        querylog.install()
@@ -0,0 +1,15 @@
+"""Routes for the async read views, mounted ahead of the router under ASGI only."""
+from django.urls import path
+
+from .async_views import ActivityReadView, LeaderboardReadView, UserReadView, WorkoutReadView
+
+urlpatterns = [
+    path('users/', UserReadView.as_view()),
+    path('users/<int:pk>/', UserReadView.as_view()),
+    path('activities/', ActivityReadView.as_view()),
+    path('activities/<int:pk>/', ActivityReadView.as_view()),
+    path('leaderboard/', LeaderboardReadView.as_view()),
+    path('leaderboard/<int:pk>/', LeaderboardReadView.as_view()),
+    path('workouts/', WorkoutReadView.as_view()),
+    path('workouts/<int:pk>/', WorkoutReadView.as_view()),
+]
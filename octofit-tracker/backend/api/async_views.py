@@ -0,0 +1,180 @@
+"""Async list and retrieve views for the ASGI deployment.
+
+``octofit_tracker.asgi`` resolves URLs through ``octofit_tracker.asgi_urls``,
+which mounts ``api.async_urls`` ahead of the DRF router. GET and HEAD on
+users, activities, leaderboard and workouts are answered here, awaiting
+their reads on the pool in :mod:`api.aio`, with the same query parameters,
+pagination, throttling and JSON as the viewsets. Any other method is
+handed to the viewset. The WSGI entry point never loads these views.
+"""
+import math
+
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.views import View
+from pymongo import DESCENDING
+from rest_framework.exceptions import APIException, NotFound, Throttled, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from . import views
+from .aio import ModelReads, get_shared_database, read
+from .models import User, Activity, Leaderboard, Workout
+from .pagination import EstimatedCountPagination
+from .repositories import ActivityRepository, UserRepository
+from .serializers import ActivitySerializer, LeaderboardSerializer, UserSerializer, WorkoutSerializer
+
+LIST_ACTIONS = {'get': 'list', 'post': 'create'}
+DETAIL_ACTIONS = {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'}
+
+
+def is_authenticated(request):
+    return bool(request.user and request.user.is_authenticated)
+
+
+def render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+class AsyncReadView(View):
+    """Reads awaited on the read pool; writes and other methods go to ``viewset``."""
+    model = None
+    ordering = None
+    serializer_class = None
+    viewset = None
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # As with DRF's views, session CSRF checks are left to the viewset.
+        view.csrf_exempt = True
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        return self.fallback(request, *args, **kwargs)
+
+    async def fallback(self, request, *args, **kwargs):
+        view = self.viewset.as_view(DETAIL_ACTIONS if 'pk' in kwargs else LIST_ACTIONS)
+        return await sync_to_async(view)(request, *args, **kwargs)
+
+    async def get(self, request, pk=None):
+        try:
+            await self.check_throttles(request)
+            if pk is not None:
+                return render(await self.retrieve(pk))
+            return render(await self.list(Request(request)))
+        except APIException as exc:
+            data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            response = render(data, exc.status_code)
+            if getattr(exc, 'wait', None):
+                response['Retry-After'] = '%d' % exc.wait
+            return response
+
+    async def check_throttles(self, request):
+        # Identifying the client may load the session, which is ORM work and
+        # stays on the thread-sensitive executor; it is done once, up front.
+        await sync_to_async(is_authenticated)(request)
+        waits = []
+        for throttle_class in api_settings.DEFAULT_THROTTLE_CLASSES:
+            throttle = throttle_class()
+            # The rest is cache calls and lock polling, which must not queue
+            # every request's check behind the single sync thread.
+            if not await sync_to_async(throttle.allow_request, thread_sensitive=False)(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            raise Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+    @property
+    def reads(self):
+        return ModelReads(self.model, get_shared_database(), self.ordering)
+
+    async def retrieve(self, pk):
+        document = await read(self.reads.get, pk)
+        if document is None:
+            raise NotFound()
+        return self.serializer_class(document).data
+
+    async def list(self, request):
+        return self.serializer_class(await read(self.reads.find), many=True).data
+
+
+class UserReadView(AsyncReadView):
+    model = User
+    serializer_class = UserSerializer
+    viewset = views.UserViewSet
+
+    async def list(self, request):
+        ids = request.query_params.get('ids')
+        if not ids:
+            return await super().list(request)
+        try:
+            user_ids = {int(user_id) for user_id in ids.split(',') if user_id}
+        except ValueError:
+            raise ValidationError({'ids': 'Must be a comma separated list of integers.'})
+        users = await read(UserRepository(get_shared_database()).get_many, user_ids)
+        return self.serializer_class(users, many=True).data
+
+
+class ActivityReadView(AsyncReadView):
+    model = Activity
+    serializer_class = ActivitySerializer
+    viewset = views.ActivityViewSet
+
+    async def list(self, request):
+        user_id = views.int_param(request, 'user_id')
+        start, end = views.date_param(request, 'start'), views.date_param(request, 'end')
+        if user_id is None and start is None and end is None:
+            return await self.paginated(request)
+        activities = await read(
+            ActivityRepository(get_shared_database()).find, {} if user_id is None else {'user_id': user_id},
+            limit=views.filtered_limit(request), start=start, end=end,
+        )
+        return self.serializer_class(activities, many=True).data
+
+    async def paginated(self, request):
+        """A page shaped like :class:`~api.pagination.EstimatedCountPagination`'s."""
+        paginator = EstimatedCountPagination()
+        page_size = paginator.get_page_size(request)
+        reads = self.reads
+        count, estimated = await read(reads.count)
+        pages = max(1, math.ceil(count / page_size))
+        number = request.query_params.get(paginator.page_query_param, 1)
+        try:
+            number = pages if number in paginator.last_page_strings else int(number)
+        except ValueError:
+            number = 0
+        if not 1 <= number <= pages:
+            raise NotFound(paginator.invalid_page_message)
+
+        activities = await read(reads.find, skip=(number - 1) * page_size, limit=page_size)
+        url = request.build_absolute_uri()
+        if number == 1:
+            previous = None
+        elif number == 2:
+            previous = remove_query_param(url, paginator.page_query_param)
+        else:
+            previous = replace_query_param(url, paginator.page_query_param, number - 1)
+        return {
+            'count': count,
+            'next': replace_query_param(url, paginator.page_query_param, number + 1) if number < pages else None,
+            'previous': previous,
+            'results': self.serializer_class(activities, many=True).data,
+            'count_is_estimated': estimated,
+        }
+
+
+class LeaderboardReadView(AsyncReadView):
+    model = Leaderboard
+    ordering = [('total_points', DESCENDING)]
+    serializer_class = LeaderboardSerializer
+    viewset = views.LeaderboardViewSet
+
+
+class WorkoutReadView(AsyncReadView):
+    model = Workout
+    serializer_class = WorkoutSerializer
+    viewset = views.WorkoutViewSet
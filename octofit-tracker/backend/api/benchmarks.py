@@ -0,0 +1,252 @@
+"""In-process micro-benchmarks for the serializers and viewset actions.
+
+Everything runs against a generated dataset held in memory; the configured
+database is never touched. Serializers get unsaved model instances and
+their own serialized output as write payloads. ORM-backed viewset actions
+get the same instances in place of their queryset, and actions that read
+through the native repositories get a mongomock database seeded with the
+same rows. Throttling is off so only the view itself is measured.
+
+Timings are the best of ``repeat`` runs. Allocations come from one more
+run under ``tracemalloc``, which slows code down too much to time: the
+peak traced bytes per row, and the blocks per row still allocated after
+the run while its result is held.
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import partial
+from random import Random
+from unittest import mock
+
+from rest_framework.test import APIRequestFactory
+from rest_framework.validators import UniqueTogetherValidator, UniqueValidator
+
+from . import views
+from .models import User, Team, Activity, Leaderboard, Workout
+from .partitions import to_utc
+from .serializers import (
+    UserSerializer, TeamSerializer, ActivitySerializer, LeaderboardSerializer, WorkoutSerializer
+)
+
+RESOURCES = {
+    'users': (User, UserSerializer),
+    'teams': (Team, TeamSerializer),
+    'activities': (Activity, ActivitySerializer),
+    'leaderboard': (Leaderboard, LeaderboardSerializer),
+    'workouts': (Workout, WorkoutSerializer),
+}
+ACTIVITY_TYPES = ('running', 'cycling', 'swimming', 'strength', 'yoga')
+DIFFICULTIES = ('beginner', 'intermediate', 'advanced')
+MAX_RETRIEVES = 1000
+
+
+def dataset(size, seed=0):
+    """``size`` activities with a user per 10, a team per 100 and matching rows, as field dicts."""
+    rng = Random(seed)
+    epoch = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+    team_count, user_count = max(1, size // 100), max(1, size // 10)
+    teams = [
+        {'id': i, 'name': f'Team {i}', 'description': f'Benchmark team {i}', 'created_at': epoch, 'updated_at': epoch}
+        for i in range(1, team_count + 1)
+    ]
+    users = [
+        {'id': i, 'name': f'User {i}', 'email': f'user{i}@example.com', 'team_id': rng.randint(1, team_count),
+         'role': 'member', 'created_at': epoch, 'updated_at': epoch}
+        for i in range(1, user_count + 1)
+    ]
+    activities = []
+    for i in range(1, size + 1):
+        user = rng.choice(users)
+        activities.append({
+            'id': i, 'user_id': user['id'], 'user_name': user['name'], 'team_id': user['team_id'],
+            'activity_type': rng.choice(ACTIVITY_TYPES), 'duration': rng.randint(10, 120),
+            'calories': rng.randint(50, 1200), 'distance': round(rng.uniform(0, 40), 2),
+            'date': epoch + timedelta(minutes=rng.randint(0, 365 * 24 * 60)),
+            'notes': 'Benchmark activity', 'updated_at': epoch,
+        })
+    leaderboard = [
+        {'id': team['id'], 'team_id': team['id'], 'team_name': team['name'],
+         'total_points': rng.randint(0, 100000), 'total_activities': rng.randint(0, 1000),
+         'rank': 0, 'updated_at': epoch}
+        for team in teams
+    ]
+    workouts = [
+        {'id': i, 'title': f'Workout {i}', 'description': 'Benchmark workout',
+         'difficulty': rng.choice(DIFFICULTIES), 'duration': rng.randint(10, 90),
+         'activity_type': rng.choice(ACTIVITY_TYPES), 'calories_estimate': rng.randint(50, 900),
+         'instructions': 'Warm up, work, cool down.', 'updated_at': epoch}
+        for i in range(1, user_count + 1)
+    ]
+    return {
+        'users': users, 'teams': teams, 'activities': activities, 'leaderboard': leaderboard, 'workouts': workouts,
+    }
+
+
+def measure(name, kind, func, count, repeat):
+    """Time ``func`` after one warm-up call, whose result ``count`` turns into a row count."""
+    rows = count(func())
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        result = func()
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+    retained = sys.getallocatedblocks() - blocks
+    del result
+
+    best = min(timings)
+    return {
+        'name': name,
+        'kind': kind,
+        'rows': rows,
+        'best_seconds': best,
+        'mean_seconds': sum(timings) / len(timings),
+        'rows_per_second': rows / best if best else None,
+        'peak_bytes_per_row': peak / rows if rows else None,
+        'retained_blocks_per_row': retained / rows if rows else None,
+    }
+
+
+def serialize(serializer_class, instances):
+    return serializer_class(instances, many=True).data
+
+
+def validate(serializer_class, payloads):
+    """Validate ``payloads`` as one bulk write, minus the uniqueness checks that query the database."""
+    serializer = serializer_class(data=payloads, many=True)
+    child = serializer.child
+    for field in child.fields.values():
+        field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+    child.validators = [v for v in child.validators if not isinstance(v, UniqueTogetherValidator)]
+    if not serializer.is_valid():
+        raise ValueError(f'{serializer_class.__name__} rejected its own output: {serializer.errors[:1]}')
+    return serializer.validated_data
+
+
+def serializer_benchmarks(data):
+    """``(name, kind, func, count)`` for serializing and validating each resource."""
+    for resource, (model, serializer_class) in RESOURCES.items():
+        instances = [model(**row) for row in data[resource]]
+        payloads = serialize(serializer_class, instances)
+        name = serializer_class.__name__
+        yield f'{name}.to_representation', 'serialize', partial(serialize, serializer_class, instances), len
+        yield f'{name}.is_valid', 'validate', partial(validate, serializer_class, payloads), len
+
+
+def in_memory_view(viewset, actions, instances):
+    """``viewset`` bound to ``actions`` with its queryset replaced by ``instances``."""
+    by_id = {instance.id: instance for instance in instances}
+    bench_class = type(f'Benchmark{viewset.__name__}', (viewset,), {
+        'throttle_classes': [],
+        'get_queryset': lambda self: instances,
+        'get_object': lambda self: by_id[int(self.kwargs['pk'])],
+    })
+    return bench_class.as_view(actions)
+
+
+def repository_view(viewset, actions):
+    return type(f'Benchmark{viewset.__name__}', (viewset,), {'throttle_classes': []}).as_view(actions)
+
+
+def response_rows(response):
+    data = response.data
+    if isinstance(data, list):
+        return len(data)
+    if 'results' in data:
+        return len(data['results'])
+    if all(isinstance(value, list) for value in data.values()):
+        return sum(len(value) for value in data.values())
+    return 1
+
+
+def call(view, request, **kwargs):
+    response = view(request, **kwargs)
+    if response.status_code != 200:
+        raise ValueError(f'{request.get_full_path()} answered {response.status_code}: {response.data}')
+    return response.render()
+
+
+def call_each(view, requests):
+    return [call(view, request, pk=pk) for request, pk in requests]
+
+
+def view_benchmarks(data):
+    """List and retrieve for each ORM-backed viewset, over in-memory instances."""
+    factory = APIRequestFactory(HTTP_HOST='localhost')
+    cases = [
+        ('users', views.UserViewSet, {}),
+        ('teams', views.TeamViewSet, {}),
+        ('activities', views.ActivityViewSet, {'page_size': 500}),
+        ('leaderboard', views.LeaderboardViewSet, {}),
+        ('workouts', views.WorkoutViewSet, {}),
+    ]
+    for resource, viewset, params in cases:
+        model = RESOURCES[resource][0]
+        instances = [model(**row) for row in data[resource]]
+        name = viewset.__name__
+        view = in_memory_view(viewset, {'get': 'list'}, instances)
+        yield f'{name}.list', 'view', partial(call, view, factory.get(f'/api/{resource}/', params)), response_rows
+
+        view = in_memory_view(viewset, {'get': 'retrieve'}, instances)
+        requests = [(factory.get(f'/api/{resource}/{row.id}/'), row.id) for row in instances[:MAX_RETRIEVES]]
+        yield f'{name}.retrieve', 'view', partial(call_each, view, requests), len
+
+
+def repository_view_benchmarks(data):
+    """Actions that read through the native repositories; run with Mongo pointed at mongomock."""
+    factory = APIRequestFactory(HTTP_HOST='localhost')
+    user_ids = ','.join(str(row['id']) for row in data['users'][:100])
+    busiest = Counter(row['user_id'] for row in data['activities']).most_common(1)[0][0]
+    cases = [
+        ('UserViewSet.list?ids', views.UserViewSet, '/api/users/', {'ids': user_ids}),
+        ('ActivityViewSet.list?user_id', views.ActivityViewSet, '/api/activities/', {'user_id': busiest}),
+        ('DashboardViewSet.list', views.DashboardViewSet, '/api/dashboard/', {'activities': 50}),
+    ]
+    for name, viewset, path, params in cases:
+        view = repository_view(viewset, {'get': 'list'})
+        yield name, 'view', partial(call, view, factory.get(path, params)), response_rows
+
+
+def seed_mongo(data):
+    """A mongomock database holding ``data`` the way djongo stores it, or ``None`` without mongomock."""
+    try:
+        import mongomock
+    except ImportError:
+        return None
+    db = mongomock.MongoClient().octofit_db
+    for resource, rows in data.items():
+        db[RESOURCES[resource][0]._meta.db_table].insert_many([
+            {key: to_utc(value) if isinstance(value, datetime) else value for key, value in row.items()}
+            for row in rows
+        ])
+    return db
+
+
+def run(size=1000, repeat=5, seed=0, only=None):
+    """Measure every benchmark whose name contains ``only``; returns ``(results, skipped)``."""
+    data = dataset(size, seed)
+    specs = list(serializer_benchmarks(data)) + list(view_benchmarks(data))
+    mongo_db = seed_mongo(data)
+    skipped = []
+    if mongo_db is None:
+        skipped.append('repository-backed view actions: mongomock is not installed')
+    else:
+        specs += repository_view_benchmarks(data)
+    specs = [spec for spec in specs if not only or only in spec[0]]
+    # Native Mongo reads go to the seeded stand-in, never to the configured database.
+    with mock.patch('api.mongo.connections') as connections:
+        connections.__getitem__.return_value.connection = mongo_db
+        return [measure(*spec, repeat) for spec in specs], skipped
@@ -0,0 +1,103 @@
+"""Django cache backend on a MongoDB collection, shared by every worker.
+
+Throttle buckets, coalescing locks and cached aggregates have to be seen by
+every process serving the API, and MongoDB is the one store they all
+reach. Each entry is one document ``{_id: key, value, expires}``; integers
+are stored as they are so ``incr`` is a single atomic ``$inc``, anything
+else is pickled. ``add`` relies on the unique ``_id``. A TTL index on
+``expires`` (migration 0009) reaps expired entries, and reads ignore
+entries that have expired but were not reaped yet.
+
+Configured in ``CACHES`` with the collection name as ``LOCATION``.
+"""
+import pickle
+from datetime import datetime, timezone
+
+from bson.binary import Binary
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from .mongo import get_database
+
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class MongoCache(BaseCache):
+    """Cache entries in the collection named by ``LOCATION``."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.collection_name = location or 'django_cache'
+
+    @property
+    def collection(self):
+        return get_database()[self.collection_name]
+
+    def live(self, key):
+        """Query matching ``key`` unless it has expired."""
+        return {'_id': key, '$or': [{'expires': None}, {'expires': {'$gt': utc_now()}}]}
+
+    def expires(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else datetime.fromtimestamp(timeout, timezone.utc).replace(tzinfo=None)
+
+    @staticmethod
+    def encode(value):
+        if type(value) is int:
+            return value
+        return Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def decode(value):
+        return pickle.loads(value) if isinstance(value, bytes) else value
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        document = self.collection.find_one(self.live(key), {'value': 1})
+        return default if document is None else self.decode(document['value'])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self.collection.replace_one(
+            {'_id': key}, {'value': self.encode(value), 'expires': self.expires(timeout)}, upsert=True
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        entry = {'value': self.encode(value), 'expires': self.expires(timeout)}
+        # An expired entry still in the collection is taken over, by one caller only.
+        if self.collection.replace_one({'_id': key, 'expires': {'$lte': utc_now()}}, entry).matched_count:
+            return True
+        try:
+            self.collection.insert_one({'_id': key, **entry})
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        result = self.collection.update_one(self.live(key), {'$set': {'expires': self.expires(timeout)}})
+        return bool(result.matched_count)
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        document = self.collection.find_one_and_update(
+            self.live(key), {'$inc': {'value': delta}}, return_document=ReturnDocument.AFTER
+        )
+        if document is None:
+            raise ValueError("Key '%s' not found" % key)
+        return document['value']
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self.collection.delete_one({'_id': key}).deleted_count)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self.collection.count_documents(self.live(key), limit=1) > 0
+
+    def clear(self):
+        self.collection.delete_many({})
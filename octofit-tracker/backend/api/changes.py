@@ -0,0 +1,107 @@
+"""Change log behind the ``/api/changes/`` sync feed.
+
+Every insert, update and delete of an ``api`` model appends an entry with
+a sequence number taken from one atomic counter, so entries are totally
+ordered. Deletes leave tombstones. A client keeps the last sequence it has
+seen as an opaque sync token and asks only for entries after it; repeated
+changes to one object within a page collapse into the latest. Entries
+older than ``OCTOFIT_CHANGE_RETENTION_DAYS`` are pruned, and a token that
+predates the retained log must resync from the full collections.
+"""
+from datetime import timedelta
+
+from django.utils import timezone
+from pymongo import ASCENDING, ReturnDocument
+
+from .models import User, Team, Activity, Leaderboard, Workout
+from .mongo import MongoRepository
+from .partitions import to_utc
+
+TRACKED_MODELS = {model._meta.db_table: model for model in (User, Team, Activity, Leaderboard, Workout)}
+UPSERT, DELETE = 'upsert', 'delete'
+
+
+class TokenExpired(Exception):
+    """The sync token is older than the retained change log."""
+
+
+class ChangeLogRepository(MongoRepository):
+    """Change entries by ``seq``; its indexes are created by migration 0010."""
+    collection_name = 'changes'
+
+    @property
+    def sequence(self):
+        return self.db['change_sequence']
+
+    def ensure_indexes(self):
+        self.collection.create_index('seq', unique=True)
+        self.collection.create_index([('model', ASCENDING), ('seq', ASCENDING)])
+
+    def allocate(self, count):
+        """Reserve ``count`` consecutive sequence numbers; returns the first."""
+        counter = self.sequence.find_one_and_update(
+            {'_id': 'changes'}, {'$inc': {'seq': count}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        return counter['seq'] - count + 1
+
+    def current(self):
+        counter = self.sequence.find_one({'_id': 'changes'})
+        return counter['seq'] if counter else 0
+
+    def record(self, model, object_ids, op=UPSERT):
+        """Append one entry per id with a single counter update and insert."""
+        object_ids = list(object_ids)
+        if not object_ids:
+            return
+        first = self.allocate(len(object_ids))
+        now = to_utc(timezone.now())
+        self.collection.insert_many([
+            {'seq': first + offset, 'model': model._meta.db_table, 'object_id': object_id, 'op': op, 'at': now}
+            for offset, object_id in enumerate(object_ids)
+        ], ordered=False)
+
+    def since(self, seq, models=None, limit=500, settle_seconds=0):
+        """Entries after ``seq``, oldest first, plus whether more remain.
+
+        The page stops at the first entry younger than ``settle_seconds``:
+        a writer that took an earlier sequence number may not have inserted
+        its entry yet, and a token past the gap would skip it for good.
+        """
+        if seq < self.pruned_through():
+            raise TokenExpired()
+        query = {'seq': {'$gt': seq}}
+        if models:
+            query['model'] = {'$in': list(models)}
+        entries = list(self.collection.find(query, {'_id': 0}).sort('seq', ASCENDING).limit(limit + 1))
+        settled = to_utc(timezone.now() - timedelta(seconds=settle_seconds))
+        for index, entry in enumerate(entries):
+            if entry['at'] > settled:
+                return entries[:index], True
+        return entries[:limit], len(entries) > limit
+
+    def pruned_through(self):
+        counter = self.sequence.find_one({'_id': 'changes'}) or {}
+        return counter.get('pruned_through', 0)
+
+    def prune(self, days):
+        """Drop entries older than ``days``, remembering the newest sequence dropped."""
+        cutoff = to_utc(timezone.now() - timedelta(days=days))
+        newest = self.collection.find_one({'at': {'$lt': cutoff}}, {'seq': 1}, sort=[('seq', -1)])
+        if newest is None:
+            return 0
+        self.sequence.update_one({'_id': 'changes'}, {'$max': {'pruned_through': newest['seq']}})
+        return self.collection.delete_many({'seq': {'$lte': newest['seq']}}).deleted_count
+
+    def expire_all(self):
+        """Invalidate every outstanding token, e.g. after the collections were replaced."""
+        self.sequence.update_one({'_id': 'changes'}, {'$max': {'pruned_through': self.current()}}, upsert=True)
+        self.collection.delete_many({})
+
+
+def collapse(entries):
+    """Keep only the latest entry per object, in sequence order."""
+    latest = {}
+    for entry in entries:
+        latest[entry['model'], entry['object_id']] = entry
+    return sorted(latest.values(), key=lambda entry: entry['seq'])
@@ -0,0 +1,118 @@
+"""Single-flight coalescing of expensive reads, with stale-while-revalidate.
+
+Results are cached for ``fresh_seconds`` and may then be served stale for
+another ``stale_seconds`` while one caller recomputes them. When nothing
+is cached, concurrent callers in one process wait on the first caller's
+computation. Across processes, a lock taken with ``cache.add`` in the
+shared cache (``CACHES``, see :mod:`api.cache`) elects one computing
+process and the others poll the cache for its result.
+
+Only successful results are shared. When a computation fails, or its
+response is not a 200, the callers waiting on it compute for themselves
+and each get their own result or error.
+"""
+import hashlib
+import time
+from concurrent.futures import Future, TimeoutError as WaitTimeout
+from functools import wraps
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+_inflight = {}
+_inflight_lock = Lock()
+# Handed to waiting callers when the computation they waited on failed.
+_FAILED = object()
+
+
+class Uncacheable(Exception):
+    """Raised by a computation whose result must not be shared."""
+
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+
+
+def _refresh(key, compute, options):
+    """Compute and publish a fresh value; the caller holds ``key``'s lock."""
+    try:
+        value = compute()
+        entry = {'value': value, 'fresh_until': time.time() + options['fresh_seconds']}
+        cache.set(key, entry, options['fresh_seconds'] + options['stale_seconds'])
+        return value
+    finally:
+        cache.delete(f'{key}:lock')
+
+
+def _lock(key, options):
+    return cache.add(f'{key}:lock', 1, options['lock_seconds'])
+
+
+def _lead(key, compute, options):
+    if _lock(key, options):
+        return _refresh(key, compute, options)
+    deadline = time.time() + options['wait_seconds']
+    while time.time() < deadline:
+        time.sleep(options['poll_seconds'])
+        entry = cache.get(key)
+        if entry is not None:
+            return entry['value']
+        # The other process released the lock without a result: it failed.
+        if _lock(key, options):
+            return _refresh(key, compute, options)
+    # The other process is slow or gone; stop waiting on it.
+    return compute()
+
+
+def single_flight(name, compute):
+    """Return ``compute()`` for ``name``, sharing one computation among concurrent callers."""
+    options = settings.OCTOFIT_COALESCING
+    key = 'coalesce:' + hashlib.md5(name.encode()).hexdigest()
+    entry = cache.get(key)
+    if entry is not None:
+        if time.time() < entry['fresh_until'] or not _lock(key, options):
+            return entry['value']
+        return _refresh(key, compute, options)
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        try:
+            value = future.result(timeout=options['wait_seconds'] + options['lock_seconds'])
+        except WaitTimeout:
+            # The leader is too slow: serve whatever it last published, else compute here.
+            entry = cache.get(key)
+            return entry['value'] if entry is not None else compute()
+        return compute() if value is _FAILED else value
+    try:
+        value = _lead(key, compute, options)
+        future.set_result(value)
+        return value
+    except BaseException:
+        future.set_result(_FAILED)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def coalesced(view_method):
+    """Share a read action's response data among identical concurrent requests."""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        def compute():
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code != 200:
+                raise Uncacheable(response)
+            return response.data
+
+        try:
+            return Response(single_flight(request.get_full_path(), compute))
+        except Uncacheable as exc:
+            return exc.result
+    return wrapper
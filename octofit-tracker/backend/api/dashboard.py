@@ -0,0 +1,54 @@
+"""One-request dashboard: users, teams, leaderboard and the latest activities.
+
+Each section is one pymongo read, and the reads run concurrently on a
+shared thread pool. The Database is resolved once on the request thread
+and handed to the workers, since a Django connection is per thread and
+opening one in each worker would cost a new client. Team names for users
+and activities are resolved together afterwards: from the teams section
+when it was requested, otherwise with a single ``$in`` over every team id
+the other sections mention.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .mongo import get_database
+from .repositories import ActivityRepository, LeaderboardRepository, TeamRepository, UserRepository
+
+SECTIONS = ('users', 'teams', 'leaderboard', 'activities')
+MAX_WORKERS = 8
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='octofit-dashboard')
+    return _executor
+
+
+def load_dashboard(sections=SECTIONS, activity_limit=10, leaderboard_limit=10, db=None):
+    """Raw documents per requested section, plus ``team_names`` for the users and activities."""
+    db = db if db is not None else get_database()
+    queries = {
+        'users': lambda: UserRepository(db).all(),
+        'teams': lambda: TeamRepository(db).all(),
+        'leaderboard': lambda: LeaderboardRepository(db).top(leaderboard_limit),
+        'activities': lambda: ActivityRepository(db).find(limit=activity_limit),
+    }
+    pool = executor()
+    futures = {section: pool.submit(queries[section]) for section in sections}
+    results = {section: future.result() for section, future in futures.items()}
+
+    if 'teams' in results:
+        names = {team['id']: team['name'] for team in results['teams']}
+    else:
+        team_ids = {
+            doc['team_id'] for section in ('users', 'activities')
+            for doc in results.get(section, ()) if doc.get('team_id') is not None
+        }
+        names = TeamRepository(db).names(team_ids) if team_ids else {}
+    results['team_names'] = names
+    return results
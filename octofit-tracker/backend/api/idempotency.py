@@ -0,0 +1,110 @@
+"""Idempotent activity ingestion.
+
+Wearables resend a workout whenever a request times out. Every activity
+carries the hash of the fields that identify a workout
+(:func:`api.models.activity_content_hash`) under a unique index, and a
+client may also name each submission with an idempotency key. A
+submission whose key or content hash is already known is answered with
+the stored activity instead of being inserted again. A whole submission,
+single or bulk, is resolved with one ``$in`` query on the keys and one on
+the hashes, both indexed, and duplicates within it collapse onto the first.
+
+A key is remembered with the hash it was first used for, for
+``OCTOFIT_IDEMPOTENCY['key_days']``; reusing it for a different workout is
+an error rather than a replay.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from pymongo import ReplaceOne
+
+from .models import CONTENT_FIELDS, Activity, activity_content_hash
+from .mongo import MongoRepository
+from .partitions import to_utc
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+
+class KeyReused(Exception):
+    """An idempotency key was sent again with a different workout."""
+
+    def __init__(self, key):
+        super().__init__(key)
+        self.key = key
+
+
+class IdempotencyKeyRepository(MongoRepository):
+    """``{_id: key, content_hash, at}``; the key is the document id, so lookups hit ``_id``."""
+    collection_name = 'idempotency_keys'
+
+    def cutoff(self):
+        return to_utc(timezone.now() - timedelta(days=settings.OCTOFIT_IDEMPOTENCY['key_days']))
+
+    def get_many(self, keys):
+        """``{key: content_hash}`` for the unexpired keys among ``keys``."""
+        if not keys:
+            return {}
+        cursor = self.collection.find({'_id': {'$in': list(keys)}, 'at': {'$gte': self.cutoff()}})
+        return {doc['_id']: doc['content_hash'] for doc in cursor}
+
+    def remember(self, hashes):
+        """Store ``{key: content_hash}``, replacing expired entries for the same keys."""
+        if not hashes:
+            return
+        now = to_utc(timezone.now())
+        self.collection.bulk_write([
+            ReplaceOne({'_id': key}, {'content_hash': digest, 'at': now}, upsert=True)
+            for key, digest in hashes.items()
+        ], ordered=False)
+
+    def prune(self):
+        return self.collection.delete_many({'at': {'$lt': self.cutoff()}}).deleted_count
+
+
+def content_hash(data):
+    return activity_content_hash(**{name: data.get(name) for name in CONTENT_FIELDS})
+
+
+def create(data, digest):
+    """Insert one activity; ``(activity, False)`` if a concurrent submission stored it first."""
+    try:
+        with transaction.atomic():
+            return Activity.objects.create(**data), True
+    except DatabaseError:
+        stored = Activity.objects.filter(content_hash=digest).first()
+        if stored is None:
+            raise
+        return stored, False
+
+
+def ingest(submissions, db=None):
+    """Store the new workouts among ``submissions``, ``(validated_data, key or None)`` pairs.
+
+    Returns ``(activity, created)`` per submission, in order; a duplicate
+    gets the activity already stored and ``created`` False. Raises
+    :class:`KeyReused` before writing anything if a key does not match.
+    """
+    hashes = [content_hash(data) for data, key in submissions]
+    keys = IdempotencyKeyRepository(db)
+    known = keys.get_many({key for data, key in submissions if key})
+    fresh = {}
+    for (data, key), digest in zip(submissions, hashes):
+        if key and (known.get(key) or fresh.setdefault(key, digest)) != digest:
+            raise KeyReused(key)
+
+    stored = {
+        activity.content_hash: activity for activity in Activity.objects.filter(content_hash__in=set(hashes))
+    }
+    results = []
+    for (data, key), digest in zip(submissions, hashes):
+        if digest in stored:
+            results.append((stored[digest], False))
+        else:
+            activity, created = create(data, digest)
+            results.append((activity, created))
+            stored[digest] = activity
+    keys.remember({key: digest for key, digest in fresh.items() if key not in known})
+    return results
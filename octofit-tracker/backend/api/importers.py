@@ -0,0 +1,228 @@
+"""Bulk user import from CSV or NDJSON, upserting by email in batches.
+
+Each batch costs one query for the existing users, one for the teams it
+names, one ``bulk_create`` for new users and one ``bulk_write`` for
+changed ones. Bulk writes skip model signals, so the import adjusts the
+team member counters itself and schedules propagation for renamed or
+moved users.
+
+Emails are matched case-insensitively: imported emails are lowercased,
+and both the lowercased and the given spelling are looked up. If another
+writer creates one of a batch's emails between the lookup and the
+``bulk_create``, the batch's new users fall back to one-by-one upserts.
+"""
+import csv
+import json
+from collections import Counter
+from dataclasses import dataclass, field
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .changes import ChangeLogRepository
+from .models import User, Team
+from .partitions import to_utc
+from .propagation import schedule_user_propagation
+from .repositories import TeamStatsRepository
+
+MAX_REPORTED_ERRORS = 100
+# Upper bound on rows held and written per batch.
+MAX_BATCH_SIZE = 5000
+USER_FIELDS = {'_id': 0, 'id': 1, 'email': 1, 'name': 1, 'team_id': 1, 'role': 1}
+
+
+@dataclass
+class ImportReport:
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    rejected: int = 0
+    errors: list = field(default_factory=list)
+
+    def reject(self, line, reason):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': reason})
+
+
+def parse_csv(lines):
+    """``(line, row)`` pairs from CSV text with a header row."""
+    reader = csv.DictReader(lines)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_ndjson(lines):
+    """``(line, row)`` pairs from newline-delimited JSON objects; bad lines yield ``None``."""
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+PARSERS = {'csv': parse_csv, 'ndjson': parse_ndjson}
+CONTENT_TYPES = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+
+
+def clean_row(row):
+    """Normalized user fields, or raise ValueError with the reason."""
+    if row is None:
+        raise ValueError('Not a JSON object.')
+    email = (row.get('email') or '').strip()
+    name = (row.get('name') or '').strip()
+    try:
+        validate_email(email)
+    except ValidationError:
+        raise ValueError(f'Invalid email {email!r}.')
+    if not name:
+        raise ValueError('Missing name.')
+    if len(name) > User._meta.get_field('name').max_length:
+        raise ValueError('Name is too long.')
+    role = (row.get('role') or '').strip() or None
+    if role and len(role) > User._meta.get_field('role').max_length:
+        raise ValueError('Role is too long.')
+    team_id = row.get('team_id')
+    if team_id not in (None, ''):
+        try:
+            team_id = int(team_id)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid team_id {team_id!r}.')
+    else:
+        team_id = None
+    return {
+        'email': email.lower(),
+        'given_email': email,
+        'name': name,
+        'team': (row.get('team') or '').strip() or None,
+        'team_id': team_id,
+        'role': role,
+    }
+
+
+def import_users(rows, batch_size=1000, db=None):
+    """Upsert ``(line, row)`` pairs by email; returns an :class:`ImportReport`."""
+    report = ImportReport()
+    team_stats = TeamStatsRepository(db)
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return report
+        _import_batch(batch, report, team_stats)
+
+
+def _import_batch(batch, report, team_stats):
+    cleaned = {}
+    for line, row in batch:
+        try:
+            user = clean_row(row)
+        except ValueError as exc:
+            report.reject(line, str(exc))
+            continue
+        # A later row for the same email wins, as it would one request at a time.
+        cleaned[user['email']] = (line, user)
+
+    names = {user['team'] for _, user in cleaned.values() if user['team']}
+    teams = dict(Team.objects.filter(name__in=names).values_list('name', 'id')) if names else {}
+    users = team_stats.db[User._meta.db_table]
+    spellings = {spelling for _, user in cleaned.values() for spelling in (user['email'], user['given_email'])}
+    existing = {user['email'].lower(): user for user in users.find({'email': {'$in': list(spellings)}}, USER_FIELDS)}
+
+    batch_state = BatchState(users, to_utc(timezone.now()))
+    new_users = []
+    for email, (line, user) in cleaned.items():
+        if user['team']:
+            if user['team'] not in teams:
+                report.reject(line, f'Unknown team {user["team"]!r}.')
+                continue
+            user['team_id'] = teams[user['team']]
+        current = existing.get(email)
+        if current is None:
+            new_users.append((line, user))
+        else:
+            batch_state.update(current, user, report)
+
+    created = []
+    if new_users:
+        try:
+            with transaction.atomic():
+                User.objects.bulk_create([new_user(user) for _, user in new_users])
+            created = [user for _, user in new_users]
+            for user in created:
+                batch_state.members[user['team_id']] += 1
+        except DatabaseError:
+            # Another writer created some of these emails after the lookup.
+            created = [user for line, user in new_users if batch_state.upsert(line, user, report)]
+        report.created += len(created)
+
+    changes = ChangeLogRepository(team_stats.db)
+    if created:
+        emails = [user['email'] for user in created]
+        changes.record(User, User.objects.filter(email__in=emails).values_list('id', flat=True))
+    if batch_state.updates:
+        users.bulk_write(batch_state.updates, ordered=False)
+        changes.record(User, batch_state.updated_ids)
+    for team_id, delta in batch_state.members.items():
+        team_stats.increment(team_id, member_count=delta)
+    for user_id in batch_state.propagate:
+        schedule_user_propagation(user_id)
+
+
+def new_user(user):
+    return User(name=user['name'], email=user['email'], team_id=user['team_id'], role=user['role'] or 'member')
+
+
+class BatchState:
+    """Writes and side effects collected for one batch's existing users."""
+
+    def __init__(self, users, now):
+        self.users = users
+        self.now = now
+        self.updates, self.updated_ids, self.propagate = [], [], []
+        self.members = Counter()
+
+    def update(self, current, user, report):
+        """Queue the changes ``user`` makes to the stored ``current`` document."""
+        changes = {
+            key: user[key] for key in ('name', 'team_id', 'role')
+            if user[key] is not None and user[key] != current.get(key)
+        }
+        if not changes:
+            report.unchanged += 1
+            return
+        self.updates.append(UpdateOne({'id': current['id']}, {'$set': dict(changes, updated_at=self.now)}))
+        self.updated_ids.append(current['id'])
+        report.updated += 1
+        if 'team_id' in changes:
+            self.members[current['team_id']] -= 1
+            self.members[changes['team_id']] += 1
+        if 'name' in changes or 'team_id' in changes:
+            self.propagate.append(current['id'])
+
+    def upsert(self, line, user, report):
+        """Create ``user`` alone, or update whoever took its email; True if this import created it."""
+        current = self.users.find_one({'email': {'$in': [user['email'], user['given_email']]}}, USER_FIELDS)
+        stored = new_user(user)
+        if current is not None:
+            # A partly applied bulk_create leaves exactly this row behind.
+            if all(current.get(key) == getattr(stored, key) for key in ('name', 'team_id', 'role')):
+                self.members[stored.team_id] += 1
+                return True
+            self.update(current, user, report)
+            return False
+        try:
+            # Saved one at a time, the model signals count the new member.
+            with transaction.atomic():
+                stored.save()
+        except DatabaseError:
+            report.reject(line, 'Email was created concurrently; retry the import.')
+            return False
+        return True
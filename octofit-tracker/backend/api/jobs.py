@@ -0,0 +1,42 @@
+"""Periodic jobs run by ``run_scheduler``; intervals come from ``OCTOFIT_SCHEDULED_JOBS``."""
+from dataclasses import asdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .changes import ChangeLogRepository
+from .idempotency import IdempotencyKeyRepository
+from .leaderboard import recompute_leaderboard
+from .partitions import ActivityPartitions, add_months, month_start
+from .retention import compact_activities, retention_cutoff
+from .scheduler import register
+
+intervals = settings.OCTOFIT_SCHEDULED_JOBS
+
+
+@register('recompute_leaderboard', intervals['recompute_leaderboard'])
+def refresh_leaderboard():
+    return {'teams': recompute_leaderboard()}
+
+
+@register('compact_activities', intervals['compact_activities'])
+def refresh_rollups():
+    report = compact_activities(retention_cutoff(settings.OCTOFIT_RETENTION_DAYS))
+    return asdict(report)
+
+
+@register('create_partitions', intervals['create_partitions'])
+def create_partitions(ahead=3):
+    partitions = ActivityPartitions()
+    current = month_start(timezone.now())
+    return {'partitions': [partitions.create(add_months(current, offset)) for offset in range(ahead + 1)]}
+
+
+@register('prune_changes', intervals['prune_changes'])
+def prune_changes():
+    return {'pruned': ChangeLogRepository().prune(settings.OCTOFIT_CHANGE_RETENTION_DAYS)}
+
+
+@register('prune_idempotency_keys', intervals['prune_idempotency_keys'])
+def prune_idempotency_keys():
+    return {'pruned': IdempotencyKeyRepository().prune()}
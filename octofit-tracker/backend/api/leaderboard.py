@@ -0,0 +1,149 @@
+"""Recomputation of ``Leaderboard``.
+
+:func:`recompute_leaderboard` ranks teams from the maintained team
+counters. :func:`rebuild_leaderboard` recomputes every team's totals from
+the activities themselves: the teams are split into id ranges, each shard
+is aggregated by a process pool worker on a Mongo client of its own, and
+the merged totals get one global dense ranking. Either way the rows are
+written with bulk upserts.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.utils import timezone
+from pymongo import UpdateOne
+
+from .changes import DELETE, ChangeLogRepository
+from .models import Team, Activity, Leaderboard
+from .mongo import connect, get_database
+from .partitions import to_utc
+from .repositories import ActivityRollupRepository, TeamStatsRepository
+
+SHARDS_PER_WORKER = 4
+
+_worker_db = None
+
+
+def dense_ranks(points):
+    """Map each points total to its dense rank: ties share a rank, no gaps follow."""
+    return {total: rank for rank, total in enumerate(sorted(set(points), reverse=True), start=1)}
+
+
+def leaderboard_rows(teams, stats):
+    """Leaderboard fields per team; a team's points are its total calories."""
+    return {
+        team_id: {
+            'team_name': name,
+            'total_points': stats[team_id]['total_calories'],
+            'total_activities': stats[team_id]['activity_count'],
+        }
+        for team_id, name in teams.items()
+    }
+
+
+def write_leaderboard(rows, db=None):
+    """Upsert ranked rows and drop entries for teams that no longer exist."""
+    collection = TeamStatsRepository(db).db[Leaderboard._meta.db_table]
+    existing = {doc['team_id']: doc.get('id') for doc in collection.find({}, {'team_id': 1, 'id': 1})}
+    now = timezone.now()
+    # New rows go through the ORM so djongo assigns their ids.
+    created = [team_id for team_id in rows if team_id not in existing]
+    Leaderboard.objects.bulk_create([
+        Leaderboard(team_id=team_id, updated_at=now, **rows[team_id]) for team_id in created
+    ])
+    updates = [
+        UpdateOne({'team_id': team_id}, {'$set': dict(row, updated_at=to_utc(now))})
+        for team_id, row in rows.items() if team_id in existing
+    ]
+    if updates:
+        collection.bulk_write(updates, ordered=False)
+    collection.delete_many({'team_id': {'$nin': list(rows)}})
+
+    changes = ChangeLogRepository(collection.database)
+    if created:
+        created_ids = Leaderboard.objects.filter(team_id__in=created).values_list('id', flat=True)
+        changes.record(Leaderboard, created_ids)
+    changes.record(Leaderboard, [existing[team_id] for team_id in rows if team_id in existing])
+    removed = [row_id for team_id, row_id in existing.items() if team_id not in rows]
+    changes.record(Leaderboard, removed, op=DELETE)
+    return len(rows)
+
+
+def rank(rows):
+    ranks = dense_ranks(row['total_points'] for row in rows.values())
+    for row in rows.values():
+        row['rank'] = ranks[row['total_points']]
+    return rows
+
+
+def recompute_leaderboard(db=None):
+    """Rebuild every leaderboard entry with dense ranks by total points."""
+    teams = dict(Team.objects.values_list('id', 'name'))
+    rows = leaderboard_rows(teams, TeamStatsRepository(db).get_many(list(teams)))
+    return write_leaderboard(rank(rows), db)
+
+
+def team_shards(team_ids, count):
+    """Split sorted ``team_ids`` into at most ``count`` inclusive ``(low, high)`` id ranges."""
+    team_ids = sorted(team_ids)
+    size = -(-len(team_ids) // count) if team_ids else 1
+    return [(chunk[0], chunk[-1]) for chunk in (team_ids[i:i + size] for i in range(0, len(team_ids), size))]
+
+
+def init_worker():
+    """Give a pool process its own client; pymongo clients do not survive a fork."""
+    global _worker_db
+    if not apps.ready:
+        django.setup()
+    _worker_db = connect()
+
+
+def shard_totals(bounds, db=None):
+    """``{team_id: {activity_count, total_calories}}`` for the teams with ids in ``bounds``.
+
+    Activities compacted by retention count through their rollups.
+    """
+    db = db if db is not None else _worker_db
+    low, high = bounds
+    sources = (
+        (db[Activity._meta.db_table], {'$sum': 1}, '$calories'),
+        (ActivityRollupRepository(db).collection, {'$sum': '$activity_count'}, '$total_calories'),
+    )
+    totals = {}
+    for collection, count, calories in sources:
+        rows = collection.aggregate([
+            {'$match': {'team_id': {'$gte': low, '$lte': high}}},
+            {'$group': {'_id': '$team_id', 'activity_count': count, 'total_calories': {'$sum': calories}}},
+        ])
+        for row in rows:
+            team = totals.setdefault(row['_id'], {'activity_count': 0, 'total_calories': 0})
+            team['activity_count'] += row['activity_count']
+            team['total_calories'] += row['total_calories'] or 0
+    return totals
+
+
+def rebuild_leaderboard(workers=None, db=None):
+    """Recompute every team's points from its activities, ``workers`` shards at a time.
+
+    With one worker the shards are aggregated in this process, on ``db``.
+    Returns ``(teams, shards)``.
+    """
+    workers = workers or os.cpu_count() or 1
+    teams = dict(Team.objects.values_list('id', 'name'))
+    shards = team_shards(teams, workers * SHARDS_PER_WORKER if workers > 1 else 1)
+    if workers > 1 and len(shards) > 1:
+        with ProcessPoolExecutor(min(workers, len(shards)), initializer=init_worker) as pool:
+            results = list(pool.map(shard_totals, shards))
+    else:
+        db = db if db is not None else get_database()
+        results = [shard_totals(shard, db) for shard in shards]
+
+    stats = {team_id: {'activity_count': 0, 'total_calories': 0} for team_id in teams}
+    for totals in results:
+        for team_id, team in totals.items():
+            if team_id in stats:
+                stats[team_id] = team
+    write_leaderboard(rank(leaderboard_rows(teams, stats)), db)
+    return len(teams), len(shards)
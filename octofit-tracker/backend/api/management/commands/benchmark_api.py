@@ -0,0 +1,52 @@
+import json
+import platform
+
+import django
+import rest_framework
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.benchmarks import run
+
+
+class Command(BaseCommand):
+    help = 'Micro-benchmark every serializer and the main viewset actions against an in-memory dataset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=1000, help='Number of activities in the dataset')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark; the best is kept')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--only', default=None, help='Only benchmarks whose name contains this')
+        parser.add_argument('--output', default='benchmark.json', help='Where to write the JSON results')
+
+    def handle(self, *args, **options):
+        if options['size'] < 1 or options['repeat'] < 1:
+            raise CommandError('--size and --repeat must be positive.')
+        started_at = timezone.now()
+        try:
+            results, skipped = run(options['size'], options['repeat'], options['seed'], options['only'])
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        with open(options['output'], 'w') as handle:
+            json.dump({
+                'started_at': started_at.isoformat(),
+                'size': options['size'],
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'rest_framework': rest_framework.VERSION,
+                'results': results,
+                'skipped': skipped,
+            }, handle, indent=2)
+
+        self.stdout.write(f'{"benchmark":<40} {"rows":>6} {"rows/s":>12} {"bytes/row":>10} {"blocks/row":>10}')
+        for result in results:
+            self.stdout.write(
+                f'{result["name"]:<40} {result["rows"]:>6} {result["rows_per_second"] or 0:>12.0f} '
+                f'{result["peak_bytes_per_row"] or 0:>10.0f} {result["retained_blocks_per_row"] or 0:>10.1f}'
+            )
+        for reason in skipped:
+            self.stdout.write(self.style.WARNING(f'Skipped {reason}'))
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} benchmarks written to {options["output"]}'))
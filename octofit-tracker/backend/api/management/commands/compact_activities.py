@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.retention import compact_activities, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Compact activities older than the retention window into per-user daily rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=settings.OCTOFIT_RETENTION_DAYS)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--max-batches', type=int, default=None,
+                            help='Stop after this many batches; rerun to resume')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be compacted without writing anything')
+
+    def handle(self, *args, **options):
+        cutoff = retention_cutoff(options['older_than_days'])
+        verb = 'Would compact' if options['dry_run'] else 'Compacting'
+        self.stdout.write(self.style.WARNING(f'{verb} activities dated before {cutoff:%Y-%m-%d}...'))
+        report = compact_activities(
+            cutoff,
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+        )
+        self.stdout.write(f'Activities: {report.activities} in {report.batches} batches')
+        self.stdout.write(f'New rollups: {report.rollups}')
+        self.stdout.write(f'Document bytes reclaimed: {report.bytes_reclaimed} '
+                          f'({report.bytes_removed} removed, {report.bytes_added} added)')
+        self.stdout.write(self.style.SUCCESS('Dry run complete.' if options['dry_run'] else 'Compaction complete.'))
@@ -0,0 +1,36 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from api.importers import MAX_BATCH_SIZE, PARSERS, import_users
+
+
+class Command(BaseCommand):
+    help = 'Create or update users by email from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or '-' for stdin")
+        parser.add_argument('--format', choices=sorted(PARSERS), default=None,
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not 1 <= options['batch_size'] <= MAX_BATCH_SIZE:
+            raise CommandError(f'--batch-size must be between 1 and {MAX_BATCH_SIZE}.')
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        started = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            report = import_users(PARSERS[fmt](stream), batch_size=options['batch_size'])
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        elapsed = time.perf_counter() - started
+        for error in report.errors:
+            self.stdout.write(self.style.WARNING(f'  line {error["line"]}: {error["error"]}'))
+        total = report.created + report.updated + report.unchanged + report.rejected
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.created} created, {report.updated} updated, {report.unchanged} unchanged, '
+            f'{report.rejected} rejected in {elapsed:.2f}s ({total / max(elapsed, 1e-9):.0f} rows/s)'
+        ))
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import Activity
+from api.partitions import ActivityPartitions, add_months, month_start
+from api.retention import detach_month
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly activity partitions and detach old ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3,
+                            help='Number of future months to create partitions for')
+        parser.add_argument('--retain', type=int, default=None,
+                            help='Detach partitions more than this many months old, compacting '
+                                 'their activities out of the base collection')
+        parser.add_argument('--backfill', action='store_true',
+                            help='Copy existing activities into their partitions')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        partitions = ActivityPartitions()
+        current = month_start(timezone.now())
+
+        for offset in range(options['ahead'] + 1):
+            name = partitions.create(add_months(current, offset))
+            self.stdout.write(f'  Partition ready: {name}')
+
+        if options['retain'] is not None:
+            cutoff = add_months(current, -options['retain'])
+            for entry in partitions.attached():
+                if entry['month'] < cutoff:
+                    name, report = detach_month(entry['month'], batch_size=options['batch_size'])
+                    self.stdout.write(f'  Detached: {name} ({report.activities} activities compacted)')
+
+        if options['backfill']:
+            self.stdout.write(self.style.WARNING('Backfilling partitions...'))
+            source = partitions.db[Activity._meta.db_table]
+            last_id, copied = 0, 0
+            while True:
+                batch = list(source.find({'id': {'$gt': last_id}}).sort('id', 1).limit(options['batch_size']))
+                if not batch:
+                    break
+                last_id = batch[-1]['id']
+                copied += partitions.write_many(batch)
+            partitions.mark_backfilled()
+            self.stdout.write(self.style.SUCCESS(f'Copied {copied} activities into partitions.'))
+
+        self.stdout.write(self.style.SUCCESS(f'{len(partitions.attached())} partitions attached.'))
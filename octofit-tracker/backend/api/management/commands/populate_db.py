@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import timedelta
+from api.leaderboard import rebuild_leaderboard
 from api.models import User, Team, Activity, Leaderboard, Workout
 import random
 
@@ -97,6 +98,8 @@ class Command(BaseCommand):
                 
                 Activity.objects.create(
                     user_id=user.id,
+                    user_name=user.name,
+                    team_id=user.team_id,
                     activity_type=activity_type,
                     duration=duration,
                     calories=calories,
@@ -111,44 +114,12 @@ class Command(BaseCommand):
         # Create Leaderboard entries
         self.stdout.write(self.style.WARNING('Creating leaderboard entries...'))
         
-        # Calculate Marvel team stats
-        marvel_activities = Activity.objects.filter(user_id__in=[u.id for u in marvel_users])
-        marvel_points = sum(a.calories for a in marvel_activities)
-        marvel_activity_count = marvel_activities.count()
-        
-        # Calculate DC team stats
-        dc_activities = Activity.objects.filter(user_id__in=[u.id for u in dc_users])
-        dc_points = sum(a.calories for a in dc_activities)
-        dc_activity_count = dc_activities.count()
-        
-        # Determine ranks
-        if marvel_points > dc_points:
-            marvel_rank, dc_rank = 1, 2
-        elif dc_points > marvel_points:
-            marvel_rank, dc_rank = 2, 1
-        else:
-            marvel_rank, dc_rank = 1, 1
-        
-        Leaderboard.objects.create(
-            team_id=team_marvel.id,
-            team_name=team_marvel.name,
-            total_points=marvel_points,
-            total_activities=marvel_activity_count,
-            rank=marvel_rank
+        rebuild_leaderboard()
+        entries = ', '.join(
+            f'{entry.team_name} ({entry.total_points} pts, rank {entry.rank})'
+            for entry in Leaderboard.objects.order_by('rank', 'team_name')
         )
-        
-        Leaderboard.objects.create(
-            team_id=team_dc.id,
-            team_name=team_dc.name,
-            total_points=dc_points,
-            total_activities=dc_activity_count,
-            rank=dc_rank
-        )
-        
-        self.stdout.write(self.style.SUCCESS(
-            f'Created leaderboard: {team_marvel.name} ({marvel_points} pts, rank {marvel_rank}), '
-            f'{team_dc.name} ({dc_points} pts, rank {dc_rank})'
-        ))
+        self.stdout.write(self.style.SUCCESS(f'Created leaderboard: {entries}'))
         
         # Create Workouts
         self.stdout.write(self.style.WARNING('Creating workout suggestions...'))
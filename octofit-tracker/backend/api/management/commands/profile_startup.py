@@ -0,0 +1,111 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported. The marker on
+# stderr separates imports done at boot from those the first request pulls in.
+FIRST_REQUEST_MARKER = '-- first request --'
+PROBE = '''
+import sys, time
+started = time.perf_counter()
+from octofit_tracker.{entry_point} import application
+imported = time.perf_counter()
+first_request = None
+path = {path!r}
+if path:
+    sys.stderr.write({marker!r} + '\\n')
+    if {entry_point!r} == 'wsgi':
+        from wsgiref.util import setup_testing_defaults
+        path_info, _, query = path.partition('?')
+        environ = {{'PATH_INFO': path_info, 'QUERY_STRING': query, 'HTTP_HOST': 'localhost'}}
+        setup_testing_defaults(environ)
+        b''.join(application(environ, lambda status, headers, exc_info=None: None))
+    else:
+        import asyncio
+        path_info, _, query = path.partition('?')
+        scope = {{
+            'type': 'http', 'method': 'GET', 'path': path_info, 'query_string': query.encode(), 'root_path': '',
+            'headers': [(b'host', b'localhost')], 'scheme': 'http', 'http_version': '1.1',
+        }}
+
+        async def receive():
+            return {{'type': 'http.request', 'body': b'', 'more_body': False}}
+
+        async def send(message):
+            pass
+
+        asyncio.run(application(scope, receive, send))
+    first_request = time.perf_counter() - imported
+import json
+print(json.dumps({{'import': imported - started, 'first_request': first_request}}))
+'''
+
+
+def parse_importtime(stderr):
+    """Turn ``-X importtime`` output into ``(module, self_us, cumulative_us, at_boot)`` rows."""
+    rows = []
+    at_boot = True
+    for line in stderr.splitlines():
+        if line == FIRST_REQUEST_MARKER:
+            at_boot = False
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|', 2)
+        rows.append((module.strip(), int(self_us), int(cumulative_us), at_boot))
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Report per-module import time for the WSGI/ASGI entry points in a cold interpreter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry-point', choices=['wsgi', 'asgi'], default='wsgi')
+        parser.add_argument('--limit', type=int, default=25, help='Number of modules to list')
+        parser.add_argument('--sort', choices=['self', 'cumulative'], default='cumulative')
+        parser.add_argument('--first-request', default='/api/',
+                            help='Path to request after import; empty to skip')
+        parser.add_argument('--json', action='store_true', help='Emit machine-readable output')
+
+    def handle(self, *args, **options):
+        code = PROBE.format(
+            entry_point=options['entry_point'], path=options['first_request'], marker=FIRST_REQUEST_MARKER
+        )
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            capture_output=True, text=True, env=os.environ.copy(),
+        )
+        if result.returncode != 0:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+        timings = json.loads(result.stdout.strip().splitlines()[-1])
+        rows = parse_importtime(result.stderr)
+        rows.sort(key=lambda row: row[1] if options['sort'] == 'self' else row[2], reverse=True)
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'entry_point': options['entry_point'],
+                'import_seconds': timings['import'],
+                'first_request_seconds': timings['first_request'],
+                'modules': [
+                    {'module': module, 'self_us': self_us, 'cumulative_us': cumulative_us, 'at_boot': at_boot}
+                    for module, self_us, cumulative_us, at_boot in rows
+                ],
+            }, indent=2))
+            return
+
+        self.stdout.write(f'{"self ms":>9} {"cumul ms":>9}  phase    module')
+        for module, self_us, cumulative_us, at_boot in rows[:options['limit']]:
+            phase = 'boot' if at_boot else 'request'
+            self.stdout.write(f'{self_us / 1000:9.1f} {cumulative_us / 1000:9.1f}  {phase:<8} {module}')
+        booted = sum(1 for row in rows if row[3])
+        self.stdout.write(self.style.SUCCESS(
+            f'octofit_tracker.{options["entry_point"]}: {booted} modules imported '
+            f'in {timings["import"] * 1000:.0f} ms'
+        ))
+        if timings['first_request'] is not None:
+            self.stdout.write(self.style.SUCCESS(
+                f'First request to {options["first_request"]}: {timings["first_request"] * 1000:.0f} ms, '
+                f'{len(rows) - booted} more modules'
+            ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed X-Octofit-Profile header value that enables request profiling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--label', default='profile', help='Name recorded with each profiled run')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'X-Octofit-Profile: {make_token(options["label"])}')
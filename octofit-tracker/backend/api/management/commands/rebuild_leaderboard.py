@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.leaderboard import rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = 'Recompute every team\'s leaderboard points from its activities, sharded across processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: one per CPU); 1 aggregates in this process')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        teams, shards = rebuild_leaderboard(workers=options['workers'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f'Ranked {teams} teams from {shards} shards in {elapsed:.2f}s.'))
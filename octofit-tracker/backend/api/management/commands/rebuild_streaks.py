@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from api.streaks import ActivityStreaks
+
+
+class Command(BaseCommand):
+    help = 'Recompute activity day counts, streaks and daily active users from activities'
+
+    def handle(self, *args, **kwargs):
+        streaks = ActivityStreaks()
+        owners = streaks.rebuild()
+        streaks.ensure_indexes()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt streaks for {owners} users and teams.'))
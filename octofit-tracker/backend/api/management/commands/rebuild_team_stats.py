@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.repositories import TeamStatsRepository
+
+
+class Command(BaseCommand):
+    help = 'Recompute the maintained per-team counters from users and activities'
+
+    def handle(self, *args, **kwargs):
+        teams = TeamStatsRepository().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {teams} teams.'))
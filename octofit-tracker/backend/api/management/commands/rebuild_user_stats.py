@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.repositories import UserStatsRepository
+
+
+class Command(BaseCommand):
+    help = 'Recompute the maintained per-user totals and personal bests from activities'
+
+    def handle(self, *args, **kwargs):
+        users = UserStatsRepository().rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {users} users.'))
@@ -0,0 +1,49 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+from api.scheduler import JobRunRepository, Scheduler, load_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run the registered periodic jobs in this process until interrupted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--job', action='append', dest='jobs', default=None,
+                            help='Only run this job (repeatable)')
+        parser.add_argument('--workers', type=int, default=4, help='Jobs that may run at the same time')
+        parser.add_argument('--once', action='store_true', help='Run every job once and exit')
+        parser.add_argument('--run-now', action='store_true',
+                            help='Run every job at startup instead of after its first interval')
+        parser.add_argument('--report', action='store_true',
+                            help='Print recent run timings per job and exit')
+
+    def handle(self, *args, **options):
+        if options['report']:
+            for name, row in sorted(JobRunRepository().summary().items()):
+                self.stdout.write(
+                    f'{name:<24} {row["runs"]:>4} runs {row["failures"]:>3} failed '
+                    f'mean {row["mean_ms"]:>9.1f} ms  max {row["max_ms"]:>9.1f} ms  '
+                    f'last {row["last_started_at"]:%Y-%m-%d %H:%M:%S}'
+                )
+            return
+
+        registry = load_jobs()
+        unknown = set(options['jobs'] or ()) - set(registry)
+        if unknown:
+            raise CommandError(f'Unknown job(s): {", ".join(sorted(unknown))}')
+        jobs = [job for name, job in registry.items() if not options['jobs'] or name in options['jobs']]
+        scheduler = Scheduler(jobs, workers=options['workers'])
+
+        if options['once']:
+            for name, ran in scheduler.run_once().items():
+                self.stdout.write(f'  {name}: {"ran" if ran else "skipped (already running)"}')
+            scheduler.pool.shutdown()
+            return
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, scheduler.stop)
+        for job in jobs:
+            self.stdout.write(f'  {job.name}: every {job.interval:g}s')
+        self.stdout.write(self.style.SUCCESS(f'Scheduler running {len(jobs)} jobs; Ctrl-C to stop.'))
+        scheduler.serve(run_now=options['run_now'])
+        self.stdout.write(self.style.SUCCESS('Scheduler stopped.'))
@@ -0,0 +1,47 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.querylog import SlowQueryRepository
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow query log by query shape, worst first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10, help='Number of shapes to list')
+        parser.add_argument('--sort', choices=['total', 'mean', 'max', 'count'], default='total')
+        parser.add_argument('--hours', type=float, default=None, help='Only entries from the last N hours')
+        parser.add_argument('--json', action='store_true', help='Emit machine-readable output')
+        parser.add_argument('--clear', action='store_true', help='Delete every entry and exit')
+
+    def handle(self, *args, **options):
+        log = SlowQueryRepository()
+        if options['clear']:
+            deleted = log.collection.delete_many({}).deleted_count
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} slow query entries.'))
+            return
+
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        sort = options['sort'] if options['sort'] == 'count' else f'{options["sort"]}_ms'
+        rows = log.worst_shapes(limit=options['limit'], sort=sort, since=since)
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2, default=str))
+            return
+        if not rows:
+            self.stdout.write(self.style.WARNING('No slow queries recorded.'))
+            return
+
+        for row in rows:
+            self.stdout.write(
+                f'{row["count"]:>6}x  total {row["total_ms"]:>10.1f} ms  mean {row["mean_ms"]:>8.1f} ms  '
+                f'max {row["max_ms"]:>8.1f} ms  [{row["shape_id"]}]'
+            )
+            self.stdout.write(f'        {row["shape"]}')
+            for command in row['commands']:
+                self.stdout.write(f'        -> {command["command"]} {command["collection"]}: {command["body"]}')
+            if row['views']:
+                self.stdout.write(f'        views: {", ".join(row["views"])}')
+        self.stdout.write(self.style.SUCCESS(f'{len(rows)} query shapes listed.'))
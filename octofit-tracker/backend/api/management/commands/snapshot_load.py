@@ -0,0 +1,56 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.changes import ChangeLogRepository
+from api.models import Activity
+from api.partitions import ActivityPartitions
+from api.repositories import TeamStatsRepository, UserStatsRepository
+from api.snapshots import load_snapshot
+from api.streaks import ActivityStreaks
+
+
+class Command(BaseCommand):
+    help = 'Replace the api collections with the contents of a snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot file to restore')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Parallel collection workers (default: one per collection)')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Documents per insert_many call')
+        parser.add_argument('--skip-derived', action='store_true',
+                            help='Do not rebuild stats, streaks and activity partitions afterwards')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = load_snapshot(options['path'], workers=options['workers'],
+                               chunk_size=options['chunk_size'])
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Restored {sum(counts.values())} documents in {time.perf_counter() - started:.2f}s'
+        ))
+        # Clients synced against the replaced data must reload it.
+        ChangeLogRepository().expire_all()
+        if options['skip_derived']:
+            return
+
+        self.stdout.write(self.style.WARNING('Rebuilding derived data...'))
+        team_stats = TeamStatsRepository()
+        team_stats.rebuild()
+        UserStatsRepository(team_stats.db).rebuild()
+        ActivityStreaks(team_stats.db).rebuild()
+        if settings.OCTOFIT_ACTIVITY_PARTITIONING:
+            partitions = ActivityPartitions(team_stats.db)
+            partitions.reset()
+            activities = team_stats.db[Activity._meta.db_table].find()
+            batch = []
+            for doc in activities:
+                batch.append(doc)
+                if len(batch) == options['chunk_size']:
+                    partitions.write_many(batch)
+                    batch = []
+            partitions.write_many(batch)
+            partitions.mark_backfilled()
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.perf_counter() - started:.2f}s'))
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.snapshots import save_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Write the api collections to a compressed columnar snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot file to write')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Parallel collection workers (default: one per collection)')
+        parser.add_argument('--compresslevel', type=int, default=6, choices=range(1, 10))
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        counts = save_snapshot(options['path'], workers=options['workers'],
+                               compresslevel=options['compresslevel'])
+        for name, count in counts.items():
+            self.stdout.write(f'  {name}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Saved {sum(counts.values())} documents to {options["path"]} '
+            f'in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
+
+from . import profiling, querylog
+
+
+class DualModeMiddleware:
+    """Base for middleware that runs natively under both WSGI and ASGI.
+
+    Django wraps sync-only middleware in a thread-sensitive executor under
+    ASGI, which would funnel every request, async views included, through
+    one thread. Subclasses implement :meth:`handle` for the sync chain and
+    may override :meth:`handle_async`, which by default passes through.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Marks the instance as a coroutine function, as Django's MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.handle_async(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        return self.get_response(request)
+
+    async def handle_async(self, request):
+        return await self.get_response(request)
+
+
+class LoadSheddingMiddleware(DualModeMiddleware):
+    """Answer API requests with 503 and ``Retry-After`` while the service is overloaded.
+
+    Overload means either more than ``max_in_flight`` API requests being
+    served by this process or a moving average of its API latency above
+    ``max_latency_ms``. A latency verdict only holds for ``retry_after``
+    seconds after the last measured request; after that requests are let
+    through again to re-measure. Both are kept per process, so a worker
+    that dies takes its count with it instead of leaking it.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.latency = 0.0
+        self.measured_at = 0.0
+
+    @property
+    def options(self):
+        return settings.OCTOFIT_LOAD_SHEDDING
+
+    def overloaded(self, in_flight, now):
+        options = self.options
+        if in_flight > options['max_in_flight']:
+            return True
+        return (
+            self.latency * 1000 > options['max_latency_ms']
+            and now - self.measured_at < options['retry_after']
+        )
+
+    def enter(self):
+        with self.lock:
+            self.in_flight += 1
+            return self.in_flight
+
+    def leave(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def shed(self):
+        response = JsonResponse({'detail': 'Service temporarily overloaded.'}, status=503)
+        response['Retry-After'] = str(self.options['retry_after'])
+        return response
+
+    def measure(self, started):
+        finished = time.monotonic()
+        with self.lock:
+            weight = self.options['latency_weight']
+            self.latency = weight * (finished - started) + (1 - weight) * self.latency
+            self.measured_at = finished
+
+    def handle(self, request):
+        if not request.path.startswith(self.options['path_prefix']):
+            return self.get_response(request)
+        in_flight = self.enter()
+        try:
+            started = time.monotonic()
+            if self.overloaded(in_flight, started):
+                return self.shed()
+            response = self.get_response(request)
+            self.measure(started)
+            return response
+        finally:
+            self.leave()
+
+    async def handle_async(self, request):
+        if not request.path.startswith(self.options['path_prefix']):
+            return await self.get_response(request)
+        in_flight = self.enter()
+        try:
+            started = time.monotonic()
+            if self.overloaded(in_flight, started):
+                return self.shed()
+            response = await self.get_response(request)
+            self.measure(started)
+            return response
+        finally:
+            self.leave()
+
+
+class ProfilingMiddleware(DualModeMiddleware):
+    """Profile single API requests that ask for it; see :mod:`api.profiling`.
+
+    Requests without a profiling header or ``?profile`` parameter go
+    straight through. It sits after ``AuthenticationMiddleware`` so staff
+    sessions can be recognized. cProfile follows one thread, so requests
+    served on the event loop under ASGI are not profiled.
+    """
+
+    def handle(self, request):
+        if not request.path.startswith(settings.OCTOFIT_PROFILING['path_prefix']):
+            return self.get_response(request)
+        if profiling.HEADER not in request.META and profiling.QUERY_PARAM not in request.GET:
+            return self.get_response(request)
+        label = profiling.requested_label(request)
+        if label is None:
+            return self.get_response(request)
+        response, name = profiling.profile(self.get_response, request, label)
+        response['X-Profile'] = name or 'busy'
+        return response
+
+
+class SlowQueryMiddleware(DualModeMiddleware):
+    """Time the statements and Mongo commands of API requests; see :mod:`api.querylog`.
+
+    The recorder is per thread, so requests served on the event loop under
+    ASGI are not recorded.
+    """
+
+    def handle(self, request):
+        options = settings.OCTOFIT_SLOW_QUERIES
+        if not options['enabled'] or not request.path.startswith(options['path_prefix']):
+            return self.get_response(request)
+        recorder = querylog.start(options)
+        try:
+            with connection.execute_wrapper(recorder.execute):
+                return self.get_response(request)
+        finally:
+            match = request.resolver_match
+            querylog.finish(recorder, match.view_name if match else None)
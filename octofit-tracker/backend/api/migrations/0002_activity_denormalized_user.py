@@ -0,0 +1,38 @@
+# Generated by Django 4.1.7 on 2026-10-19 09:12
+
+from django.db import migrations, models
+
+
+def backfill_user_fields(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    Activity = apps.get_model('api', 'Activity')
+    for user in User.objects.all().values('id', 'name', 'team_id'):
+        Activity.objects.filter(user_id=user['id']).update(
+            user_name=user['name'], team_id=user['team_id']
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='user_name',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='activity',
+            name='team_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='activity',
+            name='user_id',
+            field=models.IntegerField(db_index=True),
+        ),
+        migrations.RunPython(backfill_user_fields, migrations.RunPython.noop),
+    ]
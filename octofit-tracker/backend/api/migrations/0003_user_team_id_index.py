@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-19 10:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_activity_denormalized_user'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='team_id',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
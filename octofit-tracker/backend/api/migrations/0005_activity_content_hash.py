@@ -0,0 +1,57 @@
+# Generated by Django 4.1.7 on 2026-10-19 18:40
+
+import hashlib
+import json
+from datetime import timezone
+
+from django.db import migrations, models
+
+CONTENT_FIELDS = ('user_id', 'activity_type', 'date', 'duration', 'distance')
+
+
+def content_hash(user_id, activity_type, date, duration, distance):
+    """``api.models.activity_content_hash`` as of this migration, frozen here."""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    date = date.replace(microsecond=date.microsecond // 1000 * 1000)
+    key = json.dumps([user_id, activity_type, date.isoformat(), duration, float(distance or 0)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def backfill_content_hash(apps, schema_editor):
+    """Hash every stored activity before the unique index is built.
+
+    Duplicates stored before deduplication keep their rows: the oldest gets
+    the plain hash, so later resends match it, and the others a hash salted
+    with their id.
+    """
+    Activity = apps.get_model('api', 'Activity')
+    seen = set()
+    for row in Activity.objects.order_by('id').values('id', *CONTENT_FIELDS).iterator():
+        activity_id = row.pop('id')
+        digest = content_hash(**row)
+        if digest in seen:
+            digest = hashlib.sha256(f'{digest}:{activity_id}'.encode()).hexdigest()
+        seen.add(digest)
+        Activity.objects.filter(id=activity_id).update(content_hash=digest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='activity',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_content_hash, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='activity',
+            name='content_hash',
+            field=models.CharField(editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
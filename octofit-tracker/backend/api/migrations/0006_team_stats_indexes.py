@@ -0,0 +1,38 @@
+# Generated by Django 4.1.7 on 2026-10-20 09:10
+
+from django.db import migrations
+
+from api.mongo import create_indexes, migration_database
+
+
+def merge_duplicate_team_stats(apps, schema_editor):
+    """Fold counters split across racing upserts into one document per team."""
+    db = migration_database(schema_editor)
+    if db is None:
+        return
+    collection = db['team_stats']
+    duplicates = collection.aggregate([
+        {'$group': {'_id': '$team_id', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ])
+    for group in duplicates:
+        documents = list(collection.find({'_id': {'$in': group['ids']}}))
+        kept = documents[0]
+        for document in documents[1:]:
+            for key, value in document.items():
+                if key not in ('_id', 'team_id'):
+                    kept[key] = kept.get(key, 0) + value
+        collection.replace_one({'_id': kept['_id']}, kept)
+        collection.delete_many({'_id': {'$in': [document['_id'] for document in documents[1:]]}})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_activity_content_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_team_stats, migrations.RunPython.noop),
+        create_indexes('team_stats', ('team_id', {'unique': True})),
+    ]
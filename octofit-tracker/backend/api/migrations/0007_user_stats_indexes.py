@@ -0,0 +1,49 @@
+# Generated by Django 4.1.7 on 2026-10-20 09:40
+
+from django.db import migrations
+
+from api.mongo import create_indexes, migration_database
+
+TOTALS = ('activity_count', 'total_calories', 'total_duration', 'total_distance')
+
+
+def merge_duplicate_user_stats(apps, schema_editor):
+    """Fold summaries split across racing upserts into one document per user."""
+    db = migration_database(schema_editor)
+    if db is None:
+        return
+    collection = db['user_stats']
+    duplicates = collection.aggregate([
+        {'$group': {'_id': '$user_id', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ])
+    for group in duplicates:
+        documents = list(collection.find({'_id': {'$in': group['ids']}}))
+        kept = documents[0]
+        kept.setdefault('by_type', {})
+        kept.setdefault('bests', {})
+        for document in documents[1:]:
+            for total in TOTALS:
+                kept[total] = kept.get(total, 0) + document.get(total, 0)
+            for key, breakdown in (document.get('by_type') or {}).items():
+                merged = kept['by_type'].setdefault(key, {'activity_type': breakdown.get('activity_type')})
+                for total in TOTALS:
+                    merged[total] = merged.get(total, 0) + breakdown.get(total, 0)
+            for best, held in (document.get('bests') or {}).items():
+                current = kept['bests'].get(best)
+                if held and (not current or held['value'] > current['value']):
+                    kept['bests'][best] = held
+        collection.replace_one({'_id': kept['_id']}, kept)
+        collection.delete_many({'_id': {'$in': [document['_id'] for document in documents[1:]]}})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_team_stats_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_user_stats, migrations.RunPython.noop),
+        create_indexes('user_stats', ('user_id', {'unique': True})),
+    ]
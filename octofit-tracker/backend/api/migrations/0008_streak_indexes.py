@@ -0,0 +1,86 @@
+# Generated by Django 4.1.7 on 2026-10-20 10:05
+
+from django.db import migrations
+
+from api.mongo import create_indexes, migration_database
+
+
+def merge_duplicates(collection, key, counter):
+    """Sum ``counter`` over documents sharing ``key`` into the first of them."""
+    duplicates = collection.aggregate([
+        {'$group': {'_id': {field: f'${field}' for field in key}, 'ids': {'$push': '$_id'},
+                    'total': {'$sum': f'${counter}'}, 'count': {'$sum': 1}}},
+        {'$match': {'count': {'$gt': 1}}},
+    ])
+    for group in duplicates:
+        kept, *extra = group['ids']
+        collection.update_one({'_id': kept}, {'$set': {counter: group['total']}})
+        collection.delete_many({'_id': {'$in': extra}})
+
+
+def split_streak_runs(apps, schema_editor):
+    """Rewrite every owner's day set as ``streak_runs`` documents and re-derive its summary.
+
+    Summaries used to embed the whole run list; they are recomputed from
+    ``activity_days`` so that summaries duplicated by racing first writes
+    collapse into one.
+    """
+    db = migration_database(schema_editor)
+    if db is None:
+        return
+    merge_duplicates(db['activity_days'], ('scope', 'owner_id', 'day'), 'count')
+    merge_duplicates(db['daily_active_users'], ('day',), 'users')
+
+    summaries, runs = {}, []
+    days = db['activity_days'].find({'count': {'$gt': 0}}).sort([('scope', 1), ('owner_id', 1), ('day', 1)])
+    for doc in days:
+        owner = (doc['scope'], doc['owner_id'])
+        summary = summaries.get(owner)
+        if summary is None or summary['last_end'] != doc['day'] - 1:
+            runs.append({'scope': owner[0], 'owner_id': owner[1], 'first': doc['day'], 'last': doc['day'], 'length': 1})
+        else:
+            runs[-1]['last'] = doc['day']
+            runs[-1]['length'] += 1
+        run = runs[-1]
+        summary = summary or {'scope': owner[0], 'owner_id': owner[1], 'longest': 0, 'active_days': 0, 'version': 0}
+        summary.update({
+            'longest': max(summary['longest'], run['length']),
+            'active_days': summary['active_days'] + 1,
+            'last_start': run['first'],
+            'last_end': run['last'],
+            'last_length': run['length'],
+        })
+        summaries[owner] = summary
+
+    db['streaks'].delete_many({})
+    db['streak_runs'].delete_many({})
+    if summaries:
+        db['streaks'].insert_many(list(summaries.values()))
+        db['streak_runs'].insert_many(runs)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_user_stats_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(split_streak_runs, migrations.RunPython.noop),
+        create_indexes(
+            'activity_days',
+            ([('scope', 1), ('owner_id', 1), ('day', 1)], {'unique': True}),
+        ),
+        create_indexes('daily_active_users', ('day', {'unique': True})),
+        create_indexes(
+            'streaks',
+            ([('scope', 1), ('owner_id', 1)], {'unique': True}),
+            ([('scope', 1), ('longest', -1)], {}),
+            ([('scope', 1), ('last_end', -1), ('last_length', -1)], {}),
+        ),
+        create_indexes(
+            'streak_runs',
+            ([('scope', 1), ('owner_id', 1), ('first', 1)], {'unique': True}),
+            ([('scope', 1), ('owner_id', 1), ('length', -1)], {}),
+        ),
+    ]
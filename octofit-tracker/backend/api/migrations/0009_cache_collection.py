@@ -0,0 +1,17 @@
+# Generated by Django 4.1.7 on 2026-10-20 10:30
+
+from django.db import migrations
+
+from api.mongo import create_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_streak_indexes'),
+    ]
+
+    operations = [
+        # api.cache.MongoCache entries are reaped once past ``expires``.
+        create_indexes('django_cache', ('expires', {'expireAfterSeconds': 0})),
+    ]
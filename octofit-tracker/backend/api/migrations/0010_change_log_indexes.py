@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-20 10:50
+
+from django.db import migrations
+
+from api.mongo import create_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_cache_collection'),
+    ]
+
+    operations = [
+        create_indexes(
+            'changes',
+            ('seq', {'unique': True}),
+            ([('model', 1), ('seq', 1)], {}),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-20 11:05
+
+from django.db import migrations
+
+from api.mongo import create_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_change_log_indexes'),
+    ]
+
+    operations = [
+        # Newest-first reads: the dashboard's latest activities and per-user history.
+        create_indexes(
+            'activities',
+            ([('date', -1)], {}),
+            ([('user_id', 1), ('date', -1)], {}),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.1.7 on 2026-10-20 11:20
+
+from django.db import migrations
+
+from api.mongo import create_indexes
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_activity_date_indexes'),
+    ]
+
+    operations = [
+        create_indexes(
+            'slow_queries',
+            ([('at', -1)], {}),
+            ('shape_id', {}),
+        ),
+    ]
@@ -1,13 +1,52 @@
+import hashlib
+import json
+from datetime import timezone as dt_timezone
+
 from django.db import models
+from django.utils import timezone
+
+# The fields that make two submitted activities the same workout.
+CONTENT_FIELDS = ('user_id', 'activity_type', 'date', 'duration', 'distance')
+
+
+def activity_content_hash(user_id, activity_type, date, duration, distance):
+    """SHA-256 identifying a workout however many times it is submitted.
+
+    Dates are compared in UTC to the millisecond, the precision Mongo keeps.
+    """
+    if timezone.is_aware(date):
+        date = date.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    date = date.replace(microsecond=date.microsecond // 1000 * 1000)
+    key = json.dumps([user_id, activity_type, date.isoformat(), duration, float(distance or 0)])
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class LoadedValuesMixin:
+    """Remember the values a row was loaded with so saves can tell what changed."""
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
+    def loaded_value(self, field_name):
+        return getattr(self, '_loaded_values', {}).get(field_name)
 
-class User(models.Model):
+    def remember_loaded_values(self):
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
+
+
+class User(LoadedValuesMixin, models.Model):
     """User model for OctoFit tracker."""
     name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
-    team_id = models.IntegerField(null=True, blank=True)
+    team_id = models.IntegerField(null=True, blank=True, db_index=True)
     role = models.CharField(max_length=100, default='member')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'users'
@@ -15,12 +54,17 @@ class User(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self.remember_loaded_values()
+
 
 class Team(models.Model):
     """Team model for organizing users."""
     name = models.CharField(max_length=200)
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'teams'
@@ -29,15 +73,21 @@ class Team(models.Model):
         return self.name
 
 
-class Activity(models.Model):
+class Activity(LoadedValuesMixin, models.Model):
     """Activity model for tracking user workouts."""
-    user_id = models.IntegerField()
+    user_id = models.IntegerField(db_index=True)
+    # Copied from the User at write time so reads never need a join.
+    user_name = models.CharField(max_length=200, blank=True)
+    team_id = models.IntegerField(null=True, blank=True, db_index=True)
     activity_type = models.CharField(max_length=100)
     duration = models.IntegerField(help_text='Duration in minutes')
     calories = models.IntegerField(help_text='Calories burned')
     distance = models.FloatField(default=0.0, help_text='Distance in kilometers')
     date = models.DateTimeField()
     notes = models.TextField(blank=True)
+    # activity_content_hash() of CONTENT_FIELDS; unique, so a resent workout is never stored twice.
+    content_hash = models.CharField(max_length=64, unique=True, null=True, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'activities'
@@ -46,6 +96,25 @@ class Activity(models.Model):
     def __str__(self):
         return f'{self.activity_type} - {self.duration} min'
 
+    def save(self, *args, **kwargs):
+        user_changed = not self._state.adding and self.user_id != self.loaded_value('user_id')
+        if not self.user_name or user_changed:
+            self.denormalize_user()
+        self.content_hash = activity_content_hash(**{name: getattr(self, name) for name in CONTENT_FIELDS})
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(update_fields) & set(CONTENT_FIELDS):
+            kwargs['update_fields'] = {*update_fields, 'content_hash'}
+        super().save(*args, **kwargs)
+        self.remember_loaded_values()
+
+    def denormalize_user(self):
+        """Copy the owning user's name and team onto this activity."""
+        user = User.objects.filter(id=self.user_id).values('name', 'team_id').first()
+        if user is None:
+            self.user_name, self.team_id = 'Unknown User', None
+        else:
+            self.user_name, self.team_id = user['name'], user['team_id']
+
 
 class Leaderboard(models.Model):
     """Leaderboard model for tracking team rankings."""
@@ -80,6 +149,7 @@ class Workout(models.Model):
     activity_type = models.CharField(max_length=100)
     calories_estimate = models.IntegerField(help_text='Estimated calories burned')
     instructions = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'workouts'
@@ -0,0 +1,74 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connections, migrations
+from pymongo import MongoClient
+
+
+def get_database(alias='default'):
+    """Return the pymongo Database behind a djongo connection."""
+    connection = connections[alias]
+    connection.ensure_connection()
+    return connection.connection
+
+
+def connect(alias='default'):
+    """A pymongo Database on a new client, configured like the djongo connection."""
+    config = settings.DATABASES[alias]
+    return MongoClient(**config.get('CLIENT', {}))[config['NAME']]
+
+
+def migration_database(schema_editor):
+    """The pymongo Database a migration runs against, or ``None`` off djongo."""
+    connection = schema_editor.connection
+    if connection.vendor != 'djongo':
+        return None
+    connection.ensure_connection()
+    return connection.connection
+
+
+def create_indexes(collection, *indexes):
+    """A migration operation building native indexes on ``collection``.
+
+    ``indexes`` are ``(keys, options)`` pairs for ``create_index``. Off
+    djongo (e.g. a SQL test database) there is no collection to index.
+    """
+    def forwards(apps, schema_editor):
+        db = migration_database(schema_editor)
+        if db is not None:
+            for keys, options in indexes:
+                db[collection].create_index(keys, **options)
+    return migrations.RunPython(forwards, migrations.RunPython.noop)
+
+
+class MongoRepository:
+    """Base class binding a repository to one collection."""
+    model = None
+    collection_name = None
+
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = get_database()
+        return self._db
+
+    @property
+    def collection(self):
+        return self.db[self.collection_name or self.model._meta.db_table]
+
+
+def to_python(document):
+    """Make a raw Mongo document look like a row loaded through the ORM."""
+    document.pop('_id', None)
+    for key, value in document.items():
+        if isinstance(value, datetime) and value.tzinfo is None:
+            document[key] = value.replace(tzinfo=timezone.utc)
+    return document
+
+
+def estimated_count(model):
+    """Document count for a model's collection taken from collection metadata."""
+    return get_database()[model._meta.db_table].estimated_document_count()
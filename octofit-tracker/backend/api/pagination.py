@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import PageNumberPagination
+
+from .mongo import estimated_count
+
+
+class StandardPagination(PageNumberPagination):
+    """Page-number pagination with a client-adjustable page size."""
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that reads collection metadata instead of counting huge tables.
+
+    An exact ``count()`` through djongo walks the whole collection. For an
+    unfiltered queryset over a collection whose metadata estimate is at least
+    ``OCTOFIT_ESTIMATED_COUNT_THRESHOLD`` documents, the estimate is used and
+    ``count_is_estimated`` is set. Small or filtered result sets are counted
+    exactly.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_is_estimated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_count(queryset.model)
+            if estimate >= settings.OCTOFIT_ESTIMATED_COUNT_THRESHOLD:
+                self.count_is_estimated = True
+                return estimate
+        return super().count
+
+
+class EstimatedCountPagination(StandardPagination):
+    """Standard pagination whose responses say whether ``count`` is an estimate."""
+    django_paginator_class = EstimatedCountPaginator
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        response.data['count_is_estimated'] = self.page.paginator.count_is_estimated
+        return response
@@ -0,0 +1,201 @@
+"""Monthly partitions of the activities collection.
+
+Every activity is also written to ``activities_YYYY_MM`` for the month of
+its ``date``. Date-bounded reads are routed only to the partitions whose
+month overlaps the requested range, and reads spanning several partitions
+are merged newest first with a k-way merge. The ``activity_partitions``
+registry records which partitions exist and whether they are still
+attached; detached partitions are renamed out of the way, no longer routed
+to, and no longer written to.
+
+Partitions are copies: the base ``activities`` collection keeps every live
+activity and is the fallback for any read. Storage is reclaimed from it
+by retention, or by ``manage_partitions --retain``, which detaches old
+months through :func:`api.retention.detach_month` so that their
+activities leave the base collection and live on in rollups, with the raw
+documents archived in the detached partition.
+
+Reads are only routed to partitions once ``manage_partitions --backfill``
+has copied the activities stored before partitioning into them and left
+its marker in the registry, and only for ranges that overlap no detached
+month. Any other read goes to the base collection, which always holds
+every activity.
+"""
+import heapq
+from datetime import datetime, timezone
+from itertools import islice
+
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+
+from .models import Activity
+from .mongo import MongoRepository
+
+PARTITION_PREFIX = 'activities_'
+DETACHED_PREFIX = 'detached_activities_'
+BACKFILL_MARKER = 'backfilled'
+
+
+def to_utc(moment):
+    """Naive UTC datetime, the form pymongo hands back and compares against."""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def month_start(moment):
+    return to_utc(moment).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(moment):
+    return f'{PARTITION_PREFIX}{month_start(moment):%Y_%m}'
+
+
+def overlaps(month, start=None, end=None):
+    """Whether ``month`` (a month start) overlaps the naive UTC range ``[start, end)``."""
+    return (end is None or month < end) and (start is None or add_months(month, 1) > start)
+
+
+def activity_document(activity):
+    document = {field.attname: getattr(activity, field.attname) for field in Activity._meta.concrete_fields}
+    document['date'] = to_utc(document['date'])
+    return document
+
+
+class ActivityPartitions(MongoRepository):
+    """Registry, write path and query router for monthly activity partitions."""
+    collection_name = 'activity_partitions'
+
+    def __init__(self, db=None):
+        super().__init__(db)
+        self._states = None
+
+    def attached(self):
+        """Registry entries of attached partitions, oldest month first."""
+        return list(self.collection.find({'state': 'attached'}, {'_id': 0}).sort('month', ASCENDING))
+
+    def create(self, month):
+        """Create (idempotently) the partition for ``month`` with its indexes."""
+        month = month_start(month)
+        name = partition_name(month)
+        partition = self.db[name]
+        partition.create_index('id', unique=True)
+        partition.create_index([('user_id', ASCENDING), ('date', DESCENDING)])
+        partition.create_index([('date', DESCENDING)])
+        self.collection.update_one(
+            {'name': name},
+            {'$setOnInsert': {'name': name, 'month': month, 'state': 'attached'}},
+            upsert=True,
+        )
+        if self._states is not None:
+            self._states.setdefault(name, 'attached')
+        return name
+
+    def detach(self, month):
+        """Stop routing to ``month``'s partition and rename it aside."""
+        name = partition_name(month)
+        if name in self.db.list_collection_names():
+            self.db[name].rename(name.replace(PARTITION_PREFIX, DETACHED_PREFIX, 1))
+        self.collection.update_one(
+            {'name': name}, {'$set': {'state': 'detached'}, '$setOnInsert': {'month': month_start(month)}}, upsert=True
+        )
+        if self._states is not None:
+            self._states[name] = 'detached'
+        return name
+
+    def mark_backfilled(self):
+        """Record that every activity stored so far has been copied into its partition."""
+        self.collection.update_one(
+            {'name': BACKFILL_MARKER},
+            {'$set': {'state': 'marker', 'at': to_utc(datetime.now(timezone.utc))}},
+            upsert=True,
+        )
+
+    def covers(self, start=None, end=None):
+        """Whether the attached partitions hold every activity dated in ``[start, end)``."""
+        start = to_utc(start) if start else None
+        end = to_utc(end) if end else None
+        entries = list(self.collection.find({'$or': [{'name': BACKFILL_MARKER}, {'state': 'detached'}]}))
+        if not any(entry['name'] == BACKFILL_MARKER for entry in entries):
+            return False
+        return not any(
+            overlaps(entry['month'], start, end) for entry in entries if entry['state'] == 'detached'
+        )
+
+    def _partition_for(self, moment):
+        """The attached partition for ``moment``, created on demand; None once detached."""
+        if self._states is None:
+            self._states = {entry['name']: entry['state'] for entry in self.collection.find()}
+        name = partition_name(moment)
+        if name not in self._states:
+            self.create(moment)
+        return self.db[name] if self._states[name] == 'attached' else None
+
+    def write(self, activity, previous_date=None):
+        """Store an activity in its month, moving it if its date changed months."""
+        if previous_date is not None and partition_name(previous_date) != partition_name(activity.date):
+            self.remove(activity.id, previous_date)
+        partition = self._partition_for(activity.date)
+        if partition is not None:
+            partition.replace_one({'id': activity.id}, activity_document(activity), upsert=True)
+
+    def write_many(self, documents):
+        """Bulk upsert raw activity documents into their partitions."""
+        by_partition = {}
+        for doc in documents:
+            doc.pop('_id', None)
+            by_partition.setdefault(partition_name(doc['date']), []).append(doc)
+        written = 0
+        for docs in by_partition.values():
+            partition = self._partition_for(docs[0]['date'])
+            if partition is not None:
+                partition.bulk_write(
+                    [ReplaceOne({'id': doc['id']}, doc, upsert=True) for doc in docs], ordered=False
+                )
+                written += len(docs)
+        return written
+
+    def update_many(self, activities, fields):
+        """``$set`` ``fields`` on the partition copies of ``activities`` (``id`` and ``date`` dicts)."""
+        by_partition = {}
+        for activity in activities:
+            by_partition.setdefault(partition_name(activity['date']), []).append(activity['id'])
+        for name, ids in by_partition.items():
+            self.db[name].update_many({'id': {'$in': ids}}, {'$set': fields})
+
+    def remove(self, activity_id, date):
+        self.db[partition_name(date)].delete_one({'id': activity_id})
+
+    def route(self, start=None, end=None):
+        """Names of attached partitions whose month overlaps ``[start, end)``."""
+        start = to_utc(start) if start else None
+        end = to_utc(end) if end else None
+        return [entry['name'] for entry in self.attached() if overlaps(entry['month'], start, end)]
+
+    def find(self, query=None, start=None, end=None, limit=None):
+        """Activities matching ``query`` in ``[start, end)``, newest first across partitions."""
+        query = dict(query or {})
+        date_range = {}
+        if start:
+            date_range['$gte'] = to_utc(start)
+        if end:
+            date_range['$lt'] = to_utc(end)
+        if date_range:
+            query['date'] = date_range
+        cursors = []
+        for name in self.route(start, end):
+            cursor = self.db[name].find(query).sort('date', DESCENDING)
+            cursors.append(cursor.limit(limit) if limit else cursor)
+        merged = heapq.merge(*cursors, key=lambda doc: doc['date'], reverse=True)
+        return list(islice(merged, limit)) if limit else list(merged)
+
+    def reset(self):
+        """Drop every attached partition, e.g. before repopulating from the base table."""
+        for entry in self.attached():
+            self.db[entry['name']].drop()
+        self.collection.delete_many({'$or': [{'state': 'attached'}, {'name': BACKFILL_MARKER}]})
+        self._states = None
@@ -0,0 +1,93 @@
+"""On-demand cProfile runs around single API requests.
+
+A request is profiled when it carries ``?profile`` from a staff session or
+an ``X-Octofit-Profile`` header signed with the project's secret key (see
+the ``profile_token`` command). The whole response cycle is profiled,
+including djongo's SQL translation and DRF rendering. Each run leaves a
+``.prof`` file, loadable with ``pstats`` or snakeviz, and a ``.txt``
+summary of the top functions by cumulative time in
+``OCTOFIT_PROFILING['directory']``; only the newest ``max_profiles`` runs
+are kept. The response names the run in its ``X-Profile`` header.
+
+cProfile allows one active profiler per process, so a profiling request
+that arrives while another is running is served unprofiled.
+"""
+import cProfile
+import io
+import pstats
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.utils import timezone
+
+HEADER = 'HTTP_X_OCTOFIT_PROFILE'
+QUERY_PARAM = 'profile'
+SALT = 'api.profiling'
+
+_lock = threading.Lock()
+
+
+def make_token(label='profile'):
+    """A header value that enables profiling until it expires."""
+    return signing.TimestampSigner(salt=SALT).sign(label)
+
+
+def requested_label(request):
+    """The label of an authorized profiling request, or ``None``."""
+    token = request.META.get(HEADER)
+    if token:
+        try:
+            return signing.TimestampSigner(salt=SALT).unsign(
+                token, max_age=settings.OCTOFIT_PROFILING['token_max_age']
+            )
+        except signing.BadSignature:
+            return None
+    if QUERY_PARAM in request.GET:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return user.get_username()
+    return None
+
+
+def slug(text):
+    return re.sub(r'[^A-Za-z0-9]+', '-', text).strip('-')[:60] or 'root'
+
+
+def profile(func, request, label):
+    """Call ``func(request)`` under cProfile and save the run; returns ``(response, name)``."""
+    if not _lock.acquire(blocking=False):
+        return func(request), None
+    try:
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        response = profiler.runcall(func, request)
+        elapsed = time.perf_counter() - started
+    finally:
+        _lock.release()
+    return response, save(profiler, request, label, elapsed)
+
+
+def save(profiler, request, label, elapsed):
+    options = settings.OCTOFIT_PROFILING
+    directory = Path(options['directory'])
+    directory.mkdir(parents=True, exist_ok=True)
+    name = '-'.join((
+        timezone.now().strftime('%Y%m%dT%H%M%S%f'), request.method.lower(), slug(request.path), slug(label)
+    ))
+    profiler.dump_stats(directory / f'{name}.prof')
+
+    summary = io.StringIO()
+    summary.write(f'{request.method} {request.get_full_path()} ({label}): {elapsed * 1000:.1f} ms\n')
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(options['top_functions'])
+    (directory / f'{name}.txt').write_text(summary.getvalue())
+
+    runs = sorted(directory.glob('*.prof'))
+    for stale in runs[:-options['max_profiles']]:
+        stale.unlink(missing_ok=True)
+        stale.with_suffix('.txt').unlink(missing_ok=True)
+    return name
@@ -0,0 +1,72 @@
+"""Background propagation of user changes onto denormalized activity fields."""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .changes import ChangeLogRepository
+from .models import User, Activity
+from .partitions import ActivityPartitions, to_utc
+from .repositories import TeamStatsRepository
+from .streaks import ActivityStreaks
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def propagate_user(user_id, batch_size=None):
+    """Rewrite ``user_name``/``team_id`` on a user's activities in bounded batches."""
+    batch_size = batch_size or settings.OCTOFIT_PROPAGATION_BATCH_SIZE
+    user = User.objects.filter(id=user_id).values('name', 'team_id').first()
+    if user is None:
+        return 0
+    activity_ids = list(Activity.objects.filter(user_id=user_id).values_list('id', flat=True))
+    team_stats = TeamStatsRepository()
+    streaks = ActivityStreaks(team_stats.db)
+    changes = ChangeLogRepository(team_stats.db)
+    partitions = ActivityPartitions(team_stats.db)
+    updated = 0
+    for start in range(0, len(activity_ids), batch_size):
+        batch = activity_ids[start:start + batch_size]
+        activities = list(Activity.objects.filter(id__in=batch).values(
+            'id', 'team_id', 'calories', 'duration', 'distance', 'date'
+        ))
+        for activity in activities:
+            if activity['team_id'] != user['team_id']:
+                team_stats.add_activity(activity, sign=-1)
+                team_stats.add_activity(dict(activity, team_id=user['team_id']))
+                streaks.move_team(activity, user['team_id'])
+        now = timezone.now()
+        updated += Activity.objects.filter(id__in=batch).update(
+            user_name=user['name'], team_id=user['team_id'], updated_at=now
+        )
+        # A queryset update sends no post_save, so the partition copies are rewritten here.
+        if settings.OCTOFIT_ACTIVITY_PARTITIONING:
+            partitions.update_many(activities, {
+                'user_name': user['name'], 'team_id': user['team_id'], 'updated_at': to_utc(now),
+            })
+        changes.record(Activity, batch)
+    return updated
+
+
+def _run(user_id):
+    try:
+        propagate_user(user_id)
+    except Exception:
+        logger.exception('Propagating user %s to activities failed', user_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_user_propagation(user_id):
+    """Queue propagation for after the current transaction commits."""
+    global _executor
+    if not settings.OCTOFIT_PROPAGATE_IN_BACKGROUND:
+        transaction.on_commit(lambda: propagate_user(user_id))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='octofit-propagate')
+    transaction.on_commit(lambda: _executor.submit(_run, user_id))
@@ -0,0 +1,243 @@
+"""Slow query log: ORM statements with the Mongo commands djongo runs for them.
+
+While an API request is served, :class:`~api.middleware.SlowQueryMiddleware`
+wraps the database connection so every SQL statement is timed, and a
+pymongo command listener times every command sent to Mongo. djongo
+translates a statement when it is executed but runs the resulting
+``find`` or ``aggregate`` lazily as rows are fetched, so a command issued
+from djongo's frames belongs to the thread's latest statement; other
+commands (the native repositories) stand on their own.
+
+A statement whose execution plus fetch commands take at least
+``threshold_ms``, or a standalone command that does, is kept with
+probability ``sample_rate``, at most ``max_per_request`` per request. The
+kept entries are written to ``slow_queries`` when the request ends and the
+collection is trimmed to ``max_entries``. Each entry carries a shape, the
+statement or commands with literals blanked out, and the
+``slow_queries`` command ranks shapes by total, mean or max time.
+"""
+import hashlib
+import json
+import logging
+import random
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from pymongo import DESCENDING, monitoring
+from pymongo.errors import PyMongoError
+
+from .mongo import MongoRepository
+from .partitions import to_utc
+
+# Handshakes, auth and session bookkeeping say nothing about a query.
+IGNORED_COMMANDS = {'hello', 'ismaster', 'isMaster', 'saslStart', 'saslContinue', 'endSessions', 'ping'}
+NOISE_KEYS = {'lsid', '$db', '$clusterTime', '$readPreference', 'txnNumber', 'autocommit'}
+MAX_COMMANDS_PER_STATEMENT = 10
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+_installed = False
+
+
+def current():
+    return getattr(_state, 'recorder', None)
+
+
+def install():
+    """Register the command listener; must run before the first Mongo client is created."""
+    global _installed
+    if settings.OCTOFIT_SLOW_QUERIES['enabled'] and not _installed:
+        monitoring.register(SlowCommandListener())
+        _installed = True
+
+
+def sql_shape(sql):
+    sql = re.sub(r'\s+', ' ', sql).strip()
+    sql = re.sub(r'\(%s(?:, %s)+\)', '(%s, ...)', sql)
+    sql = re.sub(r"'(?:[^']|'')*'", '?', sql)
+    return re.sub(r'\b\d+(?:\.\d+)?\b', '?', sql)
+
+
+def value_shape(value):
+    """``value`` with every leaf blanked and every list reduced to its first element."""
+    if isinstance(value, dict):
+        return {key: value_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [value_shape(value[0])] if value else []
+    return '?'
+
+
+def describe(event, elapsed_ms, max_chars):
+    """A loggable summary of one command's started event."""
+    name = event.command_name
+    body = {key: value for key, value in event.command.items() if key not in NOISE_KEYS}
+    target = body.pop(name, None)
+    collection = target if isinstance(target, str) else body.get('collection')
+    if 'documents' in body:
+        body['documents'] = len(body['documents'])
+    text = json.dumps(body, default=str, sort_keys=True)
+    return {
+        'command': name,
+        'collection': collection,
+        'body': text if len(text) <= max_chars else text[:max_chars] + '...',
+        'shape': f'{name} {collection} {json.dumps(value_shape(body), sort_keys=True)}',
+        'elapsed_ms': round(elapsed_ms, 3),
+    }
+
+
+def from_djongo():
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get('__name__', '').startswith('djongo.'):
+            return True
+        frame = frame.f_back
+    return False
+
+
+class Recorder:
+    """Slow query bookkeeping for the request being served on this thread."""
+
+    def __init__(self, options):
+        self.options = options
+        self.statement = None
+        self.pending = {}
+        self.entries = []
+
+    def execute(self, execute, sql, params, many, context):
+        """``connection.execute_wrapper`` hook timing one statement."""
+        self.close_statement()
+        statement = {'sql': sql, 'commands': [], 'executed': False, 'fetch_ms': 0.0}
+        self.statement = statement
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            statement['execute_ms'] = (time.perf_counter() - started) * 1000
+            statement['executed'] = True
+
+    def command(self, event, orm, elapsed_ms):
+        statement = self.statement
+        if orm and statement is not None:
+            if len(statement['commands']) < MAX_COMMANDS_PER_STATEMENT:
+                statement['commands'].append((event, elapsed_ms))
+            if statement['executed']:
+                statement['fetch_ms'] += elapsed_ms
+        elif elapsed_ms >= self.options['threshold_ms']:
+            self.keep(None, [(event, elapsed_ms)], elapsed_ms)
+
+    def close_statement(self):
+        statement, self.statement = self.statement, None
+        if statement is None or not statement['executed']:
+            return
+        elapsed_ms = statement['execute_ms'] + statement['fetch_ms']
+        if elapsed_ms >= self.options['threshold_ms']:
+            self.keep(statement['sql'], statement['commands'], elapsed_ms)
+
+    def keep(self, sql, commands, elapsed_ms):
+        if len(self.entries) >= self.options['max_per_request']:
+            return
+        if random.random() >= self.options['sample_rate']:
+            return
+        commands = [describe(event, ms, self.options['max_command_chars']) for event, ms in commands]
+        shape = sql_shape(sql) if sql is not None else ' | '.join(command['shape'] for command in commands)
+        self.entries.append({
+            'at': to_utc(timezone.now()),
+            'sql': sql,
+            'commands': commands,
+            'elapsed_ms': round(elapsed_ms, 3),
+            'shape': shape,
+            'shape_id': hashlib.md5(shape.encode()).hexdigest()[:16],
+        })
+
+
+def start(options):
+    recorder = Recorder(options)
+    _state.recorder = recorder
+    return recorder
+
+
+def finish(recorder, view=None):
+    """Close the last statement and write the request's slow entries, tagged with ``view``."""
+    recorder.close_statement()
+    _state.recorder = None
+    if not recorder.entries:
+        return
+    for entry in recorder.entries:
+        entry['view'] = view
+    try:
+        SlowQueryRepository().add(recorder.entries, recorder.options['max_entries'])
+    except PyMongoError:
+        # The log is best effort; never fail the request over it.
+        logger.warning('Could not write %d slow query entries', len(recorder.entries), exc_info=True)
+
+
+class SlowCommandListener(monitoring.CommandListener):
+    """Times Mongo commands for the request recorder on the calling thread."""
+
+    def started(self, event):
+        recorder = current()
+        if recorder is not None and event.command_name not in IGNORED_COMMANDS:
+            recorder.pending[event.request_id] = (event, from_djongo())
+
+    def succeeded(self, event):
+        self.finished(event)
+
+    def failed(self, event):
+        self.finished(event)
+
+    def finished(self, event):
+        recorder = current()
+        if recorder is None:
+            return
+        started = recorder.pending.pop(event.request_id, None)
+        if started is not None:
+            started_event, orm = started
+            recorder.command(started_event, orm, event.duration_micros / 1000)
+
+
+class SlowQueryRepository(MongoRepository):
+    """Sampled slow statements; its indexes are created by migration 0012."""
+    collection_name = 'slow_queries'
+
+    def ensure_indexes(self):
+        self.collection.create_index([('at', DESCENDING)])
+        self.collection.create_index('shape_id')
+
+    def add(self, entries, max_entries):
+        """Insert ``entries`` and drop the oldest beyond ``max_entries``."""
+        self.collection.insert_many(entries, ordered=False)
+        if self.collection.estimated_document_count() <= max_entries:
+            return
+        boundary = list(self.collection.find({}, {'at': 1}).sort('at', DESCENDING).skip(max_entries).limit(1))
+        if boundary:
+            self.collection.delete_many({'at': {'$lte': boundary[0]['at']}})
+
+    def worst_shapes(self, limit=10, sort='total_ms', since=None):
+        """Per-shape count and total/mean/max time, with one example and the calling views."""
+        pipeline = [{'$match': {'at': {'$gte': to_utc(since)}}}] if since else []
+        pipeline += [
+            {'$sort': {'elapsed_ms': DESCENDING}},
+            {'$group': {
+                '_id': '$shape_id',
+                'shape': {'$first': '$shape'},
+                'count': {'$sum': 1},
+                'total_ms': {'$sum': '$elapsed_ms'},
+                'max_ms': {'$max': '$elapsed_ms'},
+                'sql': {'$first': '$sql'},
+                'commands': {'$first': '$commands'},
+                'views': {'$addToSet': '$view'},
+                'last_at': {'$max': '$at'},
+            }},
+        ]
+        rows = list(self.collection.aggregate(pipeline))
+        for row in rows:
+            row['shape_id'] = row.pop('_id')
+            row['mean_ms'] = row['total_ms'] / row['count']
+            row['views'] = sorted(view for view in row['views'] if view)
+        rows.sort(key=lambda row: row[sort], reverse=True)
+        return rows[:limit]
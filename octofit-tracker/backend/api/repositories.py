@@ -0,0 +1,441 @@
+"""Native pymongo access for the hottest read paths.
+
+Going through the ORM means Django builds SQL, djongo re-parses it with
+``sqlparse`` and only then talks to Mongo. The repositories below skip that
+round of translation and return plain dicts keyed by model field names, so
+they can be handed straight to the serializers in ``api/serializers.py``.
+"""
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING, ReplaceOne
+from pymongo.errors import DuplicateKeyError
+
+from .models import User, Team, Activity, Leaderboard
+from .mongo import MongoRepository, to_python
+from .partitions import ActivityPartitions, to_utc
+
+
+class UserRepository(MongoRepository):
+    model = User
+
+    def all(self, limit=None):
+        """Every user in id order, or the first ``limit``."""
+        cursor = self.collection.find().sort('id', ASCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [to_python(doc) for doc in cursor]
+
+    def get_many(self, user_ids):
+        """Fetch every user in ``user_ids`` with a single ``$in`` query."""
+        cursor = self.collection.find({'id': {'$in': list(user_ids)}}).sort('id', ASCENDING)
+        return [to_python(doc) for doc in cursor]
+
+
+class TeamRepository(MongoRepository):
+    model = Team
+
+    def all(self):
+        return [to_python(doc) for doc in self.collection.find().sort('id', ASCENDING)]
+
+    def names(self, team_ids):
+        """``{id: name}`` for the teams in ``team_ids``, in one ``$in`` query."""
+        cursor = self.collection.find({'id': {'$in': list(team_ids)}}, {'_id': 0, 'id': 1, 'name': 1})
+        return {doc['id']: doc['name'] for doc in cursor}
+
+
+class ActivityRepository(MongoRepository):
+    model = Activity
+
+    def list_for_user(self, user_id, limit=None, start=None, end=None):
+        """Return a user's activities in ``[start, end)``, newest first."""
+        return self.find({'user_id': user_id}, limit=limit, start=start, end=end)
+
+    def find(self, query=None, limit=None, start=None, end=None):
+        """Newest-first activities; date-bounded reads go to the overlapping partitions when they cover the range."""
+        if (start or end) and settings.OCTOFIT_ACTIVITY_PARTITIONING:
+            partitions = ActivityPartitions(self.db)
+            if partitions.covers(start, end):
+                docs = partitions.find(query, start=start, end=end, limit=limit)
+                return [to_python(doc) for doc in docs]
+        query = dict(query or {})
+        if start or end:
+            query['date'] = {}
+            if start:
+                query['date']['$gte'] = to_utc(start)
+            if end:
+                query['date']['$lt'] = to_utc(end)
+        cursor = self.collection.find(query).sort('date', DESCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        return [to_python(doc) for doc in cursor]
+
+    def totals_for_users(self, user_ids):
+        """Activity totals for a set of users, computed in one grouped aggregation."""
+        rows = self.collection.aggregate([
+            {'$match': {'user_id': {'$in': list(user_ids)}}},
+            {'$group': {
+                '_id': '$user_id',
+                'activity_count': {'$sum': 1},
+                'total_calories': {'$sum': '$calories'},
+                'total_duration': {'$sum': '$duration'},
+                'total_distance': {'$sum': '$distance'},
+            }},
+        ])
+        totals = {user_id: {
+            'activity_count': 0, 'total_calories': 0, 'total_duration': 0, 'total_distance': 0,
+        } for user_id in user_ids}
+        for row in rows:
+            totals[row.pop('_id')] = row
+        for user_id, compacted in ActivityRollupRepository(self.db).totals_by('user_id', user_ids).items():
+            for key, value in compacted.items():
+                totals[user_id][key] += value
+        return totals
+
+
+class ActivityRollupRepository(MongoRepository):
+    """Per-user, per-day, per-type aggregates of activities compacted by retention.
+
+    Each rollup lists the compaction batches folded into it but not yet
+    deleted from ``activities`` (``batches``), which makes folding a batch
+    twice a no-op.
+    """
+    collection_name = 'activity_rollups'
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [('user_id', ASCENDING), ('day', ASCENDING), ('activity_type', ASCENDING)], unique=True
+        )
+        self.collection.create_index('team_id')
+        self.collection.create_index('batches')
+
+    def find_many(self, keys):
+        """Existing rollups for ``(user_id, day, activity_type)`` keys, in one query."""
+        if not keys:
+            return {}
+        query = {'$or': [
+            {'user_id': user_id, 'day': day, 'activity_type': activity_type}
+            for user_id, day, activity_type in keys
+        ]}
+        return {
+            (doc['user_id'], doc['day'], doc['activity_type']): doc for doc in self.collection.find(query)
+        }
+
+    def fold(self, key, activities, batch):
+        """Add ``activities`` (raw documents for one key) into that key's rollup, once per ``batch``."""
+        user_id, day, activity_type = key
+        latest = max(activities, key=lambda doc: doc['id'])
+        try:
+            self.collection.update_one(
+                {'user_id': user_id, 'day': day, 'activity_type': activity_type, 'batches': {'$ne': batch}},
+                {
+                    '$inc': {
+                        'activity_count': len(activities),
+                        'total_duration': sum(doc['duration'] for doc in activities),
+                        'total_calories': sum(doc['calories'] for doc in activities),
+                        'total_distance': sum(doc.get('distance') or 0 for doc in activities),
+                    },
+                    '$max': {
+                        'max_calories': max(doc['calories'] for doc in activities),
+                        'max_distance': max(doc.get('distance') or 0 for doc in activities),
+                    },
+                    '$set': {'team_id': latest.get('team_id'), 'user_name': latest.get('user_name', '')},
+                    '$push': {'batches': batch},
+                },
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # The rollup exists and already lists ``batch``.
+            pass
+
+    def release(self, batches):
+        """Forget ``batches`` once their activities are deleted."""
+        self.collection.update_many({'batches': {'$in': list(batches)}}, {'$pull': {'batches': {'$in': list(batches)}}})
+
+    def totals_by(self, field, values=None):
+        """Compacted activity totals grouped by ``user_id`` or ``team_id``."""
+        match = {field: {'$in': list(values)}} if values is not None else {field: {'$ne': None}}
+        rows = self.collection.aggregate([
+            {'$match': match},
+            {'$group': {
+                '_id': '$' + field,
+                'activity_count': {'$sum': '$activity_count'},
+                'total_calories': {'$sum': '$total_calories'},
+                'total_duration': {'$sum': '$total_duration'},
+                'total_distance': {'$sum': '$total_distance'},
+            }},
+        ])
+        return {row.pop('_id'): row for row in rows}
+
+
+class LeaderboardRepository(MongoRepository):
+    model = Leaderboard
+
+    def top(self, limit):
+        """Return the ``limit`` highest scoring leaderboard entries."""
+        cursor = self.collection.find().sort('total_points', DESCENDING).limit(limit)
+        return [to_python(doc) for doc in cursor]
+
+
+class TeamStatsRepository(MongoRepository):
+    """Per-team counters maintained on every user and activity write.
+
+    Reading a team's totals is a single document fetch no matter how many
+    activities the team has logged. ``rebuild`` recomputes every counter
+    from scratch with one grouped aggregation per source collection. The
+    unique ``team_id`` index (migration 0006) makes each ``$inc`` upsert a
+    point write and keeps racing first writes from splitting a team.
+    """
+    collection_name = 'team_stats'
+    counters = ('member_count', 'activity_count', 'total_calories', 'total_duration', 'total_distance')
+
+    def ensure_indexes(self):
+        self.collection.create_index('team_id', unique=True)
+
+    def empty(self, team_id):
+        return dict({counter: 0 for counter in self.counters}, team_id=team_id)
+
+    def increment(self, team_id, **deltas):
+        if team_id is None:
+            return
+        deltas = {counter: value for counter, value in deltas.items() if value}
+        if deltas:
+            self.collection.update_one({'team_id': team_id}, {'$inc': deltas}, upsert=True)
+
+    def add_activity(self, activity, sign=1):
+        """Fold one activity (a dict or instance) into, or out of, its team's totals."""
+        get = activity.get if isinstance(activity, dict) else activity.__dict__.get
+        self.increment(
+            get('team_id'),
+            activity_count=sign,
+            total_calories=sign * (get('calories') or 0),
+            total_duration=sign * (get('duration') or 0),
+            total_distance=sign * (get('distance') or 0),
+        )
+
+    def get(self, team_id):
+        stats = self.collection.find_one({'team_id': team_id}, {'_id': 0})
+        return stats or self.empty(team_id)
+
+    def get_many(self, team_ids):
+        found = {doc['team_id']: doc for doc in self.collection.find(
+            {'team_id': {'$in': list(team_ids)}}, {'_id': 0}
+        )}
+        return {team_id: found.get(team_id) or self.empty(team_id) for team_id in team_ids}
+
+    def rebuild(self):
+        """Recompute every team's counters from ``users`` and ``activities``."""
+        totals = {}
+        members = self.db[User._meta.db_table].aggregate([
+            {'$match': {'team_id': {'$ne': None}}},
+            {'$group': {'_id': '$team_id', 'member_count': {'$sum': 1}}},
+        ])
+        for row in members:
+            totals.setdefault(row['_id'], self.empty(row['_id']))['member_count'] = row['member_count']
+        activities = self.db[Activity._meta.db_table].aggregate([
+            {'$match': {'team_id': {'$ne': None}}},
+            {'$group': {
+                '_id': '$team_id',
+                'activity_count': {'$sum': 1},
+                'total_calories': {'$sum': '$calories'},
+                'total_duration': {'$sum': '$duration'},
+                'total_distance': {'$sum': '$distance'},
+            }},
+        ])
+        for row in activities:
+            team_id = row.pop('_id')
+            totals.setdefault(team_id, self.empty(team_id)).update(row)
+        for team_id, compacted in ActivityRollupRepository(self.db).totals_by('team_id').items():
+            stats = totals.setdefault(team_id, self.empty(team_id))
+            for key, value in compacted.items():
+                stats[key] += value
+        self.collection.delete_many({'team_id': {'$nin': list(totals)}})
+        if totals:
+            self.collection.bulk_write([
+                ReplaceOne({'team_id': team_id}, stats, upsert=True) for team_id, stats in totals.items()
+            ])
+        return len(totals)
+
+
+class UserStatsRepository(MongoRepository):
+    """Per-user lifetime summary kept current on every activity write.
+
+    Totals and per-type breakdowns are adjusted with ``$inc``. Personal
+    bests are raised with a conditional update and only recomputed from
+    the user's history when the activity holding a best is edited down or
+    deleted. The unique ``user_id`` index (migration 0007) keeps every
+    update a point write and racing first writes to one summary.
+    """
+    collection_name = 'user_stats'
+    totals = ('activity_count', 'total_calories', 'total_duration', 'total_distance')
+    # best name -> (activity field, activity type it is limited to, rollup field)
+    bests = {
+        'longest_run': ('distance', 'running', 'max_distance'),
+        'most_calories': ('calories', None, 'max_calories'),
+    }
+
+    def ensure_indexes(self):
+        self.collection.create_index('user_id', unique=True)
+
+    @staticmethod
+    def type_key(activity_type):
+        return activity_type.lower().replace('.', '_').replace('$', '_')
+
+    @staticmethod
+    def as_dict(activity):
+        return activity if activity is None or isinstance(activity, dict) else activity.__dict__
+
+    def _deltas(self, activity, sign):
+        key = 'by_type.' + self.type_key(activity['activity_type'])
+        deltas = {}
+        for prefix in ('', key + '.'):
+            deltas[prefix + 'activity_count'] = sign
+            deltas[prefix + 'total_calories'] = sign * activity['calories']
+            deltas[prefix + 'total_duration'] = sign * activity['duration']
+            deltas[prefix + 'total_distance'] = sign * (activity.get('distance') or 0)
+        return key, deltas
+
+    def qualifies(self, best, activity):
+        activity_type = self.bests[best][1]
+        return activity_type is None or activity['activity_type'].lower() == activity_type
+
+    def record(self, activity, previous=None):
+        """Apply a write: ``previous`` is the stored row it replaced (or deleted), if any."""
+        activity, previous = self.as_dict(activity), self.as_dict(previous)
+        held = {}
+        if previous is not None:
+            held = self.held_bests(previous['user_id'], previous['id'])
+            self.add(previous, sign=-1)
+        if activity is not None:
+            self.add(activity)
+        for best, value in held.items():
+            field = self.bests[best][0]
+            still_holds = (
+                activity is not None and activity['user_id'] == previous['user_id']
+                and self.qualifies(best, activity) and (activity.get(field) or 0) >= value
+            )
+            if not still_holds:
+                self.recompute_best(previous['user_id'], best)
+
+    def add(self, activity, sign=1):
+        """Fold an activity into, or out of, its user's totals; additions may set a best."""
+        key, deltas = self._deltas(activity, sign)
+        self.collection.update_one(
+            {'user_id': activity['user_id']},
+            {'$inc': deltas, '$set': {key + '.activity_type': activity['activity_type']}},
+            upsert=True,
+        )
+        if sign > 0:
+            for best in self.bests:
+                self.offer_best(best, activity)
+
+    def offer_best(self, best, activity):
+        """Make ``activity`` the holder of ``best`` if it beats the current value."""
+        field = self.bests[best][0]
+        value = activity.get(field) or 0
+        if not self.qualifies(best, activity) or value <= 0:
+            return
+        self.collection.update_one(
+            {'user_id': activity['user_id'], '$or': [
+                {f'bests.{best}': None},
+                {f'bests.{best}.value': {'$lt': value}},
+            ]},
+            {'$set': {f'bests.{best}': {
+                'value': value, 'activity_id': activity['id'], 'date': to_utc(activity['date']),
+            }}},
+        )
+
+    def held_bests(self, user_id, activity_id):
+        """``{best: value}`` for the bests currently held by ``activity_id``."""
+        summary = self.collection.find_one({'user_id': user_id}, {'bests': 1}) or {}
+        return {
+            best: held['value'] for best, held in (summary.get('bests') or {}).items()
+            if held and held.get('activity_id') == activity_id
+        }
+
+    def recompute_best(self, user_id, best):
+        """Find ``best`` again from the user's remaining activities and rollups."""
+        field, activity_type, rollup_field = self.bests[best]
+        activities = Activity.objects.filter(user_id=user_id, **{f'{field}__gt': 0})
+        if activity_type:
+            activities = activities.filter(activity_type__iexact=activity_type)
+        top = activities.order_by(f'-{field}', 'id').values('id', field, 'date').first()
+        candidate = top and {'value': top[field], 'activity_id': top['id'], 'date': to_utc(top['date'])}
+        rollup_query = {'user_id': user_id, rollup_field: {'$gt': 0}}
+        if activity_type:
+            rollup_query['activity_type'] = {'$regex': f'^{activity_type}$', '$options': 'i'}
+        rollup = ActivityRollupRepository(self.db).collection.find_one(
+            rollup_query, sort=[(rollup_field, DESCENDING)]
+        )
+        if rollup and (candidate is None or rollup[rollup_field] > candidate['value']):
+            candidate = {'value': rollup[rollup_field], 'activity_id': None, 'date': rollup['day']}
+        self.collection.update_one({'user_id': user_id}, {'$set': {f'bests.{best}': candidate}})
+
+    def empty(self, user_id):
+        return dict({total: 0 for total in self.totals}, user_id=user_id, by_type={}, bests={})
+
+    def rebuild(self):
+        """Recompute every user's summary from ``activities`` and ``activity_rollups``."""
+        summaries = {}
+        rollups = ActivityRollupRepository(self.db).collection
+        sources = (
+            (self.db[Activity._meta.db_table], {'$sum': 1}, '$calories', '$duration', '$distance'),
+            (rollups, {'$sum': '$activity_count'}, '$total_calories', '$total_duration', '$total_distance'),
+        )
+        for collection, count, calories, duration, distance in sources:
+            rows = collection.aggregate([{'$group': {
+                '_id': {'user_id': '$user_id', 'activity_type': '$activity_type'},
+                'activity_count': count,
+                'total_calories': {'$sum': calories},
+                'total_duration': {'$sum': duration},
+                'total_distance': {'$sum': distance},
+            }}])
+            for row in rows:
+                key = row.pop('_id')
+                summary = summaries.setdefault(key['user_id'], self.empty(key['user_id']))
+                by_type = summary['by_type'].setdefault(
+                    self.type_key(key['activity_type']),
+                    dict({total: 0 for total in self.totals}, activity_type=key['activity_type']),
+                )
+                for total in self.totals:
+                    summary[total] += row[total] or 0
+                    by_type[total] += row[total] or 0
+
+        for best, (field, activity_type, rollup_field) in self.bests.items():
+            match = {field: {'$gt': 0}}
+            if activity_type:
+                match['activity_type'] = {'$regex': f'^{activity_type}$', '$options': 'i'}
+            rows = self.db[Activity._meta.db_table].aggregate([
+                {'$match': match},
+                {'$sort': {field: -1, 'id': 1}},
+                {'$group': {'_id': '$user_id', 'value': {'$first': '$' + field},
+                            'activity_id': {'$first': '$id'}, 'date': {'$first': '$date'}}},
+            ])
+            rollup_match = {rollup_field: {'$gt': 0}}
+            if activity_type:
+                rollup_match['activity_type'] = match['activity_type']
+            compacted = rollups.aggregate([
+                {'$match': rollup_match},
+                {'$sort': {rollup_field: -1}},
+                {'$group': {'_id': '$user_id', 'value': {'$first': '$' + rollup_field},
+                            'date': {'$first': '$day'}}},
+            ])
+            for row in list(compacted) + list(rows):
+                user_id = row.pop('_id')
+                held = summaries[user_id]['bests'].get(best)
+                if held is None or row['value'] >= held['value']:
+                    summaries[user_id]['bests'][best] = dict(row, activity_id=row.get('activity_id'))
+
+        self.collection.delete_many({'user_id': {'$nin': list(summaries)}})
+        if summaries:
+            self.collection.bulk_write([
+                ReplaceOne({'user_id': user_id}, summary, upsert=True) for user_id, summary in summaries.items()
+            ])
+        return len(summaries)
+
+    def get(self, user_id):
+        summary = self.collection.find_one({'user_id': user_id}, {'_id': 0})
+        if summary is None:
+            summary = self.empty(user_id)
+        summary.setdefault('bests', {})
+        for best in self.bests:
+            summary['bests'].setdefault(best, None)
+        return summary
@@ -0,0 +1,160 @@
+"""Compaction of old activities into per-user daily rollups.
+
+Raw ``activities`` documents dated before the cutoff are read in id order,
+folded into ``activity_rollups`` and then deleted, one bounded batch at a
+time. Each batch is first claimed: its documents are marked with a batch
+id (``compaction_batch``), and each rollup lists the batch ids folded into
+it until their documents are deleted. A run interrupted anywhere can
+simply be restarted: claimed documents are folded again under their
+original batch id, which rollups that already hold it skip, and then
+deleted. Whether a document was folded never depends on its id, so an old
+activity edited into an already compacted day is still counted.
+Totals per user and team are preserved, which keeps ``Leaderboard`` points
+and activity counts unchanged.
+
+Monthly partitions (:mod:`api.partitions`) are copies of the base
+collection, so detaching one alone would free nothing. :func:`detach_month`
+detaches the partition, archives the month's raw documents in it and then
+compacts the month out of the base collection like retention does.
+"""
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from bson import BSON
+from django.utils import timezone
+from pymongo import ReplaceOne
+
+from .changes import DELETE, ChangeLogRepository
+from .models import Activity
+from .partitions import (
+    DETACHED_PREFIX, PARTITION_PREFIX, ActivityPartitions, add_months, month_start, partition_name, to_utc,
+)
+from .repositories import ActivityRollupRepository
+
+
+@dataclass
+class CompactionReport:
+    activities: int = 0
+    rollups: int = 0
+    batches: int = 0
+    bytes_removed: int = 0
+    bytes_added: int = 0
+
+    @property
+    def bytes_reclaimed(self):
+        return self.bytes_removed - self.bytes_added
+
+
+def retention_cutoff(days, now=None):
+    """Midnight UTC ``days`` ago, so a calendar day is compacted all at once."""
+    moment = to_utc(now or timezone.now()) - timedelta(days=days)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_key(doc):
+    day = to_utc(doc['date']).replace(hour=0, minute=0, second=0, microsecond=0)
+    return doc['user_id'], day, doc['activity_type']
+
+
+def compact_activities(cutoff, batch_size=1000, max_batches=None, dry_run=False, db=None, start=None):
+    """Fold activities dated before ``cutoff`` (and from ``start``) into rollups and delete them."""
+    rollups = ActivityRollupRepository(db)
+    activities = rollups.db[Activity._meta.db_table]
+    if not dry_run:
+        rollups.ensure_indexes()
+    report = CompactionReport()
+    last_id = 0
+    new_keys = set()
+    while max_batches is None or report.batches < max_batches:
+        # A real run deletes as it goes, so the next batch starts at the front again.
+        query = {'date': {'$lt': cutoff, **({'$gte': start} if start else {})}}
+        if dry_run:
+            query['id'] = {'$gt': last_id}
+        batch = list(activities.find(query).sort('id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+        report.batches += 1
+        report.activities += len(batch)
+        report.bytes_removed += sum(len(BSON.encode(doc)) for doc in batch)
+
+        if not dry_run:
+            claim = uuid.uuid4().hex
+            unclaimed = [doc['id'] for doc in batch if 'compaction_batch' not in doc]
+            if unclaimed:
+                activities.update_many(
+                    {'id': {'$in': unclaimed}, 'compaction_batch': {'$exists': False}},
+                    {'$set': {'compaction_batch': claim}},
+                )
+            for doc in batch:
+                doc.setdefault('compaction_batch', claim)
+
+        groups = defaultdict(list)
+        for doc in batch:
+            groups[rollup_key(doc)].append(doc)
+        existing = rollups.find_many(list(groups))
+        for key, docs in groups.items():
+            if key not in existing and key not in new_keys:
+                new_keys.add(key)
+                report.rollups += 1
+                report.bytes_added += len(BSON.encode(rollup_document(key, docs)))
+            if not dry_run:
+                by_claim = defaultdict(list)
+                for doc in docs:
+                    by_claim[doc['compaction_batch']].append(doc)
+                for claimed, claimed_docs in by_claim.items():
+                    rollups.fold(key, claimed_docs, claimed)
+
+        if not dry_run:
+            ids = [doc['id'] for doc in batch]
+            by_partition = defaultdict(list)
+            for doc in batch:
+                by_partition[partition_name(doc['date'])].append(doc['id'])
+            for name, partition_ids in by_partition.items():
+                rollups.db[name].delete_many({'id': {'$in': partition_ids}})
+            activities.delete_many({'id': {'$in': ids}})
+            ChangeLogRepository(rollups.db).record(Activity, ids, op=DELETE)
+            rollups.release({doc['compaction_batch'] for doc in batch})
+    return report
+
+
+def detach_month(month, batch_size=1000, db=None):
+    """Detach ``month``'s partition and compact its activities out of the base collection.
+
+    The raw documents stay in ``detached_activities_YYYY_MM``: those only in
+    the base collection (written before partitioning) are copied there first.
+    """
+    partitions = ActivityPartitions(db)
+    start = month_start(month)
+    name = partitions.detach(start)
+    archive = partitions.db[name.replace(PARTITION_PREFIX, DETACHED_PREFIX, 1)]
+    source = partitions.db[Activity._meta.db_table]
+    query = {'date': {'$gte': start, '$lt': add_months(start, 1)}}
+    last_id = 0
+    while True:
+        batch = list(source.find({**query, 'id': {'$gt': last_id}}).sort('id', 1).limit(batch_size))
+        if not batch:
+            break
+        last_id = batch[-1]['id']
+        for doc in batch:
+            doc.pop('_id')
+        archive.bulk_write([ReplaceOne({'id': doc['id']}, doc, upsert=True) for doc in batch], ordered=False)
+    return name, compact_activities(add_months(start, 1), batch_size=batch_size, db=partitions.db, start=start)
+
+
+def rollup_document(key, docs):
+    """The shape of a freshly created rollup, used to size dry runs."""
+    user_id, day, activity_type = key
+    return {
+        'user_id': user_id, 'day': day, 'activity_type': activity_type,
+        'team_id': docs[-1].get('team_id'), 'user_name': docs[-1].get('user_name', ''),
+        'activity_count': len(docs),
+        'total_duration': sum(doc['duration'] for doc in docs),
+        'total_calories': sum(doc['calories'] for doc in docs),
+        'total_distance': sum(doc.get('distance') or 0 for doc in docs),
+        'max_calories': max(doc['calories'] for doc in docs),
+        'max_distance': max(doc.get('distance') or 0 for doc in docs),
+        'batches': [],
+    }
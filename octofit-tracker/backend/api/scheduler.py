@@ -0,0 +1,184 @@
+"""A small in-process scheduler for periodic jobs.
+
+Jobs are registered with :func:`register` in the modules listed in
+``JOB_MODULES``, which only the ``run_scheduler`` command imports (through
+:func:`load_jobs`), and run by it with no broker.
+Each run is delayed by a random jitter so several schedulers do not fire
+together, and takes a lease in ``job_leases`` first: a job never
+overlaps itself, whether in this process or in another scheduler. Every
+run's timing and outcome are recorded in ``job_runs``.
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import timedelta
+from importlib import import_module
+
+from django.db import close_old_connections
+from django.utils import timezone
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+from .mongo import MongoRepository
+from .partitions import to_utc
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Job:
+    name: str
+    func: object
+    interval: float
+    jitter: float = 0.1
+    lease: float = None
+
+    def __post_init__(self):
+        # A crashed run's lease lapses by the time the job is next due.
+        if self.lease is None:
+            self.lease = self.interval
+
+    def next_delay(self):
+        """Seconds until the next run: the interval plus up to ``jitter`` of it."""
+        return self.interval * (1 + random.uniform(0, self.jitter))
+
+
+registry = {}
+JOB_MODULES = ('api.jobs',)
+
+
+def register(name, interval, jitter=0.1, lease=None):
+    """Register ``func`` to run every ``interval`` seconds under ``name``."""
+    def decorator(func):
+        registry[name] = Job(name, func, interval, jitter, lease)
+        return func
+    return decorator
+
+
+def load_jobs():
+    """Import the job modules, registering their jobs; returns the registry."""
+    for module in JOB_MODULES:
+        import_module(module)
+    return registry
+
+
+class JobRunRepository(MongoRepository):
+    """Leases and run history of scheduled jobs."""
+    collection_name = 'job_runs'
+
+    @property
+    def leases(self):
+        return self.db['job_leases']
+
+    def ensure_indexes(self):
+        self.leases.create_index('job', unique=True)
+        self.collection.create_index([('job', 1), ('started_at', DESCENDING)])
+
+    def acquire(self, job, owner, seconds):
+        """Take ``job``'s lease unless another owner holds an unexpired one."""
+        now = to_utc(timezone.now())
+        try:
+            self.leases.find_one_and_update(
+                {'job': job, '$or': [{'expires_at': {'$lte': now}}, {'owner': owner}]},
+                {'$set': {'owner': owner, 'expires_at': now + timedelta(seconds=seconds)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def release(self, job, owner):
+        self.leases.update_one({'job': job, 'owner': owner}, {'$set': {'expires_at': to_utc(timezone.now())}})
+
+    def record(self, job, started_at, duration, error=None, result=None):
+        self.collection.insert_one({
+            'job': job,
+            'started_at': to_utc(started_at),
+            'duration_ms': round(duration * 1000, 3),
+            'status': 'failed' if error else 'succeeded',
+            'error': error,
+            'result': result,
+        })
+
+    def summary(self, limit=20):
+        """Run count, failures and mean/max duration per job over its last ``limit`` runs."""
+        rows = {}
+        for job in self.collection.distinct('job'):
+            runs = list(self.collection.find({'job': job}).sort('started_at', DESCENDING).limit(limit))
+            durations = [run['duration_ms'] for run in runs]
+            rows[job] = {
+                'runs': len(runs),
+                'failures': sum(run['status'] == 'failed' for run in runs),
+                'mean_ms': sum(durations) / len(durations),
+                'max_ms': max(durations),
+                'last_started_at': runs[0]['started_at'],
+            }
+        return rows
+
+
+class Scheduler:
+    """Run registered jobs on their intervals until stopped."""
+
+    def __init__(self, jobs=None, workers=4, db=None):
+        self.jobs = list(jobs if jobs is not None else registry.values())
+        self.runs = JobRunRepository(db)
+        self.owner = f'{socket.gethostname()}:{os.getpid()}:{id(self)}'
+        self.stopping = threading.Event()
+        self.running = set()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='octofit-job')
+
+    def run_job(self, job):
+        """Run ``job`` once if its lease is free; returns False if it was skipped."""
+        with self.lock:
+            if job.name in self.running:
+                return False
+            self.running.add(job.name)
+        try:
+            if not self.runs.acquire(job.name, self.owner, job.lease):
+                logger.info('Skipping %s: still running elsewhere', job.name)
+                return False
+            started_at, started = timezone.now(), time.perf_counter()
+            error = result = None
+            try:
+                result = job.func()
+            except Exception as exc:
+                logger.exception('Scheduled job %s failed', job.name)
+                error = repr(exc)
+            finally:
+                self.runs.release(job.name, self.owner)
+                self.runs.record(job.name, started_at, time.perf_counter() - started, error, result)
+                close_old_connections()
+            return True
+        finally:
+            with self.lock:
+                self.running.discard(job.name)
+
+    def run_once(self):
+        """Run every job now, in parallel, and wait for them."""
+        self.runs.ensure_indexes()
+        return dict(zip(
+            (job.name for job in self.jobs), self.pool.map(self.run_job, self.jobs)
+        ))
+
+    def serve(self, run_now=False):
+        """Loop until :meth:`stop`, submitting each job when it falls due."""
+        self.runs.ensure_indexes()
+        now = time.monotonic()
+        due = {job.name: now if run_now else now + job.next_delay() for job in self.jobs}
+        while not self.stopping.is_set():
+            now = time.monotonic()
+            for job in self.jobs:
+                if due[job.name] <= now:
+                    self.pool.submit(self.run_job, job)
+                    due[job.name] = now + job.next_delay()
+            self.stopping.wait(max(0.0, min(due.values()) - time.monotonic()) if due else None)
+        self.pool.shutdown(wait=True)
+
+    def stop(self, *args):
+        self.stopping.set()
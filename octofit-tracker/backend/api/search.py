@@ -0,0 +1,242 @@
+"""In-process full-text search over workouts and activity notes.
+
+Each searchable model gets a tokenized inverted index held in memory. It is
+built lazily from the database the first time it is queried, outside the
+lock that writes take, and swapped in when complete. The save/delete
+signals in ``api/signals.py`` apply this process's writes at once; before
+each query the index also replays the ``/api/changes/`` log past the
+sequence it was built from, so writes made by other workers show up too.
+
+A query only touches the postings of the tokens it matches, and both the
+postings per token (``max_postings``) and the tokens a prefix expands to
+(``max_expansions``) are capped, so its cost is bounded however large the
+collection grows. A token found in more than ``max_postings`` documents,
+like a common activity type, keeps only its highest-weighted postings,
+newest document first among equal weights, while idf still counts every
+document containing it. A posting evicted from a full list is not
+restored when a document above it is removed; the next rebuild does that.
+"""
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+from django.conf import settings
+
+from .changes import DELETE, ChangeLogRepository, TokenExpired, collapse
+from .models import Activity, Workout
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class InvertedIndex:
+    """Token -> {doc_id: weight} postings plus a sorted vocabulary for prefixes."""
+
+    def __init__(self, max_postings=None, max_expansions=None):
+        self.postings = defaultdict(dict)
+        self.doc_freq = defaultdict(int)
+        self.doc_tokens = {}
+        self.vocabulary = []
+        self.max_postings = max_postings
+        self.max_expansions = max_expansions
+        # Min-heaps of (weight, doc_id) for full posting lists; entries go stale lazily.
+        self.weakest = {}
+
+    def __len__(self):
+        return len(self.doc_tokens)
+
+    def add(self, doc_id, weighted_texts):
+        """Index ``doc_id`` from ``(text, boost)`` pairs, replacing any earlier entry."""
+        self.remove(doc_id)
+        weights = defaultdict(float)
+        for text, boost in weighted_texts:
+            for token in tokenize(text):
+                weights[token] += boost
+        for token, weight in weights.items():
+            if not self.doc_freq[token]:
+                insort(self.vocabulary, token)
+            self.doc_freq[token] += 1
+            self.post(token, doc_id, weight)
+        self.doc_tokens[doc_id] = set(weights)
+
+    def post(self, token, doc_id, weight):
+        """Add a posting, evicting the weakest one once the list is over ``max_postings``."""
+        postings = self.postings[token]
+        postings[doc_id] = weight
+        if not self.max_postings or len(postings) <= self.max_postings:
+            return
+        heap = self.weakest.get(token)
+        if heap is None or len(heap) > 2 * self.max_postings:
+            heap = self.weakest[token] = [(weight, doc_id) for doc_id, weight in postings.items()]
+            heapq.heapify(heap)
+        else:
+            heapq.heappush(heap, (weight, doc_id))
+        while len(postings) > self.max_postings:
+            weight, doc_id = heapq.heappop(heap)
+            if postings.get(doc_id) == weight:
+                del postings[doc_id]
+
+    def remove(self, doc_id):
+        for token in self.doc_tokens.pop(doc_id, ()):
+            self.postings[token].pop(doc_id, None)
+            self.doc_freq[token] -= 1
+            if not self.doc_freq[token]:
+                del self.doc_freq[token]
+                self.postings.pop(token, None)
+                self.weakest.pop(token, None)
+                del self.vocabulary[bisect_left(self.vocabulary, token)]
+
+    def expand(self, prefix):
+        """Indexed tokens starting with ``prefix``, at most ``max_expansions`` of them."""
+        start = bisect_left(self.vocabulary, prefix)
+        end = start
+        stop = len(self.vocabulary) if not self.max_expansions else min(
+            len(self.vocabulary), start + self.max_expansions
+        )
+        while end < stop and self.vocabulary[end].startswith(prefix):
+            end += 1
+        return self.vocabulary[start:end]
+
+    def search(self, query, limit=None):
+        """Rank documents matching every query term (as a prefix) by tf-idf."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            for token in self.expand(term):
+                idf = math.log(1 + len(self.doc_tokens) / self.doc_freq[token])
+                for doc_id, weight in self.postings[token].items():
+                    term_scores[doc_id] += weight * idf
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {doc_id: score + term_scores[doc_id]
+                          for doc_id, score in scores.items() if doc_id in term_scores}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return ranked[:limit] if limit else ranked
+
+
+class SearchIndex:
+    """A lazily built, thread-safe inverted index over one model's text fields."""
+
+    def __init__(self, model, boosts):
+        self.model = model
+        self.boosts = boosts
+        self.index = None
+        self.seq = 0
+        self.lock = threading.RLock()
+        self.building = threading.Lock()
+        self.syncing = threading.Lock()
+
+    def _texts(self, values):
+        return [(values[field], boost) for field, boost in self.boosts.items()]
+
+    def build(self):
+        """Scan the collection into a new index and swap it in; writes are never blocked."""
+        options = settings.OCTOFIT_SEARCH
+        # Writes racing the scan are replayed from the change log after the swap.
+        seq = ChangeLogRepository().current()
+        index = InvertedIndex(options['max_postings'], options['max_expansions'])
+        for row in self.model.objects.values('id', *self.boosts).iterator():
+            index.add(row['id'], self._texts(row))
+        with self.lock:
+            self.index, self.seq = index, seq
+        self.sync()
+
+    def sync(self):
+        """Apply the changes other processes logged since this index last caught up."""
+        if not self.syncing.acquire(blocking=False):
+            return
+        try:
+            changes = ChangeLogRepository()
+            table = self.model._meta.db_table
+            has_more = True
+            while has_more:
+                try:
+                    entries, has_more = changes.since(
+                        self.seq, [table], settle_seconds=settings.OCTOFIT_CHANGE_SETTLE_SECONDS
+                    )
+                except TokenExpired:
+                    self.reset()
+                    return
+                if not entries:
+                    return
+                latest = collapse(entries)
+                upserted = [entry['object_id'] for entry in latest if entry['op'] != DELETE]
+                rows = {row['id']: row for row in self.model.objects.filter(id__in=upserted).values('id', *self.boosts)}
+                with self.lock:
+                    if self.index is None:
+                        return
+                    for entry in latest:
+                        row = rows.get(entry['object_id'])
+                        if row is None:
+                            self.index.remove(entry['object_id'])
+                        else:
+                            self.index.add(row['id'], self._texts(row))
+                    self.seq = entries[-1]['seq']
+        finally:
+            self.syncing.release()
+
+    def reset(self):
+        with self.lock:
+            self.index = None
+
+    def update(self, instance):
+        with self.lock:
+            if self.index is not None:
+                values = {field: getattr(instance, field) for field in self.boosts}
+                self.index.add(instance.pk, self._texts(values))
+
+    def remove(self, pk):
+        with self.lock:
+            if self.index is not None:
+                self.index.remove(pk)
+
+    def search(self, query, limit=None):
+        if self.index is not None:
+            self.sync()
+        if self.index is None:
+            with self.building:
+                if self.index is None:
+                    self.build()
+        with self.lock:
+            return self.index.search(query, limit) if self.index is not None else []
+
+    def search_queryset(self, query, limit=None):
+        """Matching objects in rank order, each annotated with ``search_score``."""
+        hits = self.search(query, limit)
+        objects = self.model.objects.in_bulk([doc_id for doc_id, _ in hits])
+        results = []
+        for doc_id, score in hits:
+            if doc_id in objects:
+                objects[doc_id].search_score = score
+                results.append(objects[doc_id])
+        return results
+
+
+indexes = {
+    'workouts': SearchIndex(Workout, {'title': 3.0, 'activity_type': 2.0, 'description': 1.0}),
+    'activities': SearchIndex(Activity, {'notes': 1.0, 'activity_type': 2.0}),
+}
+
+
+def index_for(model):
+    for index in indexes.values():
+        if index.model is model:
+            return index
+    return None
+
+
+def reset_indexes():
+    for index in indexes.values():
+        index.reset()
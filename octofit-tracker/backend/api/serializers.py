@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import CONTENT_FIELDS, User, Team, Activity, Leaderboard, Workout, activity_content_hash
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -15,18 +15,21 @@ class TeamSerializer(serializers.ModelSerializer):
 
 
 class ActivitySerializer(serializers.ModelSerializer):
-    user_name = serializers.SerializerMethodField()
-
     class Meta:
         model = Activity
         fields = '__all__'
-
-    def get_user_name(self, obj):
-        try:
-            user = User.objects.get(id=obj.user_id)
-            return user.name
-        except User.DoesNotExist:
-            return 'Unknown User'
+        # Denormalized from the User on save, never taken from the client.
+        read_only_fields = ('user_name', 'team_id')
+
+    def validate(self, attrs):
+        # New submissions that repeat a stored workout are replays (see api.idempotency);
+        # an edit that turns one activity into a copy of another is an error.
+        if self.instance is not None:
+            fields = {name: attrs.get(name, getattr(self.instance, name)) for name in CONTENT_FIELDS}
+            duplicates = Activity.objects.filter(content_hash=activity_content_hash(**fields))
+            if duplicates.exclude(id=self.instance.id).exists():
+                raise serializers.ValidationError('Another activity already records this workout.')
+        return attrs
 
 
 class LeaderboardSerializer(serializers.ModelSerializer):
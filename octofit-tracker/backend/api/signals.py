@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .changes import DELETE, ChangeLogRepository
+from .models import User, Team, Activity, Leaderboard, Workout
+from .partitions import ActivityPartitions
+from .propagation import schedule_user_propagation
+from .repositories import TeamStatsRepository, UserStatsRepository
+from .search import index_for
+from .streaks import ActivityStreaks, day_number
+
+
+@receiver(pre_save, sender=User)
+def remember_user_changes(sender, instance, **kwargs):
+    """Flag users whose denormalized copies on activities are about to go stale."""
+    instance._previous_team_id = instance.loaded_value('team_id')
+    instance._propagate = not instance._state.adding and (
+        instance.name != instance.loaded_value('name')
+        or instance.team_id != instance._previous_team_id
+    )
+
+
+@receiver(post_save, sender=User)
+def propagate_user_changes(sender, instance, created, **kwargs):
+    if created:
+        TeamStatsRepository().increment(instance.team_id, member_count=1)
+    elif instance.team_id != instance._previous_team_id:
+        team_stats = TeamStatsRepository()
+        team_stats.increment(instance._previous_team_id, member_count=-1)
+        team_stats.increment(instance.team_id, member_count=1)
+    if instance._propagate:
+        schedule_user_propagation(instance.id)
+
+
+@receiver(post_delete, sender=User)
+def count_removed_member(sender, instance, **kwargs):
+    TeamStatsRepository().increment(instance.team_id, member_count=-1)
+
+
+@receiver(post_save, sender=Activity)
+def count_saved_activity(sender, instance, created, **kwargs):
+    team_stats = TeamStatsRepository()
+    if not created and hasattr(instance, '_loaded_values'):
+        team_stats.add_activity(instance._loaded_values, sign=-1)
+    team_stats.add_activity(instance)
+
+
+@receiver(post_delete, sender=Activity)
+def count_deleted_activity(sender, instance, **kwargs):
+    TeamStatsRepository().add_activity(instance, sign=-1)
+
+
+@receiver(post_save, sender=Activity)
+def summarize_saved_activity(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_loaded_values', None)
+    UserStatsRepository().record(instance, previous)
+
+
+@receiver(post_delete, sender=Activity)
+def summarize_deleted_activity(sender, instance, **kwargs):
+    UserStatsRepository().record(None, getattr(instance, '_loaded_values', None) or instance)
+
+
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Workout)
+def index_searchable(sender, instance, **kwargs):
+    index_for(sender).update(instance)
+
+
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Workout)
+def unindex_searchable(sender, instance, **kwargs):
+    index_for(sender).remove(instance.pk)
+
+
+@receiver(post_save, sender=Activity)
+def write_activity_partition(sender, instance, created, **kwargs):
+    if settings.OCTOFIT_ACTIVITY_PARTITIONING:
+        ActivityPartitions().write(instance, previous_date=instance.loaded_value('date'))
+
+
+@receiver(post_delete, sender=Activity)
+def remove_activity_partition(sender, instance, **kwargs):
+    if settings.OCTOFIT_ACTIVITY_PARTITIONING:
+        ActivityPartitions().remove(instance.id, instance.loaded_value('date') or instance.date)
+
+
+@receiver(post_save, sender=Activity)
+def track_activity_days(sender, instance, created, **kwargs):
+    streaks = ActivityStreaks()
+    previous = None if created else getattr(instance, '_loaded_values', None)
+    if previous is not None:
+        if (previous['user_id'], previous['team_id'], day_number(previous['date'])) == (
+                instance.user_id, instance.team_id, day_number(instance.date)):
+            return
+        streaks.remove(previous)
+    streaks.add(instance)
+
+
+@receiver(post_delete, sender=Activity)
+def untrack_activity_days(sender, instance, **kwargs):
+    ActivityStreaks().remove(getattr(instance, '_loaded_values', None) or instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Team)
+@receiver(post_save, sender=Activity)
+@receiver(post_save, sender=Leaderboard)
+@receiver(post_save, sender=Workout)
+def record_saved_change(sender, instance, **kwargs):
+    ChangeLogRepository().record(sender, [instance.pk])
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Team)
+@receiver(post_delete, sender=Activity)
+@receiver(post_delete, sender=Leaderboard)
+@receiver(post_delete, sender=Workout)
+def record_deleted_change(sender, instance, **kwargs):
+    ChangeLogRepository().record(sender, [instance.pk], op=DELETE)
@@ -0,0 +1,112 @@
+"""Compressed columnar snapshots of the ``api`` collections.
+
+A snapshot is a zip archive with one gzip-compressed JSON member per
+collection, each holding the collection column by column (datetimes as
+epoch microseconds) plus a ``manifest.json``. Saving and loading run one
+worker per collection and talk to pymongo directly: documents are read
+with a single ``find`` and restored with chunked ``insert_many`` calls, so
+no ORM instance is ever built.
+"""
+import gzip
+import json
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from .models import User, Team, Activity, Leaderboard, Workout
+from .mongo import get_database
+from .repositories import ActivityRollupRepository
+
+FORMAT_VERSION = 1
+EPOCH = datetime(1970, 1, 1)
+
+# Rollups travel with the activities because they hold the totals of
+# activities that retention has already compacted away.
+COLLECTIONS = [model._meta.db_table for model in (User, Team, Activity, Leaderboard, Workout)] + [
+    ActivityRollupRepository.collection_name,
+]
+
+# djongo keeps each table's auto-increment counter here.
+DJONGO_SCHEMA_COLLECTION = '__schema__'
+
+
+def to_epoch_us(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def encode_columns(documents):
+    """Pivot documents into ``{'count', 'columns': {name: {'type', 'values'}}}``."""
+    names = sorted({key for doc in documents for key in doc if key != '_id'})
+    columns = {}
+    for name in names:
+        values = [doc.get(name) for doc in documents]
+        present = [value for value in values if value is not None]
+        if present and all(isinstance(value, datetime) for value in present):
+            columns[name] = {
+                'type': 'datetime',
+                'values': [None if value is None else to_epoch_us(value) for value in values],
+            }
+        else:
+            columns[name] = {'type': 'json', 'values': values}
+    return {'count': len(documents), 'columns': columns}
+
+
+def decode_columns(table):
+    """Rebuild the documents of one collection from its columns."""
+    columns = []
+    for name, column in table['columns'].items():
+        values = column['values']
+        if column['type'] == 'datetime':
+            values = [None if value is None else EPOCH + timedelta(microseconds=value) for value in values]
+        columns.append((name, values))
+    return [
+        {name: values[row] for name, values in columns}
+        for row in range(table['count'])
+    ]
+
+
+def _dump_collection(db, name, compresslevel):
+    documents = list(db[name].find({}, {'_id': 0}))
+    payload = json.dumps(encode_columns(documents), separators=(',', ':')).encode()
+    return name, len(documents), gzip.compress(payload, compresslevel=compresslevel)
+
+
+def save_snapshot(path, db=None, workers=None, compresslevel=6):
+    """Write every collection in ``COLLECTIONS`` to ``path``; returns row counts."""
+    db = db if db is not None else get_database()
+    with ThreadPoolExecutor(max_workers=workers or len(COLLECTIONS)) as pool:
+        dumps = list(pool.map(lambda name: _dump_collection(db, name, compresslevel), COLLECTIONS))
+    counts = {name: count for name, count, _ in dumps}
+    with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for name, _, blob in dumps:
+            archive.writestr(f'{name}.json.gz', blob)
+        archive.writestr('manifest.json', json.dumps({'version': FORMAT_VERSION, 'counts': counts}))
+    return counts
+
+
+def _restore_collection(db, name, blob, chunk_size):
+    documents = decode_columns(json.loads(gzip.decompress(blob)))
+    collection = db[name]
+    collection.delete_many({})
+    for start in range(0, len(documents), chunk_size):
+        collection.insert_many(documents[start:start + chunk_size], ordered=False)
+    ids = [doc['id'] for doc in documents if 'id' in doc]
+    if ids:
+        # Without this djongo would hand out ids that collide with restored rows.
+        db[DJONGO_SCHEMA_COLLECTION].update_one({'name': name}, {'$set': {'auto.seq': max(ids)}})
+    return name, len(documents)
+
+
+def load_snapshot(path, db=None, workers=None, chunk_size=10000):
+    """Replace the contents of every snapshotted collection; returns row counts."""
+    db = db if db is not None else get_database()
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read('manifest.json'))
+        if manifest['version'] != FORMAT_VERSION:
+            raise ValueError(f'Unsupported snapshot format version {manifest["version"]}')
+        blobs = {name: archive.read(f'{name}.json.gz') for name in manifest['counts']}
+    with ThreadPoolExecutor(max_workers=workers or len(blobs)) as pool:
+        restored = pool.map(lambda item: _restore_collection(db, *item, chunk_size), blobs.items())
+        return dict(restored)
@@ -0,0 +1,288 @@
+"""Activity streaks from incrementally maintained day sets.
+
+``activity_days`` counts activities per (scope, owner, day), where the
+scope is ``user`` or ``team``. Only when a day's count moves between zero
+and one does the owner's day set change. Each owner's day set is stored as
+run-length ``[first, last]`` day ranges, one ``streak_runs`` document per
+run, and ``streaks`` keeps the owner's summary: its longest run, its
+latest run and its active day count. Adding or removing a day reads the
+neighbouring runs and the summary through indexes and rewrites at most
+two runs, so neither streak queries nor updates scan activities or the
+whole day set. ``daily_active_users`` is bumped on the same user
+transitions.
+
+Days are proleptic ordinals (``date.toordinal()``) of the UTC date.
+"""
+import logging
+from collections import defaultdict
+from datetime import date
+
+from django.utils import timezone
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .models import Activity
+from .mongo import MongoRepository
+from .partitions import to_utc
+from .repositories import ActivityRollupRepository
+
+SCOPES = ('user', 'team')
+RUNS_COLLECTION = 'streak_runs'
+
+logger = logging.getLogger(__name__)
+
+
+def day_number(moment):
+    return to_utc(moment).date().toordinal()
+
+
+def today():
+    return day_number(timezone.now())
+
+
+def iso_day(day):
+    return date.fromordinal(day).isoformat() if day is not None else None
+
+
+def runs_from_days(days):
+    """Sorted ``[first, last]`` runs of consecutive days in sorted ``days``."""
+    runs = []
+    for day in days:
+        if runs and runs[-1][1] == day - 1:
+            runs[-1][1] = day
+        elif not runs or runs[-1][1] < day:
+            runs.append([day, day])
+    return runs
+
+
+def run_length(run):
+    return run[1] - run[0] + 1
+
+
+def run_document(scope, owner_id, first, last):
+    return {'scope': scope, 'owner_id': owner_id, 'first': first, 'last': last, 'length': last - first + 1}
+
+
+def streak_document(scope, owner_id, runs):
+    last = runs[-1] if runs else None
+    return {
+        'scope': scope,
+        'owner_id': owner_id,
+        'longest': max(map(run_length, runs), default=0),
+        'active_days': sum(map(run_length, runs)),
+        'last_start': last and last[0],
+        'last_end': last and last[1],
+        'last_length': run_length(last) if last else 0,
+    }
+
+
+def current_streak(document, day=None):
+    """Length of the run still alive on ``day``: it ends today or yesterday."""
+    day = day or today()
+    if not document or document.get('last_end') is None or document['last_end'] < day - 1:
+        return 0
+    return document['last_length']
+
+
+class StreakRepository(MongoRepository):
+    """Per-owner streak summaries, over run-length day sets in ``streak_runs``.
+
+    Summaries carry a version. A change whose summary update finds another
+    version raced a concurrent change to the same owner, and the owner is
+    repaired from its ``activity_days`` instead.
+    """
+    collection_name = 'streaks'
+
+    @property
+    def runs(self):
+        return self.db[RUNS_COLLECTION]
+
+    def ensure_indexes(self):
+        self.collection.create_index([('scope', ASCENDING), ('owner_id', ASCENDING)], unique=True)
+        self.collection.create_index([('scope', ASCENDING), ('longest', DESCENDING)])
+        self.collection.create_index(
+            [('scope', ASCENDING), ('last_end', DESCENDING), ('last_length', DESCENDING)]
+        )
+        self.runs.create_index(
+            [('scope', ASCENDING), ('owner_id', ASCENDING), ('first', ASCENDING)], unique=True
+        )
+        self.runs.create_index([('scope', ASCENDING), ('owner_id', ASCENDING), ('length', DESCENDING)])
+
+    def put_run(self, scope, owner_id, first, last):
+        self.runs.replace_one(
+            {'scope': scope, 'owner_id': owner_id, 'first': first},
+            run_document(scope, owner_id, first, last), upsert=True,
+        )
+
+    def mark(self, scope, owner_id, day, active):
+        """Add ``day`` to, or remove it from, an owner's day set."""
+        owner = {'scope': scope, 'owner_id': owner_id}
+        summary = self.collection.find_one(owner) or {}
+        run = self.runs.find_one({**owner, 'first': {'$lte': day}}, sort=[('first', DESCENDING)])
+        holds_day = run is not None and run['last'] >= day
+        if holds_day == active:
+            return
+        longest = summary.get('longest', 0)
+        if active:
+            after = self.runs.find_one_and_delete({**owner, 'first': day + 1})
+            first = run['first'] if run and run['last'] == day - 1 else day
+            last = after['last'] if after else day
+            self.put_run(scope, owner_id, first, last)
+            longest = max(longest, last - first + 1)
+        else:
+            self.runs.delete_one({'_id': run['_id']})
+            if run['first'] < day:
+                self.put_run(scope, owner_id, run['first'], day - 1)
+            if day < run['last']:
+                self.put_run(scope, owner_id, day + 1, run['last'])
+            if run['length'] >= longest:
+                top = self.runs.find_one(owner, sort=[('length', DESCENDING)])
+                longest = top['length'] if top else 0
+        latest = self.runs.find_one(owner, sort=[('first', DESCENDING)])
+        try:
+            result = self.collection.update_one(
+                {**owner, 'version': summary.get('version', 0)},
+                {'$set': {
+                    'longest': longest,
+                    'last_start': latest and latest['first'],
+                    'last_end': latest and latest['last'],
+                    'last_length': latest['length'] if latest else 0,
+                }, '$inc': {'active_days': 1 if active else -1, 'version': 1}},
+                upsert=not summary,
+            )
+            raced = not (result.matched_count or result.upserted_id)
+        except DuplicateKeyError:
+            raced = True
+        if raced:
+            logger.warning('Concurrent streak updates for %s %s; repairing it', scope, owner_id)
+            self.repair(scope, owner_id)
+
+    def repair(self, scope, owner_id):
+        """Recompute one owner's runs and summary from its ``activity_days``."""
+        owner = {'scope': scope, 'owner_id': owner_id}
+        days = self.db[ActivityStreaks.collection_name].find(
+            {**owner, 'count': {'$gt': 0}}, {'day': 1, '_id': 0}
+        ).sort('day', ASCENDING)
+        runs = runs_from_days(doc['day'] for doc in days)
+        self.runs.delete_many(owner)
+        if runs:
+            self.runs.insert_many([run_document(scope, owner_id, *run) for run in runs])
+        self.collection.update_one(
+            owner, {'$set': streak_document(scope, owner_id, runs), '$inc': {'version': 1}}, upsert=True
+        )
+
+    def get(self, scope, owner_id):
+        return self.collection.find_one({'scope': scope, 'owner_id': owner_id}, {'_id': 0})
+
+    def get_many(self, scope, owner_ids):
+        return {doc['owner_id']: doc for doc in self.collection.find(
+            {'scope': scope, 'owner_id': {'$in': list(owner_ids)}}, {'_id': 0}
+        )}
+
+    def ranking(self, scope, by='current', limit=10, day=None):
+        """Owners with the highest current (alive) or longest streak."""
+        if by == 'longest':
+            query, order = {'scope': scope, 'longest': {'$gt': 0}}, 'longest'
+        else:
+            query, order = {'scope': scope, 'last_end': {'$gte': (day or today()) - 1}}, 'last_length'
+        cursor = self.collection.find(query, {'_id': 0})
+        return list(cursor.sort([(order, DESCENDING), ('owner_id', ASCENDING)]).limit(limit))
+
+
+class ActivityStreaks(MongoRepository):
+    """Write path keeping ``activity_days``, ``streaks`` and ``daily_active_users`` current."""
+    collection_name = 'activity_days'
+
+    def owners(self, activity):
+        owners = [('user', activity['user_id'])]
+        if activity.get('team_id') is not None:
+            owners.append(('team', activity['team_id']))
+        return owners
+
+    def bump(self, scope, owner_id, day, delta):
+        """Adjust one day's activity count, flipping the day set when it crosses zero."""
+        document = self.collection.find_one_and_update(
+            {'scope': scope, 'owner_id': owner_id, 'day': day},
+            {'$inc': {'count': delta}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+        if document['count'] <= 0:
+            self.collection.delete_one({'_id': document['_id'], 'count': {'$lte': 0}})
+        if (delta > 0 and document['count'] == 1) or (delta < 0 and document['count'] <= 0):
+            StreakRepository(self.db).mark(scope, owner_id, day, active=delta > 0)
+            if scope == 'user':
+                self.db['daily_active_users'].update_one(
+                    {'day': day}, {'$inc': {'users': 1 if delta > 0 else -1}}, upsert=True
+                )
+
+    def add(self, activity, sign=1):
+        """Count an activity (a dict or instance) towards, or away from, its owners' days."""
+        activity = activity if isinstance(activity, dict) else activity.__dict__
+        day = day_number(activity['date'])
+        for scope, owner_id in self.owners(activity):
+            self.bump(scope, owner_id, day, sign)
+
+    def remove(self, activity):
+        self.add(activity, sign=-1)
+
+    def move_team(self, activity, team_id):
+        """Re-attribute an activity's team day after its user changed teams."""
+        if activity.get('team_id') is not None:
+            self.bump('team', activity['team_id'], day_number(activity['date']), -1)
+        if team_id is not None:
+            self.bump('team', team_id, day_number(activity['date']), 1)
+
+    def daily_active_users(self, start, end):
+        """``{day: users}`` for the ordinal days in ``[start, end]``."""
+        rows = self.db['daily_active_users'].find({'day': {'$gte': start, '$lte': end}, 'users': {'$gt': 0}})
+        return {row['day']: row['users'] for row in rows}
+
+    def rebuild(self):
+        """Recompute every day count, day set and daily active count from the raw collections."""
+        counts = defaultdict(int)
+        fields = {'user_id': 1, 'team_id': 1, 'date': 1, '_id': 0}
+        for doc in self.db[Activity._meta.db_table].find({}, fields):
+            for scope, owner_id in self.owners(doc):
+                counts[scope, owner_id, day_number(doc['date'])] += 1
+        rollups = ActivityRollupRepository(self.db).collection
+        for doc in rollups.find({}, {'user_id': 1, 'team_id': 1, 'day': 1, 'activity_count': 1, '_id': 0}):
+            for scope, owner_id in self.owners(doc):
+                counts[scope, owner_id, day_number(doc['day'])] += doc['activity_count']
+
+        days = defaultdict(list)
+        active_users = defaultdict(int)
+        for scope, owner_id, day in sorted(counts):
+            days[scope, owner_id].append(day)
+            if scope == 'user':
+                active_users[day] += 1
+
+        self.collection.delete_many({})
+        self.db['daily_active_users'].delete_many({})
+        streaks = StreakRepository(self.db)
+        streaks.collection.delete_many({})
+        streaks.runs.delete_many({})
+        if counts:
+            self.collection.insert_many([
+                {'scope': scope, 'owner_id': owner_id, 'day': day, 'count': count}
+                for (scope, owner_id, day), count in counts.items()
+            ])
+            self.db['daily_active_users'].bulk_write([
+                UpdateOne({'day': day}, {'$set': {'users': users}}, upsert=True)
+                for day, users in active_users.items()
+            ])
+        documents, run_documents = [], []
+        for (scope, owner_id), owner_days in days.items():
+            runs = runs_from_days(owner_days)
+            documents.append({**streak_document(scope, owner_id, runs), 'version': 0})
+            run_documents.extend(run_document(scope, owner_id, *run) for run in runs)
+        if documents:
+            streaks.collection.insert_many(documents)
+            streaks.runs.insert_many(run_documents)
+        return len(documents)
+
+    def ensure_indexes(self):
+        self.collection.create_index(
+            [('scope', ASCENDING), ('owner_id', ASCENDING), ('day', ASCENDING)], unique=True
+        )
+        self.db['daily_active_users'].create_index('day', unique=True)
+        StreakRepository(self.db).ensure_indexes()
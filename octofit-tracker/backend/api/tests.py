@@ -1,8 +1,87 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.admin import AdminSite
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, migrations
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
 from django.utils import timezone
-from rest_framework.test import APITestCase
+from rest_framework.test import APIRequestFactory, APITestCase
 from rest_framework import status
-from .models import User, Team, Activity, Leaderboard, Workout
+from .models import User, Team, Activity, Leaderboard, Workout, activity_content_hash
+from .propagation import propagate_user
+from .repositories import (
+    UserRepository, ActivityRepository, LeaderboardRepository, TeamStatsRepository, UserStatsRepository
+)
+from .leaderboard import dense_ranks, rebuild_leaderboard, recompute_leaderboard, team_shards
+from .admin import WorkoutAdmin
+from .cache import MongoCache
+from .middleware import LoadSheddingMiddleware
+from .changes import ChangeLogRepository
+from .coalesce import Uncacheable, single_flight
+from .management.commands.profile_startup import FIRST_REQUEST_MARKER, parse_importtime
+from .pagination import EstimatedCountPaginator
+from .profiling import make_token
+from . import querylog
+from .partitions import ActivityPartitions, activity_document
+from .retention import compact_activities, detach_month
+from .snapshots import load_snapshot, save_snapshot
+from .scheduler import Job, JobRunRepository, Scheduler, load_jobs
+from .search import InvertedIndex, indexes, reset_indexes
+from .streaks import ActivityStreaks, StreakRepository, current_streak, runs_from_days, today
+from .throttling import TokenBucketThrottle
+
+try:
+    import mongomock
+except ImportError:
+    mongomock = None
+
+try:
+    import numpy
+    from .analytics import FINE_BINS_PER_BIN, TooManyGroups, distributions
+except ImportError:
+    numpy = None
+
+
+class MongoStandInMixin:
+    """Point every native pymongo path at an in-memory mongomock database."""
+
+    def setUp(self):
+        super().setUp()
+        # Coalesced aggregate responses must not leak between tests.
+        cache.clear()
+        self.db = mongomock.MongoClient().octofit_db
+        patcher = mock.patch('api.mongo.connections')
+        connections = patcher.start()
+        connections.__getitem__.return_value.connection = self.db
+        self.addCleanup(patcher.stop)
+
+    def migrate_mongo(self, name):
+        """Run migration ``name``'s native Mongo steps against the stand-in database."""
+        migration = import_module(f'api.migrations.{name}').Migration
+        connection = SimpleNamespace(vendor='djongo', connection=self.db, ensure_connection=lambda: None)
+        for operation in migration.operations:
+            if isinstance(operation, migrations.RunPython):
+                operation.code(None, SimpleNamespace(connection=connection))
 
 
 class UserModelTest(TestCase):
@@ -68,6 +147,48 @@ class ActivityModelTest(TestCase):
         self.assertEqual(self.activity.distance, 5.0)
 
 
+@override_settings(OCTOFIT_PROPAGATE_IN_BACKGROUND=False)
+class ActivityDenormalizationTest(TestCase):
+    """Test cases for user fields copied onto activities."""
+
+    def setUp(self):
+        self.user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com', team_id=1)
+        self.activity = Activity.objects.create(
+            user_id=self.user.id,
+            activity_type='running',
+            duration=30,
+            calories=300,
+            date=timezone.now()
+        )
+
+    def test_user_fields_stored_on_write(self):
+        """Test an activity stores its user's name and team when saved."""
+        self.assertEqual(self.activity.user_name, 'Tony Stark')
+        self.assertEqual(self.activity.team_id, 1)
+
+    def test_rename_propagates_to_activities(self):
+        """Test renaming or moving a user updates their activities."""
+        user = User.objects.get(id=self.user.id)
+        user.name = 'Iron Man'
+        user.team_id = 2
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.activity.refresh_from_db()
+        self.assertEqual(self.activity.user_name, 'Iron Man')
+        self.assertEqual(self.activity.team_id, 2)
+
+    def test_propagation_runs_in_batches(self):
+        """Test every activity is reached when batches are smaller than the set."""
+        for _ in range(2):
+            Activity.objects.create(
+                user_id=self.user.id, activity_type='yoga', duration=20,
+                calories=100, date=timezone.now()
+            )
+        User.objects.filter(id=self.user.id).update(name='Iron Man')
+        self.assertEqual(propagate_user(self.user.id, batch_size=2), 3)
+        self.assertEqual(Activity.objects.filter(user_name='Iron Man').count(), 3)
+
+
 class LeaderboardModelTest(TestCase):
     """Test cases for Leaderboard model."""
     
@@ -165,3 +286,1754 @@ class APIRootTest(APITestCase):
         self.assertIn('activities', response.data)
         self.assertIn('leaderboard', response.data)
         self.assertIn('workouts', response.data)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class RepositoryTest(MongoStandInMixin, APITestCase):
+    """Test cases for the native pymongo read paths."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.users.insert_many([
+            {'id': 1, 'name': 'Tony Stark', 'email': 'iron.man@marvel.com', 'team_id': 1,
+             'role': 'team_leader', 'created_at': datetime(2026, 1, 1)},
+            {'id': 2, 'name': 'Bruce Wayne', 'email': 'batman@dc.com', 'team_id': 2,
+             'role': 'member', 'created_at': datetime(2026, 1, 2)},
+        ])
+        self.db.activities.insert_many([
+            {'id': i, 'user_id': 1, 'user_name': 'Tony Stark', 'team_id': 1,
+             'activity_type': 'Running', 'duration': 30,
+             'calories': 300, 'distance': 5.0, 'date': datetime(2026, 1, i), 'notes': ''}
+            for i in range(1, 4)
+        ])
+        self.db.leaderboard.insert_many([
+            {'id': 1, 'team_id': 1, 'team_name': 'Team Marvel', 'total_points': 500,
+             'total_activities': 3, 'rank': 2, 'updated_at': datetime(2026, 1, 3)},
+            {'id': 2, 'team_id': 2, 'team_name': 'Team DC', 'total_points': 900,
+             'total_activities': 5, 'rank': 1, 'updated_at': datetime(2026, 1, 3)},
+        ])
+
+    def test_activities_for_user_newest_first(self):
+        """Test activities come back newest first with the user name resolved."""
+        activities = ActivityRepository(self.db).list_for_user(1, limit=2)
+        self.assertEqual([a['id'] for a in activities], [3, 2])
+        self.assertEqual(activities[0]['user_name'], 'Tony Stark')
+        self.assertNotIn('_id', activities[0])
+        self.assertIsNotNone(activities[0]['date'].tzinfo)
+
+    def test_users_by_id_set(self):
+        """Test users are fetched by id set."""
+        users = UserRepository(self.db).get_many({2, 1, 99})
+        self.assertEqual([u['name'] for u in users], ['Tony Stark', 'Bruce Wayne'])
+
+    def test_leaderboard_top(self):
+        """Test the top-N leaderboard is ordered by points."""
+        entries = LeaderboardRepository(self.db).top(1)
+        self.assertEqual([e['team_name'] for e in entries], ['Team DC'])
+
+    def test_api_uses_repositories(self):
+        """Test the API serializes repository results like ORM rows."""
+        response = self.client.get('/api/activities/', {'user_id': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['user_name'], 'Tony Stark')
+        response = self.client.get('/api/users/', {'ids': '1,2'})
+        self.assertEqual([u['id'] for u in response.data], [1, 2])
+        response = self.client.get('/api/leaderboard/top/', {'limit': 1})
+        self.assertEqual(response.data[0]['rank'], 1)
+        for limit in (0, -1, 501):
+            response = self.client.get('/api/leaderboard/top/', {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/users/', {'ids': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+@override_settings(OCTOFIT_PROPAGATE_IN_BACKGROUND=False)
+class TeamStatsTest(MongoStandInMixin, APITestCase):
+    """Test cases for the maintained team counters."""
+
+    def setUp(self):
+        super().setUp()
+        self.team = Team.objects.create(name='Team Marvel')
+        self.other = Team.objects.create(name='Team DC')
+        self.user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com', team_id=self.team.id)
+        User.objects.create(name='Steve Rogers', email='cap@marvel.com', team_id=self.team.id)
+        self.activity = Activity.objects.create(
+            user_id=self.user.id, activity_type='Running', duration=30,
+            calories=300, distance=5.0, date=timezone.now()
+        )
+        Activity.objects.create(
+            user_id=self.user.id, activity_type='Yoga', duration=20,
+            calories=100, date=timezone.now()
+        )
+
+    def stats(self, team):
+        return TeamStatsRepository(self.db).get(team.id)
+
+    def test_counters_follow_writes(self):
+        """Test counters track creates, edits and deletes."""
+        stats = self.stats(self.team)
+        self.assertEqual(stats['member_count'], 2)
+        self.assertEqual(stats['activity_count'], 2)
+        self.assertEqual(stats['total_calories'], 400)
+        activity = Activity.objects.get(id=self.activity.id)
+        activity.calories = 500
+        activity.save()
+        self.assertEqual(self.stats(self.team)['total_calories'], 600)
+        activity.delete()
+        stats = self.stats(self.team)
+        self.assertEqual(stats['activity_count'], 1)
+        self.assertEqual(stats['total_distance'], 0)
+
+    def test_team_move_carries_activities(self):
+        """Test moving a user shifts their member slot and activity totals."""
+        user = User.objects.get(id=self.user.id)
+        user.team_id = self.other.id
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.stats(self.team)['member_count'], 1)
+        self.assertEqual(self.stats(self.team)['total_calories'], 0)
+        self.assertEqual(self.stats(self.other)['member_count'], 1)
+        self.assertEqual(self.stats(self.other)['activity_count'], 2)
+
+    def test_rebuild_matches_grouped_aggregation(self):
+        """Test a rebuild recomputes counters from the raw collections."""
+        self.db.team_stats.drop()
+        self.db.users.insert_many([{'id': 1, 'team_id': 7}, {'id': 2, 'team_id': 7}, {'id': 3, 'team_id': None}])
+        self.db.activities.insert_many([
+            {'id': 1, 'team_id': 7, 'calories': 10, 'duration': 5, 'distance': 1.5},
+            {'id': 2, 'team_id': 7, 'calories': 20, 'duration': 6, 'distance': 0.0},
+        ])
+        self.assertEqual(TeamStatsRepository(self.db).rebuild(), 1)
+        stats = TeamStatsRepository(self.db).get(7)
+        self.assertEqual((stats['member_count'], stats['activity_count'], stats['total_calories']), (2, 2, 30))
+
+    def test_stats_endpoints(self):
+        """Test the list and detail stats actions."""
+        response = self.client.get(f'/api/teams/{self.team.id}/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['member_count'], 2)
+        self.assertEqual(response.data['total_duration'], 50)
+        response = self.client.get('/api/teams/stats/')
+        self.assertEqual([row['team_name'] for row in response.data], ['Team Marvel', 'Team DC'])
+        self.assertEqual(response.data[1]['activity_count'], 0)
+
+    def test_migration_merges_duplicates_and_indexes_team_id(self):
+        """Test counters split by racing upserts are merged before team_id becomes unique."""
+        self.db.team_stats.insert_one({'team_id': self.team.id, 'activity_count': 1, 'total_calories': 50})
+        self.migrate_mongo('0006_team_stats_indexes')
+        self.assertEqual(self.db.team_stats.count_documents({'team_id': self.team.id}), 1)
+        self.assertEqual(self.stats(self.team)['total_calories'], 450)
+        self.assertTrue(self.db.team_stats.index_information()['team_id_1']['unique'])
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class UserStatsTest(MongoStandInMixin, APITestCase):
+    """Test cases for the maintained per-user summaries."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com', team_id=1)
+        self.long_run = Activity.objects.create(
+            user_id=self.user.id, activity_type='Running', duration=60,
+            calories=600, distance=12.0, date=timezone.now()
+        )
+        self.short_run = Activity.objects.create(
+            user_id=self.user.id, activity_type='Running', duration=20,
+            calories=200, distance=4.0, date=timezone.now()
+        )
+        self.cycle = Activity.objects.create(
+            user_id=self.user.id, activity_type='Cycling', duration=90,
+            calories=900, distance=30.0, date=timezone.now()
+        )
+
+    def summary(self):
+        return UserStatsRepository(self.db).get(self.user.id)
+
+    def test_totals_and_bests_follow_creates(self):
+        """Test totals, per-type breakdown and bests are kept on create."""
+        summary = self.summary()
+        self.assertEqual(summary['activity_count'], 3)
+        self.assertEqual(summary['total_calories'], 1700)
+        self.assertEqual(summary['by_type']['running']['activity_count'], 2)
+        self.assertEqual(summary['bests']['longest_run']['activity_id'], self.long_run.id)
+        self.assertEqual(summary['bests']['most_calories']['value'], 900)
+
+    def test_deleting_a_best_recomputes_it(self):
+        """Test removing the activity holding a best falls back to the next one."""
+        Activity.objects.get(id=self.long_run.id).delete()
+        summary = self.summary()
+        self.assertEqual(summary['bests']['longest_run']['activity_id'], self.short_run.id)
+        self.assertEqual(summary['by_type']['running']['total_distance'], 4.0)
+        Activity.objects.get(id=self.short_run.id).delete()
+        self.assertIsNone(self.summary()['bests']['longest_run'])
+
+    def test_editing_a_best_down_recomputes_it(self):
+        """Test lowering or retyping the holder of a best moves the best."""
+        cycle = Activity.objects.get(id=self.cycle.id)
+        cycle.calories = 100
+        cycle.save()
+        self.assertEqual(self.summary()['bests']['most_calories']['activity_id'], self.long_run.id)
+        run = Activity.objects.get(id=self.long_run.id)
+        run.activity_type = 'Walking'
+        run.save()
+        summary = self.summary()
+        self.assertEqual(summary['bests']['longest_run']['value'], 4.0)
+        self.assertEqual(summary['by_type']['walking']['activity_count'], 1)
+        self.assertEqual(summary['activity_count'], 3)
+
+    def test_rebuild_matches_maintained_summary(self):
+        """Test a rebuild from the raw collections reproduces the live summary."""
+        self.db.activities.insert_many([
+            {'id': activity.id, 'user_id': self.user.id, 'activity_type': activity.activity_type,
+             'calories': activity.calories, 'duration': activity.duration,
+             'distance': activity.distance, 'date': activity.date.replace(tzinfo=None)}
+            for activity in Activity.objects.all()
+        ])
+        live = self.summary()
+        self.db.user_stats.drop()
+        self.assertEqual(UserStatsRepository(self.db).rebuild(), 1)
+        rebuilt = self.summary()
+        self.assertEqual(rebuilt['by_type'], live['by_type'])
+        self.assertEqual(rebuilt['bests']['longest_run']['activity_id'], self.long_run.id)
+
+    def test_stats_endpoint(self):
+        """Test the per-user stats action."""
+        response = self.client.get(f'/api/users/{self.user.id}/stats/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_distance'], 46.0)
+        self.assertEqual(response.data['by_type'][0]['activity_type'], 'Running')
+        self.assertEqual(response.data['personal_bests']['most_calories']['activity_id'], self.cycle.id)
+        response = self.client.get('/api/users/999/stats/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_migration_merges_duplicates_and_indexes_user_id(self):
+        """Test summaries split by racing upserts are merged before user_id becomes unique."""
+        self.db.user_stats.insert_one({
+            'user_id': self.user.id, 'activity_count': 1, 'total_calories': 1000,
+            'total_duration': 10, 'total_distance': 1.0,
+            'by_type': {'rowing': {'activity_type': 'Rowing', 'activity_count': 1, 'total_calories': 1000,
+                                   'total_duration': 10, 'total_distance': 1.0}},
+            'bests': {'longest_run': None, 'most_calories': {'value': 1000, 'activity_id': 99, 'date': None}},
+        })
+        self.migrate_mongo('0007_user_stats_indexes')
+        self.assertEqual(self.db.user_stats.count_documents({'user_id': self.user.id}), 1)
+        summary = self.summary()
+        self.assertEqual(summary['activity_count'], 4)
+        self.assertEqual(summary['total_calories'], 2700)
+        self.assertEqual(summary['by_type']['rowing']['activity_count'], 1)
+        self.assertEqual(summary['by_type']['running']['activity_count'], 2)
+        self.assertEqual(summary['bests']['longest_run']['activity_id'], self.long_run.id)
+        self.assertEqual(summary['bests']['most_calories']['activity_id'], 99)
+        self.assertTrue(self.db.user_stats.index_information()['user_id_1']['unique'])
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class StreakRunsTest(TestCase):
+    """Test cases for the run-length day sets."""
+
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.streaks = StreakRepository(self.db)
+        self.streaks.ensure_indexes()
+
+    def runs(self):
+        cursor = self.streaks.runs.find({'scope': 'user', 'owner_id': 1}).sort('first')
+        return [[run['first'], run['last']] for run in cursor]
+
+    def set_day(self, day, active):
+        self.db.activity_days.update_one(
+            {'scope': 'user', 'owner_id': 1, 'day': day}, {'$set': {'count': int(active)}}, upsert=True
+        )
+        self.streaks.mark('user', 1, day, active)
+
+    def test_add_and_remove_days(self):
+        """Test adding days merges neighbouring runs and removing splits them."""
+        for day in (1, 2, 5, 3, 7):
+            self.set_day(day, True)
+        self.assertEqual(self.runs(), [[1, 3], [5, 5], [7, 7]])
+        self.set_day(6, True)
+        self.assertEqual(self.runs(), [[1, 3], [5, 7]])
+        self.set_day(2, True)
+        self.set_day(2, False)
+        self.assertEqual(self.runs(), [[1, 1], [3, 3], [5, 7]])
+        self.set_day(4, False)
+        summary = self.streaks.get('user', 1)
+        self.assertEqual((summary['longest'], summary['active_days'], summary['last_length']), (3, 5, 3))
+        self.set_day(6, False)
+        self.assertEqual(self.streaks.get('user', 1)['longest'], 1)
+        self.assertEqual(runs_from_days([1, 2, 2, 4]), [[1, 2], [4, 4]])
+
+    def test_concurrent_update_repairs_owner(self):
+        """Test a change racing another one repairs the owner instead of failing."""
+        for day in (1, 2):
+            self.set_day(day, True)
+        find_one = self.streaks.collection.find_one
+
+        def stale_summary(*args, **kwargs):
+            summary = find_one(*args, **kwargs)
+            summary['version'] -= 1
+            return summary
+
+        self.db.activity_days.insert_one({'scope': 'user', 'owner_id': 1, 'day': 4, 'count': 1})
+        with mock.patch.object(self.streaks.collection, 'find_one', side_effect=stale_summary):
+            self.set_day(3, True)
+        self.assertEqual(self.runs(), [[1, 4]])
+        self.assertEqual(self.streaks.get('user', 1)['longest'], 4)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class StreakTest(MongoStandInMixin, APITestCase):
+    """Test cases for maintained activity streaks."""
+
+    def setUp(self):
+        super().setUp()
+        self.team = Team.objects.create(name='Team Marvel')
+        self.user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com', team_id=self.team.id)
+        self.other = User.objects.create(name='Steve Rogers', email='cap@marvel.com', team_id=self.team.id)
+        self.now = timezone.now()
+        self.activities = {
+            days_ago: self.log(self.user, days_ago) for days_ago in (0, 1, 2, 4, 5, 6, 7)
+        }
+        # A second, different workout on an already active day.
+        self.log(self.user, 0, duration=45)
+        self.log(self.other, 3)
+
+    def log(self, user, days_ago, duration=30):
+        return Activity.objects.create(
+            user_id=user.id, activity_type='Running', duration=duration,
+            calories=300, date=self.now - timedelta(days=days_ago)
+        )
+
+    def streak(self, scope, owner):
+        return StreakRepository(self.db).get(scope, owner.id)
+
+    def test_current_and_longest(self):
+        """Test user and team streaks follow creates."""
+        user = self.streak('user', self.user)
+        self.assertEqual((current_streak(user), user['longest'], user['active_days']), (3, 4, 7))
+        team = self.streak('team', self.team)
+        self.assertEqual((current_streak(team), team['longest']), (8, 8))
+
+    def test_delete_and_move_update_runs(self):
+        """Test removing the only activity of a day splits the run and moving it rejoins it."""
+        Activity.objects.get(id=self.activities[5].id).delete()
+        self.assertEqual(self.streak('user', self.user)['longest'], 3)
+        self.assertEqual(self.streak('team', self.team)['longest'], 5)
+        activity = Activity.objects.get(id=self.activities[1].id)
+        activity.date = self.now - timedelta(days=3)
+        activity.save()
+        user = self.streak('user', self.user)
+        self.assertEqual((current_streak(user), user['longest']), (1, 3))
+
+    def test_daily_active_users(self):
+        """Test each user counts once per day however many activities they log."""
+        counts = ActivityStreaks(self.db).daily_active_users(today() - 7, today())
+        self.assertEqual(counts[today()], 1)
+        self.assertEqual(counts[today() - 3], 1)
+        self.assertNotIn(today() - 8, counts)
+
+    def test_rebuild_matches_maintained_state(self):
+        """Test a rebuild from the raw collections reproduces the incremental day sets."""
+        streaks = StreakRepository(self.db)
+        owner = {'scope': 'user', 'owner_id': self.user.id}
+        live = streaks.get('user', self.user.id), list(streaks.runs.find(owner, {'_id': 0}).sort('first'))
+        self.db.activities.insert_many([
+            {'id': activity.id, 'user_id': activity.user_id, 'team_id': activity.team_id, 'date': activity.date}
+            for activity in Activity.objects.all()
+        ])
+        self.db.streaks.drop()
+        self.db.streak_runs.drop()
+        self.assertEqual(ActivityStreaks(self.db).rebuild(), 3)
+        rebuilt = streaks.get('user', self.user.id), list(streaks.runs.find(owner, {'_id': 0}).sort('first'))
+        self.assertEqual(rebuilt[1], live[1])
+        self.assertEqual(rebuilt[0]['longest'], live[0]['longest'])
+        self.assertEqual(rebuilt[0]['last_length'], live[0]['last_length'])
+
+    def test_migration_splits_runs_and_indexes(self):
+        """Test the migration re-derives runs from the day counts and indexes every collection."""
+        streaks = StreakRepository(self.db)
+        owner = {'scope': 'team', 'owner_id': self.team.id}
+        live = list(streaks.runs.find(owner, {'_id': 0}).sort('first'))
+        self.db.streaks.insert_one({**owner, 'runs': [[1, 1]], 'longest': 1})
+        self.migrate_mongo('0008_streak_indexes')
+        self.assertEqual(self.db.streaks.count_documents(owner), 1)
+        self.assertEqual(list(streaks.runs.find(owner, {'_id': 0}).sort('first')), live)
+        self.assertEqual(streaks.get('team', self.team.id)['longest'], 8)
+        self.assertTrue(self.db.activity_days.index_information()['scope_1_owner_id_1_day_1']['unique'])
+        self.assertTrue(self.db.streak_runs.index_information()['scope_1_owner_id_1_first_1']['unique'])
+        self.assertIn('scope_1_longest_-1', self.db.streaks.index_information())
+
+    def test_streak_endpoints(self):
+        """Test the streak actions, leaderboard criteria and daily active users."""
+        response = self.client.get(f'/api/users/{self.user.id}/streak/')
+        self.assertEqual(response.data['current_streak'], 3)
+        response = self.client.get(f'/api/teams/{self.team.id}/streak/')
+        self.assertEqual(response.data['longest_streak'], 8)
+        response = self.client.get('/api/leaderboard/streaks/?by=longest')
+        self.assertEqual([row['name'] for row in response.data], ['Tony Stark', 'Steve Rogers'])
+        response = self.client.get('/api/leaderboard/streaks/?scope=nobody')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for limit in (0, -1, 501):
+            response = self.client.get('/api/leaderboard/streaks/', {'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/activities/active-users/')
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual(response.data[-1]['active_users'], 1)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class TeamMembersTest(MongoStandInMixin, APITestCase):
+    """Test cases for the paginated team roster."""
+
+    def setUp(self):
+        super().setUp()
+        self.team = Team.objects.create(name='Team Marvel')
+        self.members = [
+            User.objects.create(name=f'Hero {i}', email=f'hero{i}@marvel.com', team_id=self.team.id)
+            for i in range(3)
+        ]
+        User.objects.create(name='Bruce Wayne', email='batman@dc.com', team_id=self.team.id + 1)
+        self.db.activities.insert_many([
+            {'id': 1, 'user_id': self.members[0].id, 'calories': 100, 'duration': 10, 'distance': 1.0},
+            {'id': 2, 'user_id': self.members[0].id, 'calories': 50, 'duration': 5, 'distance': 0.5},
+        ])
+
+    def test_members_are_paginated(self):
+        """Test only the team's users come back, one page at a time."""
+        response = self.client.get(f'/api/teams/{self.team.id}/members/', {'page_size': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual([m['name'] for m in response.data['results']], ['Hero 0', 'Hero 1'])
+        self.assertIsNotNone(response.data['next'])
+
+    def test_members_with_totals(self):
+        """Test activity totals are embedded per member."""
+        response = self.client.get(f'/api/teams/{self.team.id}/members/', {'include': 'totals'})
+        totals = [m['totals'] for m in response.data['results']]
+        self.assertEqual(totals[0]['total_calories'], 150)
+        self.assertEqual(totals[0]['activity_count'], 2)
+        self.assertEqual(totals[1]['activity_count'], 0)
+
+
+class InvertedIndexTest(TestCase):
+    """Test cases for the tokenized inverted index."""
+
+    def setUp(self):
+        self.index = InvertedIndex()
+        self.index.add(1, [('Speed Force Cardio', 3.0), ('Sprint intervals', 1.0)])
+        self.index.add(2, [('Dark Knight Urban Cycling', 3.0), ('Build speed on two wheels', 1.0)])
+
+    def test_prefix_matching_and_ranking(self):
+        """Test prefixes match and title hits outrank description hits."""
+        self.assertEqual([doc_id for doc_id, _ in self.index.search('spe')], [1, 2])
+        self.assertEqual([doc_id for doc_id, _ in self.index.search('speed cyc')], [2])
+
+    def test_remove_and_reindex(self):
+        """Test removed or rewritten documents drop their old tokens."""
+        self.index.remove(1)
+        self.index.add(2, [('Zen Master Flexibility', 1.0)])
+        self.assertEqual(self.index.search('speed'), [])
+        self.assertEqual(self.index.vocabulary, ['flexibility', 'master', 'zen'])
+
+    def test_common_tokens_are_capped(self):
+        """Test a token in too many documents keeps its strongest, newest postings and prefixes expand boundedly."""
+        index = InvertedIndex(max_postings=2, max_expansions=2)
+        notes = ['running hills', 'running track', 'running intervals', 'running running tempo']
+        for doc_id, text in enumerate(notes, start=1):
+            index.add(doc_id, [(text, 1.0)])
+        self.assertEqual(sorted(index.postings['running']), [3, 4])
+        self.assertEqual(index.doc_freq['running'], 4)
+        self.assertEqual([doc_id for doc_id, _ in index.search('running')], [4, 3])
+        self.assertEqual([doc_id for doc_id, _ in index.search('running interval')], [3])
+        index.add(5, [('trail', 1.0), ('tractor', 1.0), ('travel', 1.0)])
+        self.assertEqual(index.expand('tr'), ['track', 'tractor'])
+        index.remove(4)
+        self.assertEqual(index.doc_freq['running'], 3)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class SearchAPITest(MongoStandInMixin, APITestCase):
+    """Test cases for the search endpoint and its index sync."""
+
+    def setUp(self):
+        super().setUp()
+        reset_indexes()
+        self.addCleanup(reset_indexes)
+        self.run_workout = Workout.objects.create(
+            title='Speed Force Cardio', description='Train your speed.', difficulty='intermediate',
+            duration=45, activity_type='Running', calories_estimate=600, instructions='Sprint'
+        )
+        Workout.objects.create(
+            title='Zen Master Flexibility', description='Find balance.', difficulty='beginner',
+            duration=30, activity_type='Yoga', calories_estimate=150, instructions='Breathe'
+        )
+
+    def test_search_workouts(self):
+        """Test the endpoint returns ranked workouts for a prefix query."""
+        response = self.client.get('/api/search/', {'q': 'spee', 'type': 'workouts'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([w['title'] for w in response.data['workouts']], ['Speed Force Cardio'])
+        self.assertGreater(response.data['workouts'][0]['score'], 0)
+
+    def test_index_follows_writes(self):
+        """Test saves and deletes after the index is built are searchable."""
+        indexes['workouts'].build()
+        self.run_workout.title = 'Asgardian Thunder'
+        self.run_workout.save()
+        self.assertEqual(indexes['workouts'].search('speed force'), [])
+        self.assertEqual(len(indexes['workouts'].search('asgard')), 1)
+        self.run_workout.delete()
+        self.assertEqual(indexes['workouts'].search('asgard'), [])
+
+    @override_settings(OCTOFIT_CHANGE_SETTLE_SECONDS=0)
+    def test_index_follows_other_processes(self):
+        """Test writes logged by another worker, without this process's signals, become searchable."""
+        indexes['workouts'].build()
+        Workout.objects.filter(id=self.run_workout.id).update(title='Asgardian Thunder')
+        ChangeLogRepository(self.db).record(Workout, [self.run_workout.id])
+        self.assertEqual(len(indexes['workouts'].search('asgard')), 1)
+        self.assertEqual(indexes['workouts'].search('speed force'), [])
+
+    def test_query_is_required(self):
+        """Test a missing query is rejected."""
+        response = self.client.get('/api/search/')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        for limit in (0, -1, 101):
+            response = self.client.get('/api/search/', {'q': 'speed', 'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_admin_search_keeps_rank_order(self):
+        """Test admin changelist searches are limited and ordered best match first."""
+        Workout.objects.create(
+            title='Speed Speed Speed', description='Speed.', difficulty='advanced',
+            duration=20, activity_type='Running', calories_estimate=300, instructions='Go'
+        )
+        model_admin = WorkoutAdmin(Workout, AdminSite())
+        request = RequestFactory().get('/admin/api/workout/')
+        queryset, _ = model_admin.get_search_results(request, Workout.objects.all(), 'speed')
+        self.assertEqual([w.title for w in queryset], ['Speed Speed Speed', 'Speed Force Cardio'])
+        with self.settings(OCTOFIT_SEARCH=dict(settings.OCTOFIT_SEARCH, max_results=1)):
+            queryset, _ = model_admin.get_search_results(request, Workout.objects.all(), 'speed')
+        self.assertEqual(len(queryset), 1)
+
+
+@override_settings(OCTOFIT_ESTIMATED_COUNT_THRESHOLD=1000)
+class EstimatedCountPaginationTest(APITestCase):
+    """Test cases for estimated-count pagination."""
+
+    def setUp(self):
+        for i in range(3):
+            Activity.objects.create(
+                user_id=1, activity_type='Running', duration=30,
+                calories=300, date=timezone.now()
+            )
+        patcher = mock.patch('api.pagination.estimated_count', return_value=5000)
+        self.estimated_count = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_large_unfiltered_list_uses_estimate(self):
+        """Test a big collection reports the metadata estimate."""
+        response = self.client.get('/api/activities/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 5000)
+        self.assertTrue(response.data['count_is_estimated'])
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_small_collection_counts_exactly(self):
+        """Test collections under the threshold get an exact count."""
+        self.estimated_count.return_value = 3
+        response = self.client.get('/api/activities/')
+        self.assertEqual(response.data['count'], 3)
+        self.assertFalse(response.data['count_is_estimated'])
+
+    def test_filtered_queryset_counts_exactly(self):
+        """Test filtered result sets never use the estimate."""
+        paginator = EstimatedCountPaginator(Activity.objects.filter(calories=300).order_by('id'), 2)
+        self.assertEqual(paginator.count, 3)
+        self.assertFalse(paginator.count_is_estimated)
+        self.estimated_count.assert_not_called()
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class ActivityPartitionTest(MongoStandInMixin, APITestCase):
+    """Test cases for monthly activity partitions and query routing."""
+
+    def setUp(self):
+        super().setUp()
+        self.activities = [
+            Activity.objects.create(
+                user_id=1, activity_type='Running', duration=30, calories=300,
+                date=timezone.make_aware(datetime(2026, month, 15), dt_timezone.utc)
+            )
+            for month in (1, 2, 3)
+        ]
+        self.partitions = ActivityPartitions(self.db)
+        # Every activity above was written after partitioning began.
+        self.partitions.mark_backfilled()
+
+    def test_writes_land_in_monthly_partitions(self):
+        """Test each activity is stored in the partition for its month."""
+        self.assertEqual(
+            [p['name'] for p in self.partitions.attached()],
+            ['activities_2026_01', 'activities_2026_02', 'activities_2026_03'],
+        )
+        self.assertEqual(self.db.activities_2026_02.count_documents({}), 1)
+
+    def test_date_bounded_query_is_routed(self):
+        """Test routing only touches overlapping partitions and merges by date."""
+        start = datetime(2026, 2, 10)
+        self.assertEqual(self.partitions.route(start, datetime(2026, 3, 1)), ['activities_2026_02'])
+        found = self.partitions.find(start=datetime(2026, 1, 1), end=datetime(2026, 4, 1))
+        self.assertEqual([doc['id'] for doc in found], [a.id for a in reversed(self.activities)])
+
+    def test_moving_date_moves_partition(self):
+        """Test changing an activity's month moves it between partitions."""
+        activity = Activity.objects.get(id=self.activities[0].id)
+        activity.date = timezone.make_aware(datetime(2026, 3, 20), dt_timezone.utc)
+        activity.save()
+        self.assertEqual(self.db.activities_2026_01.count_documents({}), 0)
+        self.assertEqual(self.db.activities_2026_03.count_documents({}), 2)
+        activity.delete()
+        self.assertEqual(self.db.activities_2026_03.count_documents({}), 1)
+
+    def test_detached_partition_is_not_routed(self):
+        """Test detaching renames a partition and drops it from routing and writes."""
+        self.partitions.detach(datetime(2026, 1, 1))
+        self.assertNotIn('activities_2026_01', self.partitions.route())
+        self.assertIn('detached_activities_2026_01', self.db.list_collection_names())
+        Activity.objects.create(
+            user_id=1, activity_type='Yoga', duration=20, calories=100,
+            date=timezone.make_aware(datetime(2026, 1, 2), dt_timezone.utc)
+        )
+        self.assertNotIn('activities_2026_01', self.db.list_collection_names())
+
+    def test_api_date_range(self):
+        """Test the activities API serves date-bounded lists from partitions."""
+        response = self.client.get('/api/activities/', {'start': '2026-02-01', 'end': '2026-04-01'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([a['id'] for a in response.data], [self.activities[2].id, self.activities[1].id])
+        response = self.client.get('/api/activities/', {'start': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/activities/', {'start': '2026-01-01', 'limit': 501})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/activities/', {'start': '2026-01-01', 'limit': 1})
+        self.assertEqual([a['id'] for a in response.data], [self.activities[2].id])
+
+    def test_unbackfilled_or_detached_ranges_read_the_base_collection(self):
+        """Test partitions are only routed to when they hold every activity in the range."""
+        self.db.activities.insert_many([activity_document(a) for a in self.activities])
+        self.db.activities_2026_02.delete_many({})
+        self.db.activity_partitions.delete_one({'name': 'backfilled'})
+        repository = ActivityRepository(self.db)
+        found = repository.find(start=datetime(2026, 1, 1), end=datetime(2026, 4, 1))
+        self.assertEqual(len(found), 3)
+        self.partitions.mark_backfilled()
+        self.assertEqual(len(repository.find(start=datetime(2026, 1, 1), end=datetime(2026, 4, 1))), 2)
+        self.partitions.detach(datetime(2026, 3, 1))
+        self.assertFalse(self.partitions.covers(datetime(2026, 1, 1), datetime(2026, 4, 1)))
+        self.assertTrue(self.partitions.covers(datetime(2026, 1, 1), datetime(2026, 3, 1)))
+        self.assertEqual(len(repository.find(start=datetime(2026, 1, 1))), 3)
+
+    def test_propagation_rewrites_partition_copies(self):
+        """Test renaming a user reaches the monthly copies of their activities."""
+        user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com')
+        Activity.objects.filter(user_id=1).update(user_id=user.id)
+        propagate_user(user.id)
+        self.assertEqual({doc['user_name'] for doc in self.db.activities_2026_02.find()}, {'Tony Stark'})
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class RetentionTest(MongoStandInMixin, TestCase):
+    """Test cases for compacting old activities into rollups."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.activities.insert_many([
+            {'id': i, 'user_id': 1 + i % 2, 'team_id': 1, 'user_name': f'User {1 + i % 2}',
+             'activity_type': 'Running', 'duration': 10 * i, 'calories': 100 * i,
+             'distance': float(i), 'date': datetime(2024, 1, 1 + i % 3, 8)}
+            for i in range(1, 11)
+        ])
+        self.db.activities.insert_one({
+            'id': 11, 'user_id': 1, 'team_id': 1, 'activity_type': 'Running', 'duration': 5,
+            'calories': 50, 'distance': 1.0, 'date': datetime(2026, 10, 1),
+        })
+        self.cutoff = datetime(2025, 1, 1)
+        TeamStatsRepository(self.db).rebuild()
+        self.expected = TeamStatsRepository(self.db).get(1)
+
+    def test_compaction_preserves_totals(self):
+        """Test old rows become rollups and team totals do not move."""
+        report = compact_activities(self.cutoff, batch_size=3, db=self.db)
+        self.assertEqual(report.activities, 10)
+        self.assertEqual(report.batches, 4)
+        self.assertEqual(self.db.activities.count_documents({}), 1)
+        self.assertEqual(self.db.activity_rollups.count_documents({}), report.rollups)
+        TeamStatsRepository(self.db).rebuild()
+        self.assertEqual(TeamStatsRepository(self.db).get(1), self.expected)
+        totals = ActivityRepository(self.db).totals_for_users([1, 2])
+        self.assertEqual(totals[1]['total_calories'] + totals[2]['total_calories'], 5550)
+
+    def test_dry_run_writes_nothing(self):
+        """Test a dry run only reports what it would reclaim."""
+        report = compact_activities(self.cutoff, batch_size=4, dry_run=True, db=self.db)
+        self.assertEqual(report.activities, 10)
+        self.assertEqual(report.rollups, 6)
+        self.assertGreater(report.bytes_reclaimed, 0)
+        self.assertEqual(self.db.activities.count_documents({}), 11)
+        self.assertNotIn('activity_rollups', self.db.list_collection_names())
+
+    def test_late_edits_into_compacted_days_are_folded(self):
+        """Test an old activity that only reaches a compacted day later is still counted, once."""
+        self.db.activities.update_one({'id': 2}, {'$set': {'date': datetime(2026, 10, 2)}})
+        compact_activities(self.cutoff, batch_size=3, db=self.db)
+        # Activity 2 is edited back into a day whose rollup already holds higher ids (4 and 10).
+        self.db.activities.update_one({'id': 2}, {'$set': {'date': datetime(2024, 1, 2, 9)}})
+        compact_activities(self.cutoff, batch_size=3, db=self.db)
+        self.assertEqual(self.db.activities.count_documents({}), 1)
+        totals = ActivityRepository(self.db).totals_for_users([1, 2])
+        self.assertEqual(totals[1]['total_calories'] + totals[2]['total_calories'], 5550)
+        self.assertEqual(self.db.activity_rollups.count_documents({'batches': {'$ne': []}}), 0)
+
+    def test_detaching_a_month_frees_the_base_collection(self):
+        """Test a detached month leaves the base collection, is archived and keeps its totals."""
+        name, report = detach_month(datetime(2024, 1, 20), batch_size=4, db=self.db)
+        self.assertEqual(name, 'activities_2024_01')
+        self.assertEqual(report.activities, 10)
+        self.assertEqual(self.db.activities.count_documents({}), 1)
+        self.assertEqual(self.db.detached_activities_2024_01.count_documents({}), 10)
+        self.assertFalse(ActivityPartitions(self.db).covers(datetime(2024, 1, 1), datetime(2024, 2, 1)))
+        TeamStatsRepository(self.db).rebuild()
+        self.assertEqual(TeamStatsRepository(self.db).get(1), self.expected)
+
+    def test_interrupted_run_resumes_without_double_counting(self):
+        """Test rerunning after a crash between folding and deleting is exact."""
+        delete_many = mongomock.collection.Collection.delete_many
+
+        def interrupted(collection, *args, **kwargs):
+            if collection.name == 'activities':
+                raise RuntimeError('interrupted')
+            return delete_many(collection, *args, **kwargs)
+
+        with mock.patch.object(mongomock.collection.Collection, 'delete_many', interrupted):
+            with self.assertRaises(RuntimeError):
+                compact_activities(self.cutoff, batch_size=4, db=self.db)
+        compact_activities(self.cutoff, batch_size=4, db=self.db)
+        TeamStatsRepository(self.db).rebuild()
+        self.assertEqual(TeamStatsRepository(self.db).get(1), self.expected)
+
+
+class StartupProfileTest(TestCase):
+    """Test cases for the startup import profiler."""
+
+    def test_parse_importtime(self):
+        """Test importtime lines are parsed and split into boot and request phases."""
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |   django.conf',
+            'import time:       300 |        420 | octofit_tracker.wsgi',
+            FIRST_REQUEST_MARKER,
+            'import time:        80 |         80 | rest_framework.views',
+        ])
+        self.assertEqual(parse_importtime(stderr), [
+            ('django.conf', 120, 120, True),
+            ('octofit_tracker.wsgi', 300, 420, True),
+            ('rest_framework.views', 80, 80, False),
+        ])
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class SnapshotTest(MongoStandInMixin, TestCase):
+    """Test cases for snapshot save and restore."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.users.insert_many([
+            {'id': i, 'name': f'Hero {i}', 'email': f'hero{i}@marvel.com', 'team_id': 1,
+             'role': 'member', 'created_at': datetime(2026, 1, i, 12, 30)}
+            for i in range(1, 4)
+        ])
+        self.db.activities.insert_many([
+            {'id': i, 'user_id': 1, 'user_name': 'Hero 1', 'team_id': 1, 'activity_type': 'Running',
+             'duration': 30, 'calories': 300, 'distance': 5.5, 'date': datetime(2026, 2, i), 'notes': ''}
+            for i in range(1, 6)
+        ])
+        self.db['__schema__'].insert_one({'name': 'users', 'auto': {'field_names': ['id'], 'seq': 3}})
+        handle, self.path = tempfile.mkstemp(suffix='.zip')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def documents(self, name):
+        return list(self.db[name].find({}, {'_id': 0}).sort('id', 1))
+
+    def test_round_trip(self):
+        """Test a restore brings back exactly what was saved."""
+        expected = {name: self.documents(name) for name in ('users', 'activities')}
+        counts = save_snapshot(self.path, db=self.db)
+        self.assertEqual(counts['activities'], 5)
+        self.db.users.delete_many({'id': 2})
+        self.db.activities.insert_one({'id': 99, 'user_id': 2})
+        self.db['__schema__'].update_one({'name': 'users'}, {'$set': {'auto.seq': 50}})
+        restored = load_snapshot(self.path, db=self.db, chunk_size=2)
+        self.assertEqual(restored['users'], 3)
+        for name, documents in expected.items():
+            self.assertEqual(self.documents(name), documents)
+        self.assertEqual(self.db['__schema__'].find_one({'name': 'users'})['auto']['seq'], 3)
+
+    def test_commands_rebuild_derived_data(self):
+        """Test the commands restore and then refresh team stats and partitions."""
+        call_command('snapshot_save', self.path, stdout=StringIO())
+        self.db.activities.delete_many({})
+        call_command('snapshot_load', self.path, stdout=StringIO())
+        self.assertEqual(self.db.activities.count_documents({}), 5)
+        self.assertEqual(TeamStatsRepository(self.db).get(1)['activity_count'], 5)
+        self.assertEqual(self.db.activities_2026_02.count_documents({}), 5)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class MongoCacheTest(MongoStandInMixin, TestCase):
+    """Test cases for the shared MongoDB cache backend."""
+
+    def setUp(self):
+        super().setUp()
+        self.cache = MongoCache('django_cache', {})
+
+    def test_add_incr_and_expiry(self):
+        """Test add is first-writer-wins, incr is atomic and expired entries are ignored or taken over."""
+        self.assertTrue(self.cache.add('hits', 1))
+        self.assertFalse(self.cache.add('hits', 5))
+        self.assertEqual(self.cache.incr('hits', 2), 3)
+        self.assertEqual(self.cache.get('hits'), 3)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+        self.cache.set('bucket', (1.5, 100.0), timeout=60)
+        self.assertEqual(self.cache.get('bucket'), (1.5, 100.0))
+        self.db.django_cache.update_many({}, {'$set': {'expires': datetime(2000, 1, 1)}})
+        self.assertIsNone(self.cache.get('bucket'))
+        self.assertTrue(self.cache.add('hits', 7))
+        self.assertEqual(self.cache.get('hits'), 7)
+
+
+class ThrottlingTest(APITestCase):
+    """Test cases for token-bucket throttling and load shedding."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        patcher = mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', {'read': '2/min', 'write': '1/min'})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reads_and_writes_have_separate_buckets(self):
+        """Test a client is throttled per budget once its bucket is empty."""
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/teams/').status_code, status.HTTP_200_OK)
+        response = self.client.get('/api/teams/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        response = self.client.post('/api/teams/', {'name': 'Team Marvel'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post('/api/teams/', {'name': 'Team DC'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_bucket_refills_over_time(self):
+        """Test tokens come back at the configured rate."""
+        with mock.patch.object(TokenBucketThrottle, 'timer', return_value=1000.0):
+            for _ in range(3):
+                response = self.client.get('/api/teams/')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        with mock.patch.object(TokenBucketThrottle, 'timer', return_value=1030.0):
+            self.assertEqual(self.client.get('/api/teams/').status_code, status.HTTP_200_OK)
+
+    def test_sheds_load_when_too_many_requests_are_in_flight(self):
+        """Test requests beyond the in-flight limit get a 503 with Retry-After."""
+        with self.settings(OCTOFIT_LOAD_SHEDDING=dict(settings.OCTOFIT_LOAD_SHEDDING, max_in_flight=0)):
+            response = self.client.get('/api/teams/')
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '5')
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse())
+        with self.settings(OCTOFIT_LOAD_SHEDDING=dict(settings.OCTOFIT_LOAD_SHEDDING, max_in_flight=0)):
+            response = middleware(RequestFactory().get('/api/teams/'))
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(middleware.in_flight, 0)
+
+    def test_concurrent_requests_share_one_bucket(self):
+        """Test concurrent requests from one client cannot spend the same token twice."""
+        request = APIRequestFactory().get('/api/teams/')
+        request.user = AnonymousUser()
+
+        def allowed(_):
+            return TokenBucketThrottle().allow_request(request, None)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            self.assertEqual(sum(pool.map(allowed, range(8))), 2)
+
+    def test_held_lock_throttles(self):
+        """Test a request that cannot take the bucket lock is throttled rather than let through."""
+        throttle = TokenBucketThrottle()
+        request = APIRequestFactory().get('/api/teams/')
+        request.user = AnonymousUser()
+        cache.add(throttle.cache_format % {'scope': 'read', 'ident': '127.0.0.1'} + ':lock', 1)
+        with mock.patch.object(TokenBucketThrottle, 'LOCK_WAIT', 0):
+            self.assertFalse(throttle.allow_request(request, None))
+        self.assertEqual(throttle.wait(), 30)
+
+    def test_sheds_load_while_latency_is_high(self):
+        """Test a slow average sheds requests until the verdict goes stale."""
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse())
+        middleware.latency, middleware.measured_at = 10.0, 100.0
+        self.assertTrue(middleware.overloaded(1, now=101.0))
+        self.assertFalse(middleware.overloaded(1, now=106.0))
+
+
+class CoalesceTest(TestCase):
+    """Test cases for single-flight coalescing of aggregate reads."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        time.sleep(0.05)
+        return self.calls
+
+    def test_concurrent_callers_share_one_computation(self):
+        """Test threads asking for the same key wait on a single computation."""
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda _: single_flight('leaderboard', self.compute), range(8)))
+        self.assertEqual(results, [1] * 8)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_value_served_while_revalidating(self):
+        """Test a stale entry is returned while another worker holds the refresh lock."""
+        single_flight('leaderboard', self.compute)
+        key = 'coalesce:' + hashlib.md5(b'leaderboard').hexdigest()
+        entry = cache.get(key)
+        cache.set(key, dict(entry, fresh_until=0))
+        cache.add(f'{key}:lock', 1)
+        self.assertEqual(single_flight('leaderboard', self.compute), 1)
+        cache.delete(f'{key}:lock')
+        self.assertEqual(single_flight('leaderboard', self.compute), 2)
+        self.assertEqual(single_flight('leaderboard', self.compute), 2)
+
+    def test_waits_for_another_process(self):
+        """Test a caller that loses the cross-process lock polls for the winner's result."""
+        key = 'coalesce:' + hashlib.md5(b'team-stats').hexdigest()
+        cache.add(f'{key}:lock', 1)
+        publisher = threading.Timer(0.1, cache.set, (key, {'value': 'shared', 'fresh_until': time.time() + 5}))
+        publisher.start()
+        self.assertEqual(single_flight('team-stats', self.compute), 'shared')
+        self.assertEqual(self.calls, 0)
+
+    def test_failures_are_not_shared(self):
+        """Test callers waiting on a failed computation compute for themselves."""
+        started = threading.Event()
+
+        def compute():
+            self.calls += 1
+            if self.calls == 1:
+                started.set()
+                time.sleep(0.1)
+                raise Uncacheable(self.calls)
+            return self.calls
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(single_flight, 'team-stats', compute)
+            started.wait()
+            second = pool.submit(single_flight, 'team-stats', compute)
+            with self.assertRaises(Uncacheable):
+                first.result()
+            self.assertEqual(second.result(), 2)
+
+    @override_settings(OCTOFIT_COALESCING=dict(settings.OCTOFIT_COALESCING, wait_seconds=0.05, lock_seconds=0))
+    def test_slow_leader_does_not_fail_followers(self):
+        """Test a caller that outwaits a slow leader computes for itself instead of erroring."""
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+            return 'leader'
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(single_flight, 'roster', slow)
+            started.wait()
+            self.assertEqual(single_flight('roster', lambda: 'follower'), 'follower')
+            release.set()
+            self.assertEqual(leader.result(), 'leader')
+
+    def test_actions_are_coalesced(self):
+        """Test repeated leaderboard reads within the fresh window hit Mongo once."""
+        with mock.patch('api.views.LeaderboardRepository') as repository:
+            repository.return_value.top.return_value = []
+            self.client.get('/api/leaderboard/top/')
+            self.client.get('/api/leaderboard/top/')
+            self.client.get('/api/leaderboard/top/?limit=3')
+        self.assertEqual(repository.return_value.top.call_count, 2)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class SchedulerTest(MongoStandInMixin, TestCase):
+    """Test cases for the in-process job scheduler."""
+
+    def test_api_jobs_are_registered(self):
+        """Test loading the job modules registers the api app's periodic jobs."""
+        self.assertTrue({'recompute_leaderboard', 'compact_activities', 'create_partitions'} <= set(load_jobs()))
+
+    def test_jobs_are_not_loaded_at_startup(self):
+        """Test app startup leaves the job modules, and what they import, unloaded."""
+        script = 'import sys, django; django.setup(); print("api.jobs" in sys.modules)'
+        result = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True, cwd=settings.BASE_DIR, check=True
+        )
+        self.assertEqual(result.stdout.strip(), 'False')
+
+    def test_runs_are_timed_and_failures_recorded(self):
+        """Test each run records its duration, outcome and result."""
+        def broken():
+            raise RuntimeError('boom')
+        scheduler = Scheduler([Job('ok', lambda: {'rows': 3}, 60), Job('broken', broken, 60)])
+        self.assertEqual(scheduler.run_once(), {'ok': True, 'broken': True})
+        runs = {run['job']: run for run in self.db.job_runs.find()}
+        self.assertEqual(runs['ok']['result'], {'rows': 3})
+        self.assertEqual(runs['broken']['status'], 'failed')
+        self.assertIn('boom', runs['broken']['error'])
+        self.assertEqual(JobRunRepository(self.db).summary()['ok']['runs'], 1)
+
+    def test_overlapping_runs_are_skipped(self):
+        """Test a job holding its lease is not started by another scheduler."""
+        other = Scheduler([])
+        other.runs.ensure_indexes()
+        self.assertTrue(other.runs.acquire('slow', other.owner, 60))
+        calls = []
+        scheduler = Scheduler([Job('slow', lambda: calls.append(1), 60)])
+        self.assertEqual(scheduler.run_once(), {'slow': False})
+        other.runs.release('slow', other.owner)
+        self.assertEqual(scheduler.run_once(), {'slow': True})
+        self.assertEqual(calls, [1])
+
+    def test_jitter_stays_within_bounds(self):
+        """Test the delay before a run is the interval plus at most its jitter."""
+        job = Job('jittered', None, 100, jitter=0.2)
+        self.assertTrue(all(100 <= job.next_delay() <= 120 for _ in range(50)))
+
+    def test_recompute_leaderboard_dense_ranks(self):
+        """Test the leaderboard job ranks teams by points with shared ranks for ties."""
+        marvel, dc, x_men = (Team.objects.create(name=name) for name in ('Marvel', 'DC', 'X-Men'))
+        for team, calories in ((marvel, 500), (dc, 500), (x_men, 200)):
+            TeamStatsRepository(self.db).increment(team.id, activity_count=1, total_calories=calories)
+        self.db.leaderboard.insert_one({'id': 1, 'team_id': marvel.id, 'team_name': 'Marvel', 'rank': 9})
+        self.db.leaderboard.insert_one({'id': 2, 'team_id': 99, 'team_name': 'Gone', 'rank': 1})
+        self.assertEqual(recompute_leaderboard(), 3)
+        self.assertEqual(self.db.leaderboard.find_one({'team_id': marvel.id})['rank'], 1)
+        self.assertIsNone(self.db.leaderboard.find_one({'team_id': 99}))
+        created = {entry.team_id: entry.rank for entry in Leaderboard.objects.all()}
+        self.assertEqual(created, {dc.id: 1, x_men.id: 2})
+        self.assertEqual(dense_ranks([5, 9, 5, 1]), {9: 1, 5: 2, 1: 3})
+
+    def test_command_runs_selected_jobs_once(self):
+        """Test ``run_scheduler --once`` runs and reports the chosen jobs."""
+        out = StringIO()
+        call_command('run_scheduler', '--once', '--job', 'create_partitions', stdout=out)
+        self.assertIn('create_partitions: ran', out.getvalue())
+        self.assertEqual(self.db.job_runs.count_documents({'job': 'create_partitions'}), 1)
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class UserImportTest(MongoStandInMixin, APITestCase):
+    """Test cases for the bulk user import."""
+
+    def setUp(self):
+        super().setUp()
+        self.marvel = Team.objects.create(name='Team Marvel')
+        self.dc = Team.objects.create(name='Team DC')
+        self.db.users.insert_one(
+            {'id': 500, 'name': 'Bruce Wayne', 'email': 'batman@dc.com', 'team_id': self.marvel.id, 'role': 'member'}
+        )
+
+    def stats(self, team):
+        return TeamStatsRepository(self.db).get(team.id)
+
+    def test_csv_upserts_by_email(self):
+        """Test a CSV body creates, updates and rejects rows and reports the counts."""
+        body = (
+            'name,email,team,role\n'
+            'Bruce Wayne,batman@dc.com,Team DC,\n'
+            'Tony Stark,iron.man@marvel.com,Team Marvel,captain\n'
+            'Nobody,not-an-email,Team DC,\n'
+            'Clark Kent,superman@dc.com,Team Krypton,\n'
+            'Anthony Stark,iron.man@marvel.com,Team Marvel,captain\n'
+        )
+        response = self.client.post('/api/users/import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'unchanged', 'rejected')},
+            {'created': 1, 'updated': 1, 'unchanged': 0, 'rejected': 2},
+        )
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+        created = User.objects.get(email='iron.man@marvel.com')
+        self.assertEqual((created.name, created.team_id, created.role), ('Anthony Stark', self.marvel.id, 'captain'))
+        self.assertEqual(self.db.users.find_one({'id': 500})['team_id'], self.dc.id)
+        self.assertEqual(self.stats(self.dc)['member_count'], 1)
+        self.assertEqual(self.stats(self.marvel)['member_count'], 0)
+
+    def test_unsupported_content_type(self):
+        """Test bodies that are neither CSV nor NDJSON are refused."""
+        response = self.client.post('/api/users/import/', {'name': 'x'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_batch_size_is_bounded(self):
+        """Test batch sizes outside 1..5000 are refused before anything is read."""
+        body = 'name,email\nBruce Wayne,batman@dc.com\n'
+        for batch_size in (0, -1, 5001):
+            response = self.client.post(f'/api/users/import/?batch_size={batch_size}', body, content_type='text/csv')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('batch_size', response.data)
+        self.assertFalse(User.objects.filter(email='batman@dc.com').exists())
+
+    def test_rows_are_matched_case_insensitively(self):
+        """Test mixed-case emails update the stored user and overlong roles are rejected."""
+        body = (
+            'name,email,team,role\n'
+            'Bruce Wayne,BatMan@DC.com,Team DC,\n'
+            f'Tony Stark,iron.man@marvel.com,Team Marvel,{"x" * 101}\n'
+        )
+        response = self.client.post('/api/users/import/', body, content_type='text/csv')
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'unchanged', 'rejected')},
+            {'created': 0, 'updated': 1, 'unchanged': 0, 'rejected': 1},
+        )
+        self.assertEqual(response.data['errors'], [{'line': 3, 'error': 'Role is too long.'}])
+        self.assertEqual(self.db.users.find_one({'id': 500})['team_id'], self.dc.id)
+        self.assertFalse(User.objects.filter(email__iexact='batman@dc.com').exists())
+
+    def test_concurrent_insert_falls_back_to_upserts(self):
+        """Test an email created after the lookup turns into an update instead of failing the batch."""
+        def racing_bulk_create(users):
+            self.db.users.insert_one(
+                {'id': 501, 'name': 'Diana', 'email': 'wonder@dc.com', 'team_id': self.marvel.id, 'role': 'member'}
+            )
+            raise IntegrityError('duplicate key: wonder@dc.com')
+
+        body = 'name,email,team\nDiana Prince,wonder@dc.com,Team DC\nClark Kent,superman@dc.com,Team DC\n'
+        with mock.patch.object(User.objects, 'bulk_create', side_effect=racing_bulk_create):
+            response = self.client.post('/api/users/import/', body, content_type='text/csv')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            {key: response.data[key] for key in ('created', 'updated', 'unchanged', 'rejected')},
+            {'created': 1, 'updated': 1, 'unchanged': 0, 'rejected': 0},
+        )
+        diana = self.db.users.find_one({'id': 501})
+        self.assertEqual((diana['name'], diana['team_id']), ('Diana Prince', self.dc.id))
+        self.assertTrue(User.objects.filter(email='superman@dc.com').exists())
+        self.assertEqual(self.stats(self.dc)['member_count'], 2)
+        self.assertEqual(self.stats(self.marvel)['member_count'], -1)
+
+    def test_command_imports_ndjson_in_batches(self):
+        """Test the command reads NDJSON files and reimports idempotently."""
+        with tempfile.NamedTemporaryFile('w', suffix='.ndjson', delete=False) as handle:
+            handle.write('{"name": "Bruce Wayne", "email": "batman@dc.com"}\n')
+            handle.write('{"name": "Diana Prince", "email": "wonder@dc.com", "team_id": %d}\n' % self.dc.id)
+            handle.write('[1, 2]\n')
+        self.addCleanup(os.remove, handle.name)
+        out = StringIO()
+        call_command('import_users', handle.name, '--batch-size', '2', stdout=out)
+        self.assertIn('1 created, 0 updated, 1 unchanged, 1 rejected', out.getvalue())
+        self.assertEqual(User.objects.get(email='wonder@dc.com').team_id, self.dc.id)
+        self.assertEqual(self.stats(self.dc)['member_count'], 1)
+
+
+@skipUnless(mongomock and numpy, 'mongomock and numpy are required')
+class AnalyticsTest(MongoStandInMixin, APITestCase):
+    """Test cases for the streamed percentile and histogram analytics."""
+
+    def setUp(self):
+        super().setUp()
+        rng = numpy.random.default_rng(7)
+        self.durations = {'Running': rng.integers(10, 90, 400), 'Yoga': rng.integers(20, 60, 150)}
+        docs = []
+        for activity_type, durations in self.durations.items():
+            for index, duration in enumerate(durations):
+                docs.append({
+                    'id': len(docs) + 1, 'team_id': 1, 'activity_type': activity_type,
+                    'duration': int(duration), 'calories': int(duration) * 10,
+                    'distance': float(duration) / 10 if activity_type == 'Running' else None,
+                    'date': datetime(2024, 1 + index % 6, 1),
+                })
+        self.db.activities.insert_many(docs)
+
+    def test_quantiles_match_numpy_within_one_fine_bin(self):
+        """Test streamed p50/p90 agree with an in-memory percentile."""
+        groups = distributions({}, group_by='activity_type', bins=10, chunk_size=64, db=self.db)
+        by_type = {group['activity_type']: group for group in groups}
+        for activity_type, durations in self.durations.items():
+            metric = by_type[activity_type]['metrics']['duration']
+            tolerance = (durations.max() - durations.min()) / (10 * FINE_BINS_PER_BIN) + 1
+            self.assertAlmostEqual(metric['p50'], numpy.percentile(durations, 50), delta=tolerance)
+            self.assertAlmostEqual(metric['p90'], numpy.percentile(durations, 90), delta=tolerance)
+            self.assertEqual(sum(metric['histogram']['counts']), len(durations))
+        self.assertNotIn('distance', by_type['Yoga']['metrics'])
+
+    def test_chunk_size_does_not_change_results(self):
+        """Test results are the same however the columns are chunked."""
+        small = distributions({}, bins=5, chunk_size=7, db=self.db)
+        large = distributions({}, bins=5, chunk_size=10000, db=self.db)
+        self.assertEqual(small, large)
+
+    def test_endpoint_filters_and_caches(self):
+        """Test the endpoint applies the window and caches per filter."""
+        response = self.client.get('/api/analytics/?group_by=activity_type&start=2024-01-01&end=2024-02-01')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        counts = {group['activity_type']: group['count'] for group in response.data['groups']}
+        self.assertEqual(counts, {'Running': 67, 'Yoga': 25})
+        with mock.patch('api.analytics.distributions') as computed:
+            self.client.get('/api/analytics/?group_by=activity_type&start=2024-01-01&end=2024-02-01')
+            computed.assert_not_called()
+        response = self.client.get('/api/analytics/?group_by=planet')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+    def test_groups_times_bins_is_capped(self):
+        """Test filters with more groups than the bins allow are refused before histograms are allocated."""
+        self.db.activities.insert_many([
+            {'id': 1000 + team_id, 'team_id': team_id, 'activity_type': 'Running', 'duration': 30}
+            for team_id in range(2, 12)
+        ])
+        with mock.patch('api.analytics.np.zeros', wraps=numpy.zeros) as zeros:
+            with self.assertRaises(TooManyGroups):
+                distributions({}, group_by='team', bins=10, chunk_size=4, max_group_bins=50, db=self.db)
+        self.assertFalse([call for call in zeros.call_args_list if isinstance(call.args[0], tuple)])
+        self.assertEqual(len(distributions({}, group_by='team', bins=4, max_group_bins=50, db=self.db)), 11)
+        with override_settings(OCTOFIT_ANALYTICS_MAX_GROUP_BINS=50):
+            response = self.client.get('/api/analytics/?group_by=team&bins=10')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('group_by', response.data)
+
+@skipUnless(mongomock, 'mongomock is not installed')
+@override_settings(OCTOFIT_CHANGE_SETTLE_SECONDS=0)
+class ChangesFeedTest(MongoStandInMixin, APITestCase):
+    """Test cases for change tracking and the sync feed."""
+
+    def setUp(self):
+        super().setUp()
+        self.token = self.client.get('/api/changes/').data['next']
+
+    def poll(self, token, **params):
+        response = self.client.get('/api/changes/', dict(params, since=token))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_feed_returns_latest_state_and_tombstones(self):
+        """Test a poll collapses repeated changes and reports deletes."""
+        team = Team.objects.create(name='Team Marvel')
+        user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com', team_id=team.id)
+        user.name = 'Iron Man'
+        user.save()
+        team_id = team.id
+        team.delete()
+        page = self.poll(self.token)
+        self.assertEqual(
+            [(change['model'], change['op']) for change in page['changes']],
+            [('users', 'upsert'), ('teams', 'delete')],
+        )
+        self.assertEqual(page['changes'][0]['data']['name'], 'Iron Man')
+        self.assertEqual(page['changes'][1]['id'], team_id)
+        self.assertEqual(self.poll(page['next'])['changes'], [])
+
+    def test_pages_and_model_filter(self):
+        """Test a limited poll reports more pages and models can be filtered."""
+        for index in range(3):
+            Team.objects.create(name=f'Team {index}')
+        User.objects.create(name='Tony Stark', email='iron.man@marvel.com')
+        page = self.poll(self.token, limit=2)
+        self.assertTrue(page['has_more'])
+        page = self.poll(page['next'], limit=2)
+        self.assertEqual(len(page['changes']), 2)
+        self.assertFalse(page['has_more'])
+        page = self.poll(self.token, models='users')
+        self.assertEqual([change['model'] for change in page['changes']], ['users'])
+        for limit in (0, -1, 1001):
+            response = self.client.get('/api/changes/', {'since': self.token, 'limit': limit})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertIn('limit', response.data)
+
+    def test_pruned_tokens_expire(self):
+        """Test a token older than the retained log gets a 410."""
+        Team.objects.create(name='Team Marvel')
+        self.assertEqual(ChangeLogRepository(self.db).prune(days=-1), 1)
+        response = self.client.get('/api/changes/', {'since': self.token})
+        self.assertEqual(response.status_code, status.HTTP_410_GONE)
+
+    def test_recent_entries_are_held_back(self):
+        """Test entries inside the settle window are not handed out yet."""
+        Team.objects.create(name='Team Marvel')
+        with self.settings(OCTOFIT_CHANGE_SETTLE_SECONDS=60):
+            page = self.poll(self.token)
+        self.assertEqual((page['changes'], page['next'], page['has_more']), ([], self.token, True))
+
+    def test_saves_stamp_updated_at(self):
+        """Test every tracked model records its modification time."""
+        before = timezone.now()
+        workout = Workout.objects.create(
+            title='Run', description='', difficulty='beginner', duration=10,
+            activity_type='running', calories_estimate=100, instructions='Go'
+        )
+        self.assertGreaterEqual(workout.updated_at, before)
+
+    def test_migration_indexes_the_log(self):
+        """Test the change log indexes feed reads and keep sequence numbers unique."""
+        self.migrate_mongo('0010_change_log_indexes')
+        indexes = self.db.changes.index_information()
+        self.assertTrue(indexes['seq_1']['unique'])
+        self.assertEqual(indexes['model_1_seq_1']['key'], [('model', 1), ('seq', 1)])
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class DashboardTest(MongoStandInMixin, APITestCase):
+    """Test cases for the composite dashboard endpoint."""
+
+    def setUp(self):
+        super().setUp()
+        self.db.teams.insert_many([
+            {'id': 1, 'name': 'Team Marvel', 'description': '', 'created_at': datetime(2026, 1, 1)},
+            {'id': 2, 'name': 'Team DC', 'description': '', 'created_at': datetime(2026, 1, 1)},
+        ])
+        self.db.users.insert_many([
+            {'id': 1, 'name': 'Tony Stark', 'email': 'iron.man@marvel.com', 'team_id': 1,
+             'role': 'team_leader', 'created_at': datetime(2026, 1, 1)},
+            {'id': 2, 'name': 'Bruce Wayne', 'email': 'batman@dc.com', 'team_id': 2,
+             'role': 'member', 'created_at': datetime(2026, 1, 2)},
+            {'id': 3, 'name': 'Peter Parker', 'email': 'spidey@marvel.com', 'team_id': None,
+             'role': 'member', 'created_at': datetime(2026, 1, 3)},
+        ])
+        self.db.activities.insert_many([
+            {'id': i, 'user_id': 1, 'user_name': 'Tony Stark', 'team_id': 1,
+             'activity_type': 'Running', 'duration': 30,
+             'calories': 300, 'distance': 5.0, 'date': datetime(2026, 1, i), 'notes': ''}
+            for i in range(1, 4)
+        ])
+        self.db.leaderboard.insert_many([
+            {'id': 1, 'team_id': 1, 'team_name': 'Team Marvel', 'total_points': 500,
+             'total_activities': 3, 'rank': 2, 'updated_at': datetime(2026, 1, 3)},
+            {'id': 2, 'team_id': 2, 'team_name': 'Team DC', 'total_points': 900,
+             'total_activities': 5, 'rank': 1, 'updated_at': datetime(2026, 1, 3)},
+        ])
+
+    def test_dashboard_sections(self):
+        """Test one response carries users with team names, teams, leaderboard and latest activities."""
+        response = self.client.get('/api/dashboard/', {'activities': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(user['name'], user['team_name']) for user in response.data['users']],
+            [('Tony Stark', 'Team Marvel'), ('Bruce Wayne', 'Team DC'), ('Peter Parker', None)],
+        )
+        self.assertEqual([team['name'] for team in response.data['teams']], ['Team Marvel', 'Team DC'])
+        self.assertEqual([entry['team_name'] for entry in response.data['leaderboard']], ['Team DC', 'Team Marvel'])
+        self.assertEqual([activity['id'] for activity in response.data['activities']], [3, 2])
+        self.assertEqual(response.data['activities'][0]['team_name'], 'Team Marvel')
+
+    def test_team_names_batched_without_teams_section(self):
+        """Test team names are still resolved, with one lookup, when teams are not requested."""
+        with mock.patch('api.dashboard.TeamRepository.names', autospec=True,
+                        side_effect=lambda repo, ids: {1: 'Team Marvel', 2: 'Team DC'}) as names:
+            response = self.client.get('/api/dashboard/', {'sections': 'users,activities'})
+        self.assertEqual(set(response.data), {'users', 'activities'})
+        self.assertEqual(response.data['users'][1]['team_name'], 'Team DC')
+        names.assert_called_once()
+        self.assertEqual(set(names.call_args.args[1]), {1, 2})
+
+    def test_invalid_parameters(self):
+        """Test unknown sections and out-of-range limits are rejected."""
+        response = self.client.get('/api/dashboard/', {'sections': 'users,secrets'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get('/api/dashboard/', {'activities': 0})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_migration_indexes_latest_activities(self):
+        """Test the newest-first activity reads are served by indexes."""
+        self.migrate_mongo('0011_activity_date_indexes')
+        indexes = self.db.activities.index_information()
+        self.assertEqual(indexes['date_-1']['key'], [('date', -1)])
+        self.assertEqual(indexes['user_id_1_date_-1']['key'], [('user_id', 1), ('date', -1)])
+
+
+class ProfilingTest(APITestCase):
+    """Test cases for on-demand request profiling."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        patcher = override_settings(OCTOFIT_PROFILING=dict(
+            settings.OCTOFIT_PROFILING, directory=self.directory, max_profiles=2
+        ))
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+
+    def artifacts(self):
+        return sorted(os.listdir(self.directory))
+
+    def test_staff_session_profiles_request(self):
+        """Test a staff session's ?profile request leaves a profile and a summary."""
+        staff = get_user_model().objects.create_user('coach', password='secret', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get('/api/workouts/', {'profile': ''})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        name = response['X-Profile']
+        self.assertEqual(self.artifacts(), [f'{name}.prof', f'{name}.txt'])
+        with open(os.path.join(self.directory, f'{name}.txt')) as summary:
+            self.assertIn('GET /api/workouts/?profile=', summary.readline())
+
+    def test_signed_header_profiles_request(self):
+        """Test a signed header enables profiling and old runs are pruned."""
+        for _ in range(3):
+            response = self.client.get('/api/workouts/', HTTP_X_OCTOFIT_PROFILE=make_token('ops'))
+            self.assertTrue(response['X-Profile'].endswith('-ops'))
+        self.assertEqual(len(self.artifacts()), 4)
+
+    def test_unauthorized_requests_are_not_profiled(self):
+        """Test anonymous ?profile and forged headers are served without profiling."""
+        response = self.client.get('/api/workouts/', {'profile': ''})
+        self.assertNotIn('X-Profile', response)
+        response = self.client.get('/api/workouts/', HTTP_X_OCTOFIT_PROFILE='ops:forged:signature')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile', response)
+        self.assertEqual(self.artifacts(), [])
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class SlowQueryLogTest(MongoStandInMixin, APITestCase):
+    """Test cases for the slow query log."""
+
+    def options(self, **overrides):
+        return dict(settings.OCTOFIT_SLOW_QUERIES, **overrides)
+
+    def find_event(self, request_id=1, **filter):
+        return SimpleNamespace(
+            command_name='find', request_id=request_id,
+            command={'find': 'activities', 'filter': filter, 'lsid': {'id': 'session'}},
+        )
+
+    def test_request_statements_are_logged(self):
+        """Test slow ORM statements of an API request are logged with the calling view."""
+        with self.settings(OCTOFIT_SLOW_QUERIES=self.options(threshold_ms=0)):
+            response = self.client.get('/api/workouts/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        entry = self.db.slow_queries.find_one()
+        self.assertEqual(entry['view'], 'workout-list')
+        self.assertIn('workouts', entry['sql'])
+        self.assertEqual(entry['shape'], querylog.sql_shape(entry['sql']))
+
+    def test_commands_attributed_to_statements(self):
+        """Test djongo's lazy fetch counts toward its statement and native commands stand alone."""
+        recorder = querylog.start(self.options(threshold_ms=50))
+        recorder.execute(
+            lambda *args: None, 'SELECT "activities"."id" FROM "activities" WHERE "id" IN (%s, %s)',
+            [1, 2], False, {},
+        )
+        recorder.command(self.find_event(id={'$in': [1, 2]}), True, 60.0)
+        listener = querylog.SlowCommandListener()
+        listener.started(self.find_event(request_id=2, user_id=7))
+        listener.succeeded(SimpleNamespace(request_id=2, duration_micros=75000))
+        querylog.finish(recorder)
+
+        native, statement = self.db.slow_queries.find().sort('sql', 1)
+        self.assertIsNone(native['sql'])
+        self.assertEqual(native['shape'], 'find activities {"filter": {"user_id": "?"}}')
+        self.assertNotIn('lsid', native['commands'][0]['body'])
+        self.assertIn('IN (%s, ...)', statement['shape'])
+        self.assertGreaterEqual(statement['elapsed_ms'], 60.0)
+        self.assertEqual(statement['commands'][0]['command'], 'find')
+        self.assertIsNone(querylog.current())
+
+    def test_sampling_and_bounds(self):
+        """Test the sample rate, the per-request cap and the collection size limit."""
+        recorder = querylog.start(self.options(threshold_ms=0, sample_rate=0))
+        recorder.command(self.find_event(), False, 10.0)
+        querylog.finish(recorder)
+        self.assertEqual(self.db.slow_queries.count_documents({}), 0)
+
+        recorder = querylog.start(self.options(threshold_ms=0, max_per_request=3, max_entries=2))
+        for request_id in range(5):
+            recorder.command(self.find_event(request_id), False, float(request_id))
+        querylog.finish(recorder)
+        self.assertLessEqual(self.db.slow_queries.count_documents({}), 2)
+
+    def test_summary_command(self):
+        """Test the summary groups entries by shape, worst total first."""
+        recorder = querylog.start(self.options(threshold_ms=0))
+        for user_id, elapsed in ((1, 100.0), (2, 300.0)):
+            recorder.command(self.find_event(user_id=user_id), False, elapsed)
+        recorder.command(self.find_event(team_id=1), False, 250.0)
+        querylog.finish(recorder)
+
+        out = StringIO()
+        call_command('slow_queries', '--json', stdout=out)
+        rows = json.loads(out.getvalue())
+        self.assertEqual([(row['count'], row['total_ms'], row['max_ms']) for row in rows],
+                         [(2, 400.0, 300.0), (1, 250.0, 250.0)])
+        self.assertEqual(rows[0]['commands'][0]['body'], '{"filter": {"user_id": 2}}')
+
+    def test_migration_indexes_the_log(self):
+        """Test trimming by age and grouping by shape are served by indexes."""
+        self.migrate_mongo('0012_slow_query_indexes')
+        indexes = self.db.slow_queries.index_information()
+        self.assertEqual(indexes['at_-1']['key'], [('at', -1)])
+        self.assertIn('shape_id_1', indexes)
+
+
+class BenchmarkTest(TestCase):
+    """Test cases for the serializer and view micro-benchmarks."""
+
+    def test_benchmark_command_writes_results(self):
+        """Test every serializer and view action is measured and written as JSON."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_api', '--size', '50', '--repeat', '1', '--output', path, stdout=StringIO())
+            with open(path) as handle:
+                report = json.load(handle)
+        names = {result['name']: result for result in report['results']}
+        for serializer in ('User', 'Team', 'Activity', 'Leaderboard', 'Workout'):
+            self.assertIn(f'{serializer}Serializer.to_representation', names)
+            self.assertIn(f'{serializer}Serializer.is_valid', names)
+            self.assertIn(f'{serializer}ViewSet.retrieve', names)
+        self.assertEqual(names['ActivitySerializer.is_valid']['rows'], 50)
+        self.assertTrue(all(result['rows_per_second'] > 0 for result in report['results']))
+        self.assertEqual(report['size'], 50)
+
+    def test_only_filter(self):
+        """Test --only narrows the run to matching benchmarks."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'benchmark.json')
+            call_command('benchmark_api', '--size', '20', '--repeat', '1', '--only', 'Workout',
+                         '--output', path, stdout=StringIO())
+            with open(path) as handle:
+                names = [result['name'] for result in json.load(handle)['results']]
+        self.assertEqual(names, [
+            'WorkoutSerializer.to_representation', 'WorkoutSerializer.is_valid',
+            'WorkoutViewSet.list', 'WorkoutViewSet.retrieve',
+        ])
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+@override_settings(ROOT_URLCONF='octofit_tracker.asgi_urls')
+class AsyncReadViewTest(MongoStandInMixin, TestCase):
+    """Test cases for the async read views served under ASGI."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('api.async_views.get_shared_database', return_value=self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = AsyncClient()
+        self.db.users.insert_many([
+            {'id': 2, 'name': 'Bruce Wayne', 'email': 'batman@dc.com', 'team_id': 2,
+             'role': 'member', 'created_at': datetime(2026, 1, 2)},
+            {'id': 1, 'name': 'Tony Stark', 'email': 'iron.man@marvel.com', 'team_id': 1,
+             'role': 'team_leader', 'created_at': datetime(2026, 1, 1)},
+        ])
+        self.db.activities.insert_many([
+            {'id': i, 'user_id': 1 + i % 2, 'user_name': 'Tony Stark', 'team_id': 1,
+             'activity_type': 'Running', 'duration': 30, 'calories': 300, 'distance': 5.0,
+             'date': datetime(2026, 1, i), 'notes': ''}
+            for i in range(1, 6)
+        ])
+        self.db.leaderboard.insert_many([
+            {'id': 1, 'team_id': 1, 'team_name': 'Team Marvel', 'total_points': 500,
+             'total_activities': 3, 'rank': 2, 'updated_at': datetime(2026, 1, 3)},
+            {'id': 2, 'team_id': 2, 'team_name': 'Team DC', 'total_points': 900,
+             'total_activities': 5, 'rank': 1, 'updated_at': datetime(2026, 1, 3)},
+        ])
+
+    async def test_list_and_retrieve(self):
+        """Test lists keep the viewsets' ordering and retrieve answers 404 for unknown ids."""
+        response = await self.client.get('/api/users/')
+        self.assertEqual([user['name'] for user in response.json()], ['Tony Stark', 'Bruce Wayne'])
+        response = await self.client.get('/api/leaderboard/')
+        self.assertEqual([entry['team_name'] for entry in response.json()], ['Team DC', 'Team Marvel'])
+        response = await self.client.get('/api/users/2/')
+        self.assertEqual(response.json()['email'], 'batman@dc.com')
+        response = await self.client.get('/api/workouts/7/')
+        self.assertEqual((response.status_code, response.json()), (404, {'detail': 'Not found.'}))
+
+    async def test_activity_pagination_and_filters(self):
+        """Test activity pages and filters match the sync viewset's responses."""
+        response = await self.client.get('/api/activities/', {'page_size': 2, 'page': 2})
+        page = response.json()
+        self.assertEqual([activity['id'] for activity in page['results']], [3, 4])
+        self.assertEqual((page['count'], page['count_is_estimated']), (5, False))
+        self.assertEqual(page['next'], 'http://testserver/api/activities/?page=3&page_size=2')
+        self.assertEqual(page['previous'], 'http://testserver/api/activities/?page_size=2')
+        response = await self.client.get('/api/activities/', {'page': 9})
+        self.assertEqual(response.status_code, 404)
+        response = await self.client.get('/api/activities/', {'user_id': 2, 'limit': 1})
+        self.assertEqual([activity['id'] for activity in response.json()], [5])
+        response = await self.client.get('/api/activities/', {'user_id': 'abc'})
+        self.assertEqual(response.json(), {'user_id': 'Must be an integer.'})
+
+    async def test_throttle_checks_of_overlapping_requests_run_concurrently(self):
+        """Test a slow throttle check does not hold up other requests' checks."""
+        running, overlap, guard = [0], [0], threading.Lock()
+
+        def slow_allow_request(throttle, request, view):
+            with guard:
+                running[0] += 1
+                overlap[0] = max(overlap[0], running[0])
+            time.sleep(0.2)
+            with guard:
+                running[0] -= 1
+            return True
+
+        with mock.patch.object(TokenBucketThrottle, 'allow_request', slow_allow_request):
+            responses = await asyncio.gather(*(self.client.get(f'/api/users/{pk}/') for pk in (1, 2, 1)))
+        self.assertEqual([response.status_code for response in responses], [200, 200, 200])
+        self.assertEqual(overlap[0], 3)
+
+    async def test_writes_fall_through_to_viewsets(self):
+        """Test non-read methods on async routes are handled by the sync viewsets."""
+        response = await self.client.post(
+            '/api/workouts/', {
+                'title': 'Run', 'description': 'Easy', 'difficulty': 'beginner', 'duration': 20,
+                'activity_type': 'running', 'calories_estimate': 150, 'instructions': 'Go',
+            }, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['title'], 'Run')
+
+    def test_asgi_entry_point_mounts_async_urls(self):
+        """Test the ASGI application resolves through the async urlconf."""
+        from octofit_tracker.asgi import application
+
+        request, error = application.create_request(
+            {'type': 'http', 'method': 'GET', 'path': '/api/users/', 'query_string': b'', 'headers': []},
+            StringIO(),
+        )
+        self.assertIsNone(error)
+        self.assertEqual(request.urlconf, 'octofit_tracker.asgi_urls')
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class IdempotentIngestionTest(MongoStandInMixin, APITestCase):
+    """Test cases for deduplicated activity submissions."""
+
+    def setUp(self):
+        super().setUp()
+        self.team = Team.objects.create(name='Team Marvel')
+        self.user = User.objects.create(name='Tony Stark', email='iron.man@marvel.com', team_id=self.team.id)
+        self.workout = {
+            'user_id': self.user.id, 'activity_type': 'Running', 'duration': 30,
+            'calories': 300, 'distance': 5.0, 'date': '2026-10-01T10:00:00Z',
+        }
+
+    def test_resent_activity_returns_original(self):
+        """Test a resend, even with another UTC offset, is answered with the stored activity."""
+        first = self.client.post('/api/activities/', self.workout, format='json')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        resent = dict(self.workout, date='2026-10-01T12:00:00+02:00', notes='Retried')
+        second = self.client.post('/api/activities/', resent, format='json')
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(TeamStatsRepository(self.db).get(self.team.id)['total_calories'], 300)
+
+    def test_idempotency_key_reuse(self):
+        """Test a key replays its activity but is refused for a different workout."""
+        headers = {'HTTP_IDEMPOTENCY_KEY': 'watch-42'}
+        first = self.client.post('/api/activities/', self.workout, format='json', **headers)
+        replay = self.client.post('/api/activities/', self.workout, format='json', **headers)
+        self.assertEqual(replay.data['id'], first.data['id'])
+        other = dict(self.workout, duration=45)
+        response = self.client.post('/api/activities/', other, format='json', **headers)
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(Activity.objects.count(), 1)
+        self.assertEqual(self.db.idempotency_keys.count_documents({}), 1)
+
+    def test_bulk_submission_skips_duplicates(self):
+        """Test stored and repeated workouts in a batch are reported, not inserted."""
+        stored = self.client.post('/api/activities/', self.workout, format='json').data
+        yoga = dict(self.workout, activity_type='Yoga', distance=0, idempotency_key='watch-7')
+        response = self.client.post('/api/activities/bulk/', [self.workout, yoga, yoga], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['duplicates']), (1, 2))
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], ['duplicate', 'created', 'duplicate'])
+        self.assertEqual(results[0]['activity']['id'], stored['id'])
+        self.assertEqual(results[2]['activity']['id'], results[1]['activity']['id'])
+        self.assertEqual(Activity.objects.count(), 2)
+        response = self.client.post('/api/activities/bulk/', [yoga], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post('/api/activities/bulk/', self.workout, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_edit_into_duplicate_is_rejected(self):
+        """Test an update may not make one activity a copy of another."""
+        self.client.post('/api/activities/', self.workout, format='json')
+        other = self.client.post('/api/activities/', dict(self.workout, duration=45), format='json').data
+        response = self.client.patch(f'/api/activities/{other["id"]}/', {'duration': 30}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.patch(f'/api/activities/{other["id"]}/', {'duration': 50}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['content_hash'], other['content_hash'])
+
+    def test_backfill_migration_hashes_like_the_model(self):
+        """Test the hash frozen in migration 0005 matches the model's for stored workouts."""
+        frozen = import_module('api.migrations.0005_activity_content_hash').content_hash
+        fields = {'user_id': 1, 'activity_type': 'Running', 'duration': 30, 'distance': 5}
+        for date in (timezone.now(), datetime(2026, 2, 1, 7, 30, 0, 123456)):
+            self.assertEqual(frozen(date=date, **fields), activity_content_hash(date=date, **fields))
+
+
+@skipUnless(mongomock, 'mongomock is not installed')
+class LeaderboardRebuildTest(MongoStandInMixin, TestCase):
+    """Test cases for the sharded leaderboard rebuild."""
+
+    def setUp(self):
+        super().setUp()
+        self.teams = [Team.objects.create(name=f'Team {index}') for index in range(6)]
+        calories = [500, 200, 500, 0, 900, 200]
+        self.db.activities.insert_many([
+            {'id': index + 1, 'team_id': team.id, 'calories': points}
+            for index, (team, points) in enumerate(zip(self.teams, calories))
+        ] + [{'id': 99, 'team_id': 999, 'calories': 10000}])
+        # Compacted activities still count towards the first team.
+        self.db.activity_rollups.insert_one(
+            {'user_id': 1, 'team_id': self.teams[0].id, 'activity_count': 3, 'total_calories': 450}
+        )
+
+    def ranks(self):
+        return {doc['team_id']: (doc['total_points'], doc['rank']) for doc in self.db.leaderboard.find()}
+
+    def test_team_shards_cover_every_team(self):
+        """Test shards are disjoint id ranges covering all teams."""
+        self.assertEqual(team_shards([5, 1, 9, 3, 7], 2), [(1, 5), (7, 9)])
+        self.assertEqual(team_shards([4], 8), [(4, 4)])
+        self.assertEqual(team_shards([], 4), [])
+
+    def test_rebuild_ranks_all_teams_densely(self):
+        """Test points come from activities plus rollups and ties share a dense rank."""
+        self.db.leaderboard.insert_one({'id': 1, 'team_id': self.teams[0].id, 'team_name': 'Team 0', 'rank': 6})
+        self.assertEqual(rebuild_leaderboard(workers=1, db=self.db), (6, 1))
+        ids = [team.id for team in self.teams]
+        self.assertEqual(self.ranks()[ids[0]], (950, 1))
+        created = {entry.team_id: (entry.total_points, entry.rank) for entry in Leaderboard.objects.all()}
+        self.assertEqual(created, {
+            ids[1]: (200, 4), ids[2]: (500, 3), ids[3]: (0, 5), ids[4]: (900, 2), ids[5]: (200, 4),
+        })
+
+    @skipUnless(multiprocessing.get_start_method() == 'fork', 'process pool workers cannot see mongomock')
+    def test_process_pool_matches_single_process(self):
+        """Test shards aggregated by pool workers merge into the same ranking."""
+        Leaderboard.objects.all().delete()
+        with mock.patch('api.leaderboard.connect', return_value=self.db):
+            teams, shards = rebuild_leaderboard(workers=2)
+        self.assertEqual((teams, shards), (6, 6))
+        pooled = list(Leaderboard.objects.order_by('team_id').values_list('team_id', 'total_points', 'rank'))
+        Leaderboard.objects.all().delete()
+        rebuild_leaderboard(workers=1, db=self.db)
+        single = list(Leaderboard.objects.order_by('team_id').values_list('team_id', 'total_points', 'rank'))
+        self.assertEqual(pooled, single)
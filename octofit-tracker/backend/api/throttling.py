@@ -0,0 +1,74 @@
+"""Per-client token-bucket throttling with separate read and write budgets."""
+import time
+
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket per client and budget, kept in Django's cache.
+
+    Safe methods draw from the ``read`` rate and everything else from the
+    ``write`` rate (``DEFAULT_THROTTLE_RATES``). A rate of ``N/period`` is a
+    bucket of ``N`` tokens refilled continuously over ``period``, so bursts
+    up to ``N`` are allowed. Each request reads and writes one small cache
+    entry, unlike the request history kept by ``SimpleRateThrottle``.
+
+    The read-refill-write of a bucket holds a short per-bucket lock taken
+    with ``cache.add``, so concurrent requests from one client, on any
+    worker, cannot spend the same token. The lock expires on its own if a
+    worker dies holding it. A request that cannot take the lock within
+    ``LOCK_WAIT`` seconds is throttled.
+    """
+    LOCK_TIMEOUT = 2
+    LOCK_WAIT = 0.5
+    LOCK_POLL = 0.005
+
+    def __init__(self):
+        # The scope, and so the rate, is only known once the request arrives.
+        pass
+
+    def allow_request(self, request, view):
+        self.scope = 'read' if request.method in SAFE_METHODS else 'write'
+        self.rate = self.get_rate()
+        if self.rate is None:
+            return True
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        lock = f'{self.key}:lock'
+        deadline = time.monotonic() + self.LOCK_WAIT
+        while not self.cache.add(lock, 1, self.LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                self.tokens, self.refill = 0, self.num_requests / self.duration
+                return False
+            time.sleep(self.LOCK_POLL)
+        try:
+            return self.take_token()
+        finally:
+            self.cache.delete(lock)
+
+    def take_token(self):
+        now = self.timer()
+        tokens, updated = self.cache.get(self.key, (self.num_requests, now))
+        refill = self.num_requests / self.duration
+        tokens = min(self.num_requests, tokens + (now - updated) * refill)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self.tokens, self.refill = tokens, refill
+        # An idle bucket refills completely within one period, so it can expire then.
+        self.cache.set(self.key, (tokens, now), self.duration)
+        return allowed
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+    def wait(self):
+        return (1 - self.tokens) / self.refill
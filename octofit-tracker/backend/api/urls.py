@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, TeamViewSet, ActivityViewSet,
-    LeaderboardViewSet, WorkoutViewSet
+    LeaderboardViewSet, WorkoutViewSet, SearchViewSet, AnalyticsViewSet,
+    ChangesViewSet, DashboardViewSet,
 )
 
 router = DefaultRouter()
@@ -11,6 +12,10 @@ router.register(r'teams', TeamViewSet)
 router.register(r'activities', ActivityViewSet)
 router.register(r'leaderboard', LeaderboardViewSet)
 router.register(r'workouts', WorkoutViewSet)
+router.register(r'search', SearchViewSet, basename='search')
+router.register(r'analytics', AnalyticsViewSet, basename='analytics')
+router.register(r'changes', ChangesViewSet, basename='changes')
+router.register(r'dashboard', DashboardViewSet, basename='dashboard')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,27 +1,295 @@
-from rest_framework import viewsets
+import codecs
+import hashlib
+from collections import defaultdict
+from dataclasses import asdict
+from datetime import datetime, time, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
 from .models import User, Team, Activity, Leaderboard, Workout
+from .changes import (
+    DELETE, TRACKED_MODELS, UPSERT, ChangeLogRepository, TokenExpired, collapse
+)
+from .coalesce import coalesced
+from .dashboard import SECTIONS, load_dashboard
+from .idempotency import HEADER as IDEMPOTENCY_HEADER, MAX_KEY_LENGTH, KeyReused, ingest
+from .importers import CONTENT_TYPES, MAX_BATCH_SIZE, PARSERS, import_users
+from .pagination import StandardPagination, EstimatedCountPagination
+from .repositories import (
+    UserRepository, ActivityRepository, LeaderboardRepository, TeamStatsRepository,
+    UserStatsRepository,
+)
+from .search import indexes
+from .streaks import (
+    SCOPES, ActivityStreaks, StreakRepository, current_streak, day_number, iso_day, today
+)
 from .serializers import (
     UserSerializer, TeamSerializer, ActivitySerializer,
     LeaderboardSerializer, WorkoutSerializer
 )
 
 
+def int_param(request, name, default=None):
+    """Read an integer query parameter, rejecting anything non-numeric."""
+    value = request.query_params.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValidationError({name: 'Must be an integer.'})
+
+
+def date_param(request, name):
+    """Read an ISO date or datetime query parameter as an aware datetime."""
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = day and datetime.combine(day, time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: 'Must be an ISO 8601 date or datetime.'})
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment, dt_timezone.utc)
+
+
+def bounded_int_param(request, name, default, maximum):
+    """Read an integer query parameter that must lie in ``1..maximum``."""
+    value = int_param(request, name, default=default)
+    if not 1 <= value <= maximum:
+        raise ValidationError({name: f'Must be between 1 and {maximum}.'})
+    return value
+
+
+def filtered_limit(request):
+    """``?limit`` for filtered activity lists, which are not paginated: at most one full page."""
+    return bounded_int_param(request, 'limit', StandardPagination.max_page_size, StandardPagination.max_page_size)
+
+
+def idempotency_key(value, name='Idempotency-Key'):
+    if value in (None, ''):
+        return None
+    if not isinstance(value, str) or len(value) > MAX_KEY_LENGTH:
+        raise ValidationError({name: f'Must be a string of at most {MAX_KEY_LENGTH} characters.'})
+    return value
+
+
+def key_reused(exc):
+    return Response(
+        {'detail': f'Idempotency key {exc.key!r} was already used for a different activity.'},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+    )
+
+
+def user_stats_payload(user, summary):
+    by_type = sorted(
+        (breakdown for breakdown in summary['by_type'].values() if breakdown['activity_count'] > 0),
+        key=lambda breakdown: breakdown['activity_count'], reverse=True,
+    )
+    return {
+        'user_id': user.id,
+        'user_name': user.name,
+        'activity_count': summary['activity_count'],
+        'total_calories': summary['total_calories'],
+        'total_duration': summary['total_duration'],
+        'total_distance': round(summary['total_distance'], 2),
+        'by_type': [
+            dict(breakdown, total_distance=round(breakdown['total_distance'], 2)) for breakdown in by_type
+        ],
+        'personal_bests': summary['bests'],
+    }
+
+
+def streak_payload(document, day):
+    document = document or {}
+    return {
+        'current_streak': current_streak(document, day),
+        'longest_streak': document.get('longest', 0),
+        'active_days': document.get('active_days', 0),
+        'last_active': iso_day(document.get('last_end')),
+    }
+
+
 class UserViewSet(viewsets.ModelViewSet):
     """API endpoint for users."""
     queryset = User.objects.all()
     serializer_class = UserSerializer
 
+    def list(self, request, *args, **kwargs):
+        ids = request.query_params.get('ids')
+        if not ids:
+            return super().list(request, *args, **kwargs)
+        try:
+            user_ids = {int(user_id) for user_id in ids.split(',') if user_id}
+        except ValueError:
+            raise ValidationError({'ids': 'Must be a comma separated list of integers.'})
+        users = UserRepository().get_many(user_ids)
+        return Response(self.get_serializer(users, many=True).data)
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """Upsert users by email from a CSV or NDJSON body, streamed in batches."""
+        fmt = CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        if fmt is None:
+            raise ValidationError({'content_type': f'Must be one of {", ".join(CONTENT_TYPES)}.'})
+        batch_size = int_param(request, 'batch_size', 1000)
+        if not 1 <= batch_size <= MAX_BATCH_SIZE:
+            raise ValidationError({'batch_size': f'Must be between 1 and {MAX_BATCH_SIZE}.'})
+        lines = codecs.iterdecode(request.stream or [], 'utf-8')
+        report = import_users(PARSERS[fmt](lines), batch_size=batch_size)
+        return Response(asdict(report))
+
+    @action(detail=True)
+    def stats(self, request, pk=None):
+        """Lifetime totals, per-type breakdown and personal bests from the user's summary."""
+        user = self.get_object()
+        return Response(user_stats_payload(user, UserStatsRepository().get(user.id)))
+
+    @action(detail=True)
+    def streak(self, request, pk=None):
+        """Current and longest run of consecutive active days."""
+        user = self.get_object()
+        document = StreakRepository().get('user', user.id)
+        return Response(dict(user_id=user.id, **streak_payload(document, today())))
+
+
+def team_stats_payload(team, stats):
+    return {
+        'team_id': team['id'],
+        'team_name': team['name'],
+        'member_count': stats['member_count'],
+        'activity_count': stats['activity_count'],
+        'total_calories': stats['total_calories'],
+        'total_duration': stats['total_duration'],
+        'total_distance': round(stats['total_distance'], 2),
+    }
+
 
 class TeamViewSet(viewsets.ModelViewSet):
     """API endpoint for teams."""
     queryset = Team.objects.all()
     serializer_class = TeamSerializer
 
+    @action(detail=False, url_path='stats')
+    @coalesced
+    def all_stats(self, request):
+        """Member count and activity totals for every team."""
+        teams = list(Team.objects.values('id', 'name'))
+        stats = TeamStatsRepository().get_many([team['id'] for team in teams])
+        return Response([team_stats_payload(team, stats[team['id']]) for team in teams])
+
+    @action(detail=True)
+    @coalesced
+    def stats(self, request, pk=None):
+        """Member count and activity totals for one team."""
+        team = self.get_object()
+        stats = TeamStatsRepository().get(team.id)
+        return Response(team_stats_payload({'id': team.id, 'name': team.name}, stats))
+
+    @action(detail=True)
+    def streak(self, request, pk=None):
+        """Current and longest run of days on which any member was active."""
+        team = self.get_object()
+        document = StreakRepository().get('team', team.id)
+        return Response(dict(team_id=team.id, **streak_payload(document, today())))
+
+    @action(detail=True, serializer_class=UserSerializer, pagination_class=StandardPagination)
+    @coalesced
+    def members(self, request, pk=None):
+        """Paginated team roster; ``?include=totals`` embeds each member's activity totals."""
+        team = self.get_object()
+        page = self.paginate_queryset(User.objects.filter(team_id=team.id).order_by('id'))
+        members = self.get_serializer(page, many=True).data
+        if request.query_params.get('include') == 'totals':
+            totals = ActivityRepository().totals_for_users([member['id'] for member in members])
+            for member in members:
+                member['totals'] = totals[member['id']]
+        return self.get_paginated_response(members)
+
 
 class ActivityViewSet(viewsets.ModelViewSet):
     """API endpoint for activities."""
-    queryset = Activity.objects.all()
+    queryset = Activity.objects.order_by('id')
     serializer_class = ActivitySerializer
+    pagination_class = EstimatedCountPagination
+
+    def list(self, request, *args, **kwargs):
+        user_id = int_param(request, 'user_id')
+        start, end = date_param(request, 'start'), date_param(request, 'end')
+        if user_id is None and start is None and end is None:
+            return super().list(request, *args, **kwargs)
+        activities = ActivityRepository().find(
+            {} if user_id is None else {'user_id': user_id}, limit=filtered_limit(request), start=start, end=end,
+        )
+        return Response(self.get_serializer(activities, many=True).data)
+
+    def create(self, request, *args, **kwargs):
+        """Store a workout once; a resend, by ``Idempotency-Key`` or content, gets the stored one."""
+        key = idempotency_key(request.META.get(IDEMPOTENCY_HEADER))
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            [(activity, created)] = ingest([(serializer.validated_data, key)])
+        except KeyReused as exc:
+            return key_reused(exc)
+        response = Response(
+            self.get_serializer(activity).data, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
+        )
+        if not created:
+            response['Idempotent-Replayed'] = 'true'
+        return response
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Store a list of workouts, each with an optional ``idempotency_key``; duplicates are not stored."""
+        if not isinstance(request.data, list):
+            raise ValidationError({'non_field_errors': 'Expected a list of activities.'})
+        max_batch = settings.OCTOFIT_IDEMPOTENCY['max_batch']
+        if len(request.data) > max_batch:
+            raise ValidationError({'non_field_errors': f'At most {max_batch} activities per request.'})
+        keys = [
+            idempotency_key(item.get('idempotency_key'), 'idempotency_key') if isinstance(item, dict) else None
+            for item in request.data
+        ]
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        try:
+            results = ingest(list(zip(serializer.validated_data, keys)))
+        except KeyReused as exc:
+            return key_reused(exc)
+        created = sum(1 for activity, was_created in results if was_created)
+        return Response({
+            'created': created,
+            'duplicates': len(results) - created,
+            'results': [
+                {'status': 'created' if was_created else 'duplicate', 'activity': self.get_serializer(activity).data}
+                for activity, was_created in results
+            ],
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    @action(detail=False, url_path='active-users')
+    def active_users(self, request):
+        """Distinct active users per day over ``[start, end]`` (default: the last 30 days)."""
+        end = date_param(request, 'end')
+        end = day_number(end) if end else today()
+        start = date_param(request, 'start')
+        start = day_number(start) if start else end - 29
+        if not 0 <= end - start < 366:
+            raise ValidationError({'start': 'The range must cover between 1 and 366 days.'})
+        counts = ActivityStreaks().daily_active_users(start, end)
+        return Response([
+            {'day': iso_day(day), 'active_users': counts.get(day, 0)} for day in range(start, end + 1)
+        ])
 
 
 class LeaderboardViewSet(viewsets.ModelViewSet):
@@ -29,9 +297,177 @@ class LeaderboardViewSet(viewsets.ModelViewSet):
     queryset = Leaderboard.objects.all()
     serializer_class = LeaderboardSerializer
 
+    @action(detail=False)
+    @coalesced
+    def top(self, request):
+        """Top-N leaderboard entries, read straight from Mongo."""
+        limit = bounded_int_param(request, 'limit', 10, StandardPagination.max_page_size)
+        entries = LeaderboardRepository().top(limit)
+        return Response(self.get_serializer(entries, many=True).data)
+
+    @action(detail=False)
+    @coalesced
+    def streaks(self, request):
+        """Users or teams (``?scope=``) ranked by ``?by=current`` or ``longest`` streak."""
+        scope = request.query_params.get('scope', 'user')
+        by = request.query_params.get('by', 'current')
+        if scope not in SCOPES:
+            raise ValidationError({'scope': f'Must be one of {", ".join(SCOPES)}.'})
+        if by not in ('current', 'longest'):
+            raise ValidationError({'by': 'Must be current or longest.'})
+        day = today()
+        limit = bounded_int_param(request, 'limit', 10, StandardPagination.max_page_size)
+        ranking = StreakRepository().ranking(scope, by, limit, day)
+        model = User if scope == 'user' else Team
+        owner_ids = [doc['owner_id'] for doc in ranking]
+        names = dict(model.objects.filter(id__in=owner_ids).values_list('id', 'name'))
+        return Response([
+            dict(rank=rank, id=doc['owner_id'], name=names.get(doc['owner_id']), **streak_payload(doc, day))
+            for rank, doc in enumerate(ranking, start=1)
+        ])
+
 
 class WorkoutViewSet(viewsets.ModelViewSet):
     """API endpoint for workouts."""
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
 
+
+class AnalyticsViewSet(viewsets.ViewSet):
+    """p50/p90 and histograms of duration, calories and distance per team and activity type."""
+
+    def list(self, request):
+        # NumPy is only imported once analytics are first requested.
+        from .analytics import GROUP_FIELDS, TooManyGroups, activity_filter, distributions
+
+        group_by = request.query_params.get('group_by', 'both')
+        if group_by not in GROUP_FIELDS:
+            raise ValidationError({'group_by': f'Must be one of {", ".join(GROUP_FIELDS)}.'})
+        bins = int_param(request, 'bins', default=20)
+        if not 1 <= bins <= 200:
+            raise ValidationError({'bins': 'Must be between 1 and 200.'})
+        start, end = date_param(request, 'start'), date_param(request, 'end')
+        query = activity_filter(
+            start, end, int_param(request, 'team_id'), request.query_params.get('activity_type')
+        )
+        key = 'analytics:' + hashlib.md5(repr((sorted(query.items()), group_by, bins)).encode()).hexdigest()
+        groups = cache.get(key)
+        if groups is None:
+            try:
+                groups = distributions(
+                    query, group_by=group_by, bins=bins, max_group_bins=settings.OCTOFIT_ANALYTICS_MAX_GROUP_BINS
+                )
+            except TooManyGroups as exc:
+                raise ValidationError({'group_by': str(exc)})
+            cache.set(key, groups, settings.OCTOFIT_ANALYTICS_CACHE_SECONDS)
+        return Response({
+            'start': start, 'end': end, 'group_by': group_by, 'bins': bins, 'groups': groups,
+        })
+
+
+class ChangesViewSet(viewsets.ViewSet):
+    """Inserts, updates and deletes since a sync token, for incremental client reloads."""
+    serializers = {
+        'users': UserSerializer, 'teams': TeamSerializer, 'activities': ActivitySerializer,
+        'leaderboard': LeaderboardSerializer, 'workouts': WorkoutSerializer,
+    }
+
+    def list(self, request):
+        changes = ChangeLogRepository()
+        since = request.query_params.get('since')
+        if since is None:
+            # Take a token before loading the collections, then poll with it.
+            return Response({'changes': [], 'next': str(changes.current()), 'has_more': False})
+        try:
+            seq = int(since)
+        except ValueError:
+            raise ValidationError({'since': 'Not a valid sync token.'})
+        models = [name for name in request.query_params.get('models', '').split(',') if name]
+        unknown = set(models) - set(self.serializers)
+        if unknown:
+            raise ValidationError({'models': f'Unknown: {", ".join(sorted(unknown))}.'})
+        limit = bounded_int_param(request, 'limit', 500, 1000)
+        try:
+            entries, has_more = changes.since(
+                seq, models, limit, settle_seconds=settings.OCTOFIT_CHANGE_SETTLE_SECONDS
+            )
+        except TokenExpired:
+            return Response({'detail': 'Sync token expired; reload the collections.'}, status=status.HTTP_410_GONE)
+
+        latest = collapse(entries)
+        current = {}
+        upserted = defaultdict(list)
+        for entry in latest:
+            if entry['op'] == UPSERT:
+                upserted[entry['model']].append(entry['object_id'])
+        for name, ids in upserted.items():
+            for instance in TRACKED_MODELS[name].objects.filter(id__in=ids):
+                current[name, instance.id] = self.serializers[name](instance).data
+        results = []
+        for entry in latest:
+            data = current.get((entry['model'], entry['object_id']))
+            # Gone since it was logged; its tombstone is further along the log.
+            op = entry['op'] if data is not None else DELETE
+            results.append({
+                'seq': entry['seq'], 'model': entry['model'], 'id': entry['object_id'], 'op': op, 'data': data,
+            })
+        next_token = entries[-1]['seq'] if entries else seq
+        return Response({'changes': results, 'next': str(next_token), 'has_more': has_more})
+
+
+class DashboardViewSet(viewsets.ViewSet):
+    """Users with team names, teams, the leaderboard and the latest activities in one response."""
+
+    def list(self, request):
+        sections = request.query_params.get('sections')
+        sections = [section for section in sections.split(',') if section] if sections else list(SECTIONS)
+        unknown = set(sections) - set(SECTIONS)
+        if unknown:
+            raise ValidationError({'sections': f'Must be a comma separated subset of {", ".join(SECTIONS)}.'})
+        activity_limit = int_param(request, 'activities', default=10)
+        leaderboard_limit = int_param(request, 'leaderboard', default=10)
+        if not 1 <= activity_limit <= 500 or not 1 <= leaderboard_limit <= 500:
+            raise ValidationError({'limit': 'activities and leaderboard must be between 1 and 500.'})
+        results = load_dashboard(sections, activity_limit, leaderboard_limit)
+        names = results['team_names']
+        payload = {}
+        if 'users' in results:
+            payload['users'] = [
+                dict(data, team_name=names.get(data['team_id']))
+                for data in UserSerializer(results['users'], many=True).data
+            ]
+        if 'teams' in results:
+            payload['teams'] = TeamSerializer(results['teams'], many=True).data
+        if 'leaderboard' in results:
+            payload['leaderboard'] = LeaderboardSerializer(results['leaderboard'], many=True).data
+        if 'activities' in results:
+            payload['activities'] = [
+                dict(data, team_name=names.get(data['team_id']))
+                for data in ActivitySerializer(results['activities'], many=True).data
+            ]
+        return Response(payload)
+
+
+class SearchViewSet(viewsets.ViewSet):
+    """Full-text search over workouts and activity notes (prefix matching, ranked)."""
+    serializers = {
+        'workouts': WorkoutSerializer,
+        'activities': ActivitySerializer,
+    }
+
+    def list(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        kinds = request.query_params.get('type')
+        if kinds and kinds not in indexes:
+            raise ValidationError({'type': f'Must be one of: {", ".join(indexes)}.'})
+        limit = bounded_int_param(request, 'limit', 20, settings.OCTOFIT_SEARCH['max_results'])
+        results = {}
+        for kind in ([kinds] if kinds else indexes):
+            hits = indexes[kind].search_queryset(query, limit)
+            serializer = self.serializers[kind](hits, many=True)
+            results[kind] = [
+                dict(data, score=round(hit.search_score, 4)) for hit, data in zip(hits, serializer.data)
+            ]
+        return Response(results)
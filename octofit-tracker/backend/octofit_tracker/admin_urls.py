@@ -0,0 +1,10 @@
+"""Admin URLconf, imported only when an /admin/ URL is first resolved or reversed.
+
+Autodiscovery runs here rather than at startup (see INSTALLED_APPS), so API
+workers that never serve the admin never import the ModelAdmin modules.
+"""
+from django.contrib import admin
+
+admin.autodiscover()
+
+urlpatterns, app_name, _ = admin.site.urls
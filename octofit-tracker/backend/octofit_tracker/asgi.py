@@ -2,6 +2,8 @@
 ASGI config for octofit_tracker project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests are resolved through ``octofit_tracker.asgi_urls``, which serves
+the read-heavy API endpoints from async views.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
@@ -9,8 +11,22 @@ https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'octofit_tracker.settings')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+
+class OctofitASGIHandler(ASGIHandler):
+    """Django's ASGI handler with the async read views mounted."""
+
+    def create_request(self, scope, body_file):
+        request, error_response = super().create_request(scope, body_file)
+        if request is not None:
+            request.urlconf = 'octofit_tracker.asgi_urls'
+        return request, error_response
+
+
+application = OctofitASGIHandler()
@@ -0,0 +1,12 @@
+"""URL configuration for the ASGI entry point.
+
+The async read views in ``api.async_urls`` come first, then everything in
+``octofit_tracker.urls``; requests they do not match fall through to it.
+"""
+from django.urls import include, path
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    path('api/', include('api.async_urls')),
+] + sync_urlpatterns
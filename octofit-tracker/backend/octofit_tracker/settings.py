@@ -36,7 +36,9 @@ if codespace_name:
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    # SimpleAdminConfig skips admin autodiscovery at startup; it runs in
+    # octofit_tracker.admin_urls the first time an admin URL is needed.
+    'django.contrib.admin.apps.SimpleAdminConfig',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -51,11 +53,14 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.LoadSheddingMiddleware',
+    'api.middleware.SlowQueryMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,6 +100,15 @@ DATABASES = {
     }
 }
 
+# Throttle buckets, coalescing locks and cached aggregates are shared by all
+# workers through a cache collection in the same database (api.cache).
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache.MongoCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -137,6 +151,21 @@ STATIC_URL = 'static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Django REST Framework
+# The browsable API is only offered in development; production workers render
+# JSON and never load its templates and forms.
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+    ] + (['rest_framework.renderers.BrowsableAPIRenderer'] if DEBUG else []),
+    # Token buckets per client: reads and writes have separate budgets.
+    'DEFAULT_THROTTLE_CLASSES': ['api.throttling.TokenBucketThrottle'],
+    'DEFAULT_THROTTLE_RATES': {
+        'read': '1200/min',
+        'write': '300/min',
+    },
+}
+
 # CORS settings
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_METHODS = [
@@ -158,3 +187,113 @@ CORS_ALLOW_HEADERS = [
     'x-csrftoken',
     'x-requested-with',
 ]
+
+# Denormalized activity fields
+# Renames and team moves are copied onto a user's activities in batches,
+# off the request thread unless disabled.
+OCTOFIT_PROPAGATE_IN_BACKGROUND = True
+OCTOFIT_PROPAGATION_BATCH_SIZE = 500
+
+# Paginated lists over collections at least this large report an estimated
+# count from collection metadata instead of running an exact count().
+OCTOFIT_ESTIMATED_COUNT_THRESHOLD = 100000
+
+# Activities are also stored in monthly partitions (activities_YYYY_MM).
+# Date-bounded reads are routed to the overlapping partitions once
+# manage_partitions --backfill has run, and read the base collection before.
+OCTOFIT_ACTIVITY_PARTITIONING = True
+
+# Activities older than this are compacted into per-user daily rollups by
+# the compact_activities command.
+OCTOFIT_RETENTION_DAYS = 365
+
+# API requests are answered with 503 and Retry-After while this worker is
+# already serving max_in_flight of them, or while its average latency
+# (exponentially weighted) is above max_latency_ms.
+OCTOFIT_LOAD_SHEDDING = {
+    'path_prefix': '/api/',
+    'max_in_flight': 256,
+    'max_latency_ms': 5000,
+    'latency_weight': 0.1,
+    'retry_after': 5,
+}
+
+# Expensive aggregate reads (leaderboard, team stats and rosters) are
+# computed once for all concurrent identical requests, reused while fresh
+# and then served stale while one request recomputes them.
+OCTOFIT_COALESCING = {
+    'fresh_seconds': 5,
+    'stale_seconds': 30,
+    'lock_seconds': 30,
+    'wait_seconds': 10,
+    'poll_seconds': 0.05,
+}
+
+# Seconds between runs of the jobs in api.jobs, run by the run_scheduler
+# command. Each run is delayed by up to 10% jitter.
+OCTOFIT_SCHEDULED_JOBS = {
+    'recompute_leaderboard': 300,
+    'compact_activities': 24 * 60 * 60,
+    'create_partitions': 24 * 60 * 60,
+    'prune_changes': 24 * 60 * 60,
+    'prune_idempotency_keys': 24 * 60 * 60,
+}
+
+# Seconds an /api/analytics/ result is cached for the same filter and window.
+OCTOFIT_ANALYTICS_CACHE_SECONDS = 300
+# /api/analytics/ refuses filters whose groups times bins exceed this, since
+# every group and bin holds a fine histogram per metric in memory.
+OCTOFIT_ANALYTICS_MAX_GROUP_BINS = 10000
+
+# /api/changes/ keeps this many days of change log; older sync tokens get a
+# 410 and the client reloads. Entries younger than the settle window are
+# held back so a slower concurrent writer's earlier entry is never skipped.
+OCTOFIT_CHANGE_RETENTION_DAYS = 30
+OCTOFIT_CHANGE_SETTLE_SECONDS = 1
+
+# API requests from staff sessions with ?profile, or with an X-Octofit-Profile
+# header from the profile_token command, are run under cProfile. The newest
+# max_profiles runs are kept in directory as .prof files plus .txt summaries.
+OCTOFIT_PROFILING = {
+    'path_prefix': '/api/',
+    'directory': BASE_DIR / 'profiles',
+    'top_functions': 30,
+    'max_profiles': 50,
+    'token_max_age': 60 * 60,
+}
+
+# ORM statements (with the Mongo commands djongo translates them into) and
+# native Mongo commands of API requests that take at least threshold_ms are
+# sampled into the slow_queries collection, trimmed to max_entries. The
+# slow_queries command summarizes them by query shape.
+OCTOFIT_SLOW_QUERIES = {
+    'enabled': True,
+    'path_prefix': '/api/',
+    'threshold_ms': 100,
+    'sample_rate': 1.0,
+    'max_per_request': 50,
+    'max_entries': 10000,
+    'max_command_chars': 2000,
+}
+
+# Threads that run the pymongo reads awaited by the async views served
+# under ASGI (octofit_tracker.asgi_urls).
+OCTOFIT_ASYNC_READ_THREADS = 32
+
+# Activity submissions repeating a stored workout, by content hash or by
+# Idempotency-Key, get the stored activity back. Keys are remembered for
+# key_days; /api/activities/bulk/ takes at most max_batch activities.
+OCTOFIT_IDEMPOTENCY = {
+    'key_days': 7,
+    'max_batch': 1000,
+}
+
+# Search postings are capped per token: a token in more than max_postings
+# documents keeps only its highest-weighted postings, and a query prefix
+# expands to at most max_expansions tokens. Searches return at most
+# max_results hits, in the API and in the admin.
+OCTOFIT_SEARCH = {
+    'max_postings': 10000,
+    'max_expansions': 50,
+    'max_results': 100,
+}
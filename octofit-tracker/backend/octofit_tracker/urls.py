@@ -13,8 +13,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.contrib import admin
 from django.urls import path, include
+from django.urls.resolvers import RoutePattern, URLResolver
 from django.http import HttpResponse
 import os
 
@@ -157,6 +157,9 @@ def api_root(request):
 
 urlpatterns = [
     path('', api_root, name='api-root'),
-    path('admin/', admin.site.urls),
+    # Unlike include(), a URLResolver given a module path imports it on first use.
+    URLResolver(
+        RoutePattern('admin/'), 'octofit_tracker.admin_urls', app_name='admin', namespace='admin'
+    ),
     path('api/', include('api.urls')),
 ]
@@ -19,29 +19,21 @@ function Users() {
   const getApiUrl = (endpoint) => {
     const codespace = process.env.REACT_APP_CODESPACE_NAME;
     return codespace 
-      ? `https://${codespace}-8000.app.github.dev/api/users/`
-      : `http://localhost:8000/api/users/`;
+      ? `https://${codespace}-8000.app.github.dev/api/${endpoint}/`
+      : `http://localhost:8000/api/${endpoint}/`;
   };
 
   useEffect(() => {
     const fetchData = async () => {
       try {
-        // Fetch users
-        const usersResponse = await fetch(getApiUrl('users'));
-        if (!usersResponse.ok) {
-          throw new Error(`HTTP error! status: ${usersResponse.status}`);
-        }
-        const usersData = await usersResponse.json();
-        const processedUsers = usersData.results || usersData;
-        setUsers(Array.isArray(processedUsers) ? processedUsers : []);
-
-        // Fetch teams
-        const teamsResponse = await fetch(getApiUrl('teams'));
-        if (teamsResponse.ok) {
-          const teamsData = await teamsResponse.json();
-          const processedTeams = teamsData.results || teamsData;
-          setTeams(Array.isArray(processedTeams) ? processedTeams : []);
+        // Users and teams in one round trip; team names come resolved
+        const response = await fetch(`${getApiUrl('dashboard')}?sections=users,teams`);
+        if (!response.ok) {
+          throw new Error(`HTTP error! status: ${response.status}`);
         }
+        const data = await response.json();
+        setUsers(Array.isArray(data.users) ? data.users : []);
+        setTeams(Array.isArray(data.teams) ? data.teams : []);
 
         setLoading(false);
       } catch (error) {